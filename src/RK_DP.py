@@ -1,3 +1,4 @@
+import os
 import sys
 import warnings
 from timeit import default_timer as timer
@@ -5,252 +6,436 @@ from timeit import default_timer as timer
 import numpy as np
 from numpy.linalg import norm
 
-from functions import Acceleration, total_energy
+from forces import kernel_potential, kinetic
+from functions import StageBuffers, open_log
+from checkpoint import restore
+import jit
+from trajlog import LogWriter, AsyncLogSink
 
 TINY = sys.float_info.epsilon
 SAFETY = 0.9
 PGROW = -0.2
 PSHRINK = -0.25
 ERRCON = 1.89E-4
+PI_BETA = 0.04									# Integral gain of the PI controller (Hairer's DOPRI5)
+MIN_RATIO = 0.2									# Limits of the step-size ratio of the PI controller
+MAX_RATIO = 10.0
 # EPS = 1.0E-06									
 
 		
-def Derivatives(t, u, planets):
-	""" This function returns the derivatives of the elements of state 'u = [r1, v1, r2, v2, ...]'.
-	Returns velocity and acceleration 'diffs = [dr1dt, dv1dt, ...] = [v1, a1, v2, a2, ...]'.
+# Dormand-Prince (1980) tableau:
+DP_A = np.array([
+	[0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+	[1.0/5.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+	[3.0/40.0, 9.0/40.0, 0.0, 0.0, 0.0, 0.0],
+	[44.0/45.0, -56.0/15.0, 32.0/9.0, 0.0, 0.0, 0.0],
+	[19372.0/6561.0, -25360.0/2187.0, 64448.0/6561.0, -212.0/729.0, 0.0, 0.0],
+	[9017.0/3168.0, -355.0/33.0, 46732.0/5247.0, 49.0/176.0, -5103.0/18656.0, 0.0],
+	[35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0, -2187.0/6784.0, 11.0/84.0]])
+DP_C = np.array([0.0, 1.0/5.0, 3.0/10.0, 4.0/5.0, 8.0/9.0, 1.0, 1.0])
+DP_B = np.array([35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0, -2187.0/6784.0, 11.0/84.0, 0.0])					# Fifth order
+DP_BP = np.array([5179.0/57600.0, 0.0, 7571.0/16695.0, 393.0/640.0, -92097.0/339200.0, 187.0/2100.0, 1.0/40.0])	# Fourth order
+DP_E = DP_B - DP_BP																								# Error weights
+DP_D = np.array([-12715105075.0/11282082432.0, 0.0, 87487479700.0/32700410799.0, -10690763975.0/1880347072.0,	# Dense output
+	701980252875.0/199316789632.0, -1453857185.0/822651844.0, 69997945.0/29380423.0])
+
+		
+def Derivatives(t, u, planets, out = None, potential = False):
+	""" This function returns the derivatives of the elements of state 'u = [r1, ..., rN, v1, ..., vN]'.
+	Returns velocity and acceleration 'diffs = [dr1dt, ..., dv1dt, ...] = [v1, ..., vN, a1, ..., aN]',
+	written into 'out' if it is given.
+	A pure function of 'u': only the masses and the acceleration kernel are read from the System 'planets'.
+	Leading batch axes of 'u' (an Ensemble's state) are carried along.
+	With 'potential', the potential energy at 'u' is calculated in the same pass, and '(diffs, U)' is returned.
 	"""
 	N = len(planets)
-	z = 0
-	for i in range(N):
-		planets[i].pos = u[z]
-		planets[i].vel = u[z+1]		# u has 2N elements: r1, v1, r2, v2, etc.
-		z += 2
-		
-	Acceleration(N, planets)		# calculates dvdt = acc on N planets
-	diffs = []
 	
-	for i in range(N):
-		diffs.append(planets[i].vel)
-		diffs.append(planets[i].acc)
+	if out is None:
+		out = np.empty_like(u)
+	
+	out[..., :N, :] = u[..., N:, :]												# drdt = vel
+	if potential:
+		_, U = planets.kernel(planets.mass, u[..., :N, :], out = out[..., N:, :], potential = True,
+			n_massive = planets.n_massive)
+		return out, U
+	planets.kernel(planets.mass, u[..., :N, :], out = out[..., N:, :], n_massive = planets.n_massive)	# dvdt = acc on N planets
 	
-	return np.array(diffs)			# Return the staggered array of the differentials. 
+	return out			# Return the differentials, in the same layout as 'u'. 
 	
 	
-def RKDP(u, dudt, n, t, h, derivs, planets):
+def RKDP(u, dudt, n, t, h, derivs, planets, work = None, potential = False):
 	""" Given values for 'n' variables 'u[1,..n]' and their derivatives 'dudt[1..n]' known at 't',
 	this function takes one step of Runge-Kutta Dormand-Prince (RKDP) integration over an interval of 'h', 
 	and returns the incremented values as array 'unew[1,..n]'. 
 	Also returns an estimate of the local truncation error using the embedded fourth-order method.
 	The Coefficients are based on Dormand-Prince (1980).
+	The stages are kept in the preallocated buffers of 'work' (a StageBuffers with 7 stages),
+	and the returned arrays are its 'unew' and 'error' buffers.
+	The derivative at 'unew' is left in 'work.K[6]', to be reused as 'dudt' of the next step.
+	With 'potential', that evaluation also leaves the potential energy at 'unew' in 'planets.epot' (for logging).
 	"""
-	a21 = (1.0/5.0)
-	a31 = (3.0/40.0)
-	a32 = (9.0/40.0)
-	a41 = (44.0/45.0)
-	a42 = (-56.0/15.0)
-	a43 = (32.0/9.0)
-	a51 = (19372.0/6561.0)
-	a52 = (-25360.0/2187.0)
-	a53 = (64448.0/6561.0)
-	a54 = (-212.0/729.0)
-	a61 = (9017.0/3168.0)
-	a62 = (-355.0/33.0)
-	a63 = (46732.0/5247.0)
-	a64 = (49.0/176.0)
-	a65 = (-5103.0/18656.0)
-	a71 = (35.0/384.0)
-	a72 = (0.0)
-	a73 = (500.0/1113.0)
-	a74 = (125.0/192.0)
-	a75 = (-2187.0/6784.0)
-	a76 = (11.0/84.0)
- 
-	c2 = (1.0 / 5.0)
-	c3 = (3.0 / 10.0)
-	c4 = (4.0 / 5.0)
-	c5 = (8.0 / 9.0)
-	c6 = (1.0)
-	c7 = (1.0)
- 
-	b1 = (35.0/384.0)
-	b2 = (0.0)
-	b3 = (500.0/1113.0)
-	b4 = (125.0/192.0)
-	b5 = (-2187.0/6784.0)
-	b6 = (11.0/84.0)
-	b7 = (0.0)
- 
-	b1p = (5179.0/57600.0)
-	b2p = (0.0)
-	b3p = (7571.0/16695.0)
-	b4p = (393.0/640.0)
-	b5p = (-92097.0/339200.0)
-	b6p = (187.0/2100.0)
-	b7p = (1.0/40.0)
+	if work is None:
+		work = StageBuffers(n, 7)
+	K = work.K
 	
-	K2, K3, K4, K5, K6, K7 = [np.array([]) for _ in range(6)]	
-	utemp = [np.array([]) for _ in range(n)]
-	unew = [np.array([]) for _ in range(n)]					# Fifth order
-	unewp = [np.array([]) for _ in range(n)]					# Fourth order
-	error = [np.array([]) for _ in range(n)]
+	if dudt is not work.dudt:
+		np.copyto(work.dudt, dudt)									# First step
 	
-	for i in range(n):						# First step
-		utemp[i] = u[i] + h*a21*dudt[i]
-	K2 = derivs(t + c2*h, utemp, planets)	# Second step; Array!
+	for s in range(1, 6):											# Second to sixth step
+		work.combine(u, h, DP_A[s, :s], K[:s], work.utemp)
+		derivs(t + DP_C[s]*h, work.utemp, planets, out = K[s])
 	
-	for i in range(n):						
-		utemp[i] = u[i] + h*(a31*dudt[i] + a32*K2[i])
-	K3 = derivs(t + c3*h, utemp, planets)	# Third step
+	# The seventh stage is evaluated at the fifth order result itself ("first same as last"),
+	# so K7 is also the derivative at the start of the next step:
+	work.combine(u, h, DP_A[6, :6], K[:6], work.unew)				# Accumulate increments
+	if potential:
+		_, planets.epot = derivs(t + DP_C[6]*h, work.unew, planets, out = K[6], potential = True)	# Seventh step
+	else:
+		derivs(t + DP_C[6]*h, work.unew, planets, out = K[6])		# Seventh step
 	
-	for i in range(n):
-		utemp[i] = u[i] + h*(a41*dudt[i] + a42*K2[i] + a43*K3[i])
-	K4 = derivs(t + c4*h, utemp, planets)	# Fourth step
+	np.einsum('s,s...->...', DP_E, K, out = work.error)				# Difference of fifth and fourth order
+	work.error *= h
+	np.abs(work.error, out = work.error)
+		
+	return work.unew, work.error		# Returns an array of incremented values, and the errors of the values
+
+
+def dense_output(u0, u1, K, h, theta):
+	""" Continuous extension of an accepted RKDP step from 'u0' to 'u1' over 'h', with stages 'K':
+	returns the states at the fractions 'theta' (an array, 0 <= theta <= 1) of the step, as a (len(theta), n, 3) array.
+	The fractions 0 and 1 give 'u0' and 'u1' exactly.
+	Uses the already computed stages only, no extra derivative evaluations.
+	The fourth order interpolant is from Hairer, Norsett & Wanner: Solving Ordinary Differential Equations I (contd5).
+	"""
+	ydiff = u1 - u0
+	bspl = h*K[0] - ydiff
+	rc4 = ydiff - h*K[6] - bspl
+	rc5 = h * np.einsum('s,s...->...', DP_D, K)
 	
-	for i in range(n):
-		utemp[i] = u[i] + h*(a51*dudt[i] + a52*K2[i] + a53*K3[i] + a54*K4[i])
-	K5 = derivs(t + c5*h, utemp, planets)	# Fifth step
+	th = np.reshape(theta, (-1,) + (1,)*u0.ndim)
+	th1 = 1.0 - th
+	states = u0 + th*(ydiff + th1*(bspl + th*(rc4 + th1*rc5)))
+	return np.where(th == 1.0, u1, states)						# The end of the step exactly, not u0 + (u1 - u0)
+
+
+class NRController:
+	""" Step-size control of "Numerical Recipes": the new step-size depends on the error of the current trial only.
+	'reject' returns the step-size to retry a rejected trial with, 'accept' the step-size of the next step.
+	Counts the accepted and rejected trials of a run.
+	"""
+	name = 'NR'
 	
-	for i in range(n):
-		utemp[i] = u[i] + h*(a61*dudt[i] + a62*K2[i] + a63*K3[i] + a64*K4[i] + a65*K5[i])
-	K6 = derivs(t + c6*h, utemp, planets)	# Sixth step
+	def __init__(self):
+		self.accepted = 0
+		self.rejected = 0
+		
+	def reject(self, h, errmax):
+		self.rejected += 1
+		return max(SAFETY * h * errmax**PSHRINK, 0.1*h)			# Not more than a factor of 10
+		
+	def accept(self, h, errmax):
+		self.accepted += 1
+		if (errmax > ERRCON):
+			return SAFETY * h * errmax**PGROW
+		return 5.0 * h											# Maximum factor of 5 increase
+		
+	def stats(self):
+		""" Counts of the run: accepted and rejected trials, and force evaluations (6 per trial, and the first one).
+		"""
+		return {'controller': self.name, 'accepted': self.accepted, 'rejected': self.rejected,
+			'evaluations': 6 * (self.accepted + self.rejected) + 1}
+		
+	def checkpoint(self):
+		""" The counters (and the memory) of the controller, as fields of a checkpoint.
+		"""
+		return {'control_' + key: value for key, value in vars(self).items()}
+		
+	def restore(self, saved):
+		for key in vars(self):
+			setattr(self, key, saved['control_' + key].item())
+		
+		
+class PIController(NRController):
+	""" Proportional-integral (Gustafsson) step-size control, as in Hairer's DOPRI5:
+	the new step-size also depends on the error of the previous accepted step, which damps the oscillation
+	of the step-size between accepted and rejected trials (e.g. around close encounters).
+	The step-size ratio is kept within [MIN_RATIO, MAX_RATIO], and it does not grow right after a rejection.
+	"""
+	name = 'PI'
 	
-	for i in range(n):
-		utemp[i] = u[i] + h*(a71*dudt[i] + a73*K3[i] + a74*K4[i] + a75*K5[i] + a76*K6[i])
-	K7 = derivs(t + c7*h, utemp, planets)	# Seventh step
+	def __init__(self, beta = PI_BETA):
+		super().__init__()
+		self.beta = beta
+		self.alpha = 0.2 - 0.75*beta
+		self.errold = 1.0E-4
+		self.after_reject = False
+		
+	def reject(self, h, errmax):
+		self.rejected += 1
+		self.after_reject = True
+		return h * max(MIN_RATIO, SAFETY * errmax**-self.alpha)
+		
+	def accept(self, h, errmax):
+		self.accepted += 1
+		errmax = max(errmax, TINY)
+		ratio = min(MAX_RATIO, max(MIN_RATIO, SAFETY * errmax**-self.alpha * self.errold**self.beta))
+		if self.after_reject:
+			ratio = min(ratio, 1.0)
+		self.after_reject = False
+		self.errold = max(errmax, 1.0E-4)
+		return h * ratio
+		
+		
+CONTROLLERS = {'NR': NRController, 'PI': PIController}
+ERROR_MODES = ('all', 'sample', 'summary', 'off')
+HIST_EDGES = np.arange(-16.0, 3.0)				# Bin edges of the histograms of log10(scaled error)
+
+
+class ErrorLog:
+	""" Recorder of the scaled errors of the RKQS trials into 'errfile', in one of the 'ERROR_MODES':
+	'all' logs every trial, rejected ones included, 'sample' every 'every'-th accepted step,
+	'summary' keeps running per-variable maxima, means and histograms of log10(error) over every trial,
+	and writes them when closed, and 'off' records nothing (and writes no file).
+	A resumed run passes its checkpoint as 'saved': the log is truncated to its size at the checkpoint
+	and appended to, and the counters continue from there (the mode should be the same as before).
+	"""
 	
-	for i in range(n):						
-		unew[i] = u[i] + h*(b1*dudt[i] + b3*K3[i] + b4*K4[i] + b5*K5[i] + b6*K6[i])			# Accumulate increments
+	def __init__(self, errfile, planets, eps, compress = False, mode = 'all', every = 1, saved = None):
+		if mode not in ERROR_MODES:
+			raise ValueError('Unknown error logging mode: ' + str(mode) + '. Choose from ' + str(ERROR_MODES) + '.')
+		self.mode = mode
+		self.every = every
+		self.accepted = 0 if saved is None else saved['err_accepted'].item()
+		self.file = None
+		if mode == 'off':
+			return
+		
+		if saved is None:
+			self.file = open_errors(errfile, planets, eps, compress, mode, every)
+		else:
+			os.truncate(errfile, int(saved['err_offset']))
+			self.file = LogWriter(errfile, None, mode = 'a')
+		if mode == 'summary':
+			nvars = 2 * len(planets)
+			self.count = 0 if saved is None else saved['err_count'].item()
+			self.max = np.zeros(nvars) if saved is None else saved['err_max']
+			self.sum = np.zeros(nvars) if saved is None else saved['err_sum']
+			self.hist = np.zeros((len(HIST_EDGES) + 1, nvars)) if saved is None else saved['err_hist']
+			
+	def record(self, T, errors, accepted):
+		""" Records the scaled 'errors' of a trial at 'T', which was 'accepted' or not.
+		"""
+		if accepted:
+			self.accepted += 1
+		if self.mode == 'off' or (self.mode == 'sample' and not (accepted and self.accepted % self.every == 0)):
+			return
+		
+		N = len(errors) // 2
+		norms = norm(errors, axis = 1)
+		norms = np.stack((norms[:N], norms[N:]), axis = 1).ravel()		# r_err, v_err of every planet
+		if self.mode != 'summary':
+			self.file.append(T, norms)
+			return
 		
-		unewp[i] = u[i] + h*(b1p*dudt[i] + b3p*K3[i] + b4p*K4[i] + b5p*K5[i] + b6p*K6[i] + b7p*K7[i]) # Embedded fourth-order
+		self.count += 1
+		np.maximum(self.max, norms, out = self.max)
+		self.sum += norms
+		with np.errstate(divide = 'ignore'):
+			bins = np.searchsorted(HIST_EDGES, np.log10(norms))
+		self.hist[bins, np.arange(len(norms))] += 1
 		
-		error[i] = abs(unew[i] - unewp[i])	# Calculate error as difference
+	def checkpoint(self):
+		""" The size of the log and the counters of the recorder, as fields of a checkpoint.
+		"""
+		fields = {'err_offset': 0 if self.file is None else self.file.tell(), 'err_accepted': self.accepted}
+		if self.mode == 'summary':
+			fields.update(err_count = self.count, err_max = self.max, err_sum = self.sum, err_hist = self.hist)
+		return fields
 		
-	return unew, error						# Returns an array of incremented values, and the errors of the values
+	def close(self):
+		if self.file is None:
+			return
+		if self.mode == 'summary':
+			# Rows: 'Stat' = 0: maxima, 1: means, 2...: histogram bins (edges in the header)
+			stats = np.vstack((self.max, self.sum / max(self.count, 1), self.hist))
+			self.file.write_rows(np.column_stack((np.arange(len(stats)), stats)))
+		self.file.close()
 
 
-def RKQS(u, dudt, n, t, htry, uscale, derivs, eps, planets, err_file):
+def RKQS(u, dudt, n, t, htry, uscale, derivs, eps, planets, err_log, work = None, control = None, potential = False):
 	""" 
 	--- Runge-Kutta Quality-Controlled Step ---
 	Fifth order RKDP step with monitoring of local truncation error. 
 	'u' = state at the beginning of step, 'dudt' = starting derivatives, 'eps' = tolerance, array 'uscale' = scaling of error-checking,
 	Returns the new state 'unew', the next time value 'tnew', and the estimated next step-size 'hnext'.
+	The accepted state is copied into 'u' in place, so 'unew' is 'u' itself.
+	A rejected trial is retried from the same 'dudt', and after an accepted one 'work.K[6]'
+	holds the derivatives at 'unew' (FSAL), so neither costs an extra force evaluation.
+	'control' is the step-size controller of the run (an NRController by default), which counts the trials.
+	The scaled errors of the trials go to the ErrorLog 'err_log'.
+	With 'potential', 'planets.epot' is left holding the potential energy at 'unew', from its K7 evaluation.
 	Based on the code from "Numerical Recipes in C" (ISBN 0-521-43108-5)
 	"""
 	h = htry					# step-size to be tried
-	utry = np.array([])			# state to be tried
-	unew = np.array([])		
-	errors = np.array([])		# local truncation errors of variables
-	scalee = [np.array([]) for _ in range(n)]
+	
+	if work is None:
+		work = StageBuffers(n, 7)
+	if control is None:
+		control = NRController()
+	scalee = work.scaled		# scaled errors of variables
 	
 	while True:
 	
-		utry, errors = RKDP(u, dudt, n, t, h, derivs, planets)			# Take a step
+		utry, errors = RKDP(u, dudt, n, t, h, derivs, planets, work, potential)	# Take a step
 		
-		for i in range(n):												# Logging scaled errors
-			scalee[i] = (errors[i]/uscale[i])/eps
-		log_errors(err_file, t, n, planets, scalee)
+		np.divide(errors, uscale, out = scalee)							# Scaled errors
+		scalee /= eps
 		
-		errmax = 0.0											
-		for i in range(n):												# Determine largest error
-			errmax = max(errmax, abs(norm(errors[i]/uscale[i])))		
-		errmax /= eps
+		np.einsum('ij,ij->i', scalee, scalee, out = work.norms)		# Determine largest error
+		errmax = np.sqrt(work.norms.max())
+		err_log.record(t, scalee, errmax <= 1.0)						# Logging scaled errors
 		
 		if (errmax <= 1.0):
 			break												# Step succeeded! On to the next one.
 		
-		htemp = SAFETY * h * errmax**PSHRINK					# Error too large, reduce step-size
-		h = max(htemp, 0.1*h)									# Not more than a factor of 10
+		h = control.reject(h, errmax)							# Error too large, reduce step-size
 		tunder = t + h											# Stepping time
 		if (tunder == t): warnings.warn('Stepsize underflow in RKQS!')
 		
 	# After a successful step:
-	if (errmax > ERRCON):
-		hnext = SAFETY * h * errmax**PGROW
-	else:
-		hnext = 5.0 * h											# Maximum factor of 5 increase
+	hnext = control.accept(h, errmax)
 	hdid = h
 	tnew = t + h
-	unew = utry
+	np.copyto(u, utry)
+	unew = u
 	
 	return unew, tnew, hnext, hdid, errmax
 		
 		
-def RungeKutta(Ttot, planets, dtstart, eps, filename, errfile):
+def RungeKutta(Ttot, planets, dtstart, eps, filename, errfile, compress = False, background = False, t_out = None,
+		control = None, error_mode = 'all', error_every = 1, checkpoint = None, resume = False):
+	""" Integrates 'planets' over 'Ttot' days with quality-controlled RKDP steps of tolerance 'eps',
+	starting with a 'dtstart' step-size, logging into 'filename' and the trial errors into 'errfile'.
+	By default every accepted step is logged. If an array of output times 't_out' is given, the rows are logged
+	at those times instead, interpolated with the dense output of the steps containing them,
+	so the step-sizes are not constrained by the output grid. Returns the CPU time of the integration.
+	'control' is the step-size controller (an NRController by default); its counters hold the trials of the run.
+	'error_mode' and 'error_every' set how the trial errors are recorded, see ErrorLog.
+	With a Checkpointer 'checkpoint', the run is checkpointed periodically and at its end, together with
+	its step-size, its controller and its error recorder. With 'resume', it continues from its checkpoint
+	(if there is one of the same run, see Checkpointer.load), appending to its logs, e.g. to extend a finished run
+	to a longer 'Ttot'.
+	The returned CPU time includes the time of the run before the checkpoint.
+	"""
+	if control is None:
+		control = NRController()
 	
-	dat_file_RK = open(filename, 'w')
-	err_file = open(errfile,'w')
-	h = dtstart
-	T = 0
-	step = 0
+	saved = checkpoint.load(Ttot) if resume and checkpoint is not None else None
+	if saved is None:
+		dat_file_RK = open_log(filename, planets, 'RKDP', eps, ['StepSize', 'Error'], compress, background)
+		err_log = ErrorLog(errfile, planets, eps, compress, error_mode, error_every)
+		h = dtstart
+		T = 0
+		step = 0
+		cpu = 0.0
+	else:
+		T, step, cpu = restore(saved, planets, [filename])
+		h = saved['h'].item()
+		control.restore(saved)
+		dat_file_RK = open_log(filename, planets, 'RKDP', eps, ['StepSize', 'Error'], compress, background, mode = 'a')
+		err_log = ErrorLog(errfile, planets, eps, compress, error_mode, error_every, saved)
 	N = len(planets)
 	nodes = (2*N)					# number of ODES
 
-	u = []							# Creating the state-vector
-	for i in range(N):		
-		u.append(planets[i].pos)
-		u.append(planets[i].vel)
-	u = np.array(u)
+	u = planets.state				# The state-vector, shared with the planets
 
-	uscale = [np.array([]) for _ in range(nodes)]
-	log_RK(dat_file_RK, step, T, h, 0, N, planets)							# Initial logging
+	work = StageBuffers(nodes, 7, compiled = planets.kernel is jit.acceleration)
+	uscale = work.uscale
+	if saved is None:
+		log_RK(dat_file_RK, step, T, h, 0, N, planets)						# Initial logging
+	
+	if t_out is not None:
+		t_out = np.asarray(t_out, dtype = float)
+		iout = np.searchsorted(t_out, T, side = 'right')					# Next output time
 	
 	start = timer()
 	
-	while (T < Ttot):
+	dudt = Derivatives(T, u, planets, out = work.dudt)					# Starting diffs
 	
-		dudt = Derivatives(T, u, planets)									# Starting diffs
+	while (T < Ttot):
 		
-		for i in range(nodes):
-			uscale[i] = abs(u[i]) + abs(dudt[i] * h) + TINY				# Scaling for monitoring accuracy
+		np.abs(dudt, out = uscale)										# Scaling for monitoring accuracy
+		uscale *= h
+		uscale += np.abs(u, out = work.utemp)
+		uscale += TINY
 		
 		if ((T + h - Ttot) * (T + h) > 0.0):								# If step-size overshoots, decrease.
 			h = Ttot - T
+		
+		Told = T
+		if t_out is not None:
+			np.copyto(work.uold, u)
 			
 		# Take a QC step:	
-		u, T, h, hdid, errmax = RKQS(u, dudt, nodes, T, h, uscale, Derivatives, eps, planets, err_file) 
+		u, T, h, hdid, errmax = RKQS(u, dudt, nodes, T, h, uscale, Derivatives, eps, planets, err_log, work, control,
+			potential = t_out is None)
 		step += 1
 		
-		log_RK(dat_file_RK, step, T, hdid, errmax, N, planets)				# Log data
+		if t_out is None:
+			log_RK(dat_file_RK, step, T, hdid, errmax, N, planets, epot = planets.epot)	# Log data, with the potential from K7
+		else:
+			stop = np.searchsorted(t_out, T, side = 'right')
+			if stop > iout:													# Log data at the output times of the step
+				states = dense_output(work.uold, u, work.K, hdid, (t_out[iout:stop] - Told) / hdid)
+				for t, state in zip(t_out[iout:stop], states):
+					log_RK(dat_file_RK, step, t, hdid, errmax, N, planets, state)
+				iout = stop
+		
+		np.copyto(dudt, work.K[6])											# FSAL: K7 is the next starting diffs
+		
+		if checkpoint is not None and checkpoint.due():
+			checkpoint.save(u, T, step, cpu + timer() - start, [dat_file_RK], h = h, **control.checkpoint(),
+				**err_log.checkpoint())
 	
 	end = timer()
 	
+	if checkpoint is not None:
+		checkpoint.save(u, T, step, cpu + end - start, [dat_file_RK], h = h, **control.checkpoint(), **err_log.checkpoint())
 	dat_file_RK.close()
-	err_file.close()
+	err_log.close()
 	
-	return(end-start)
+	return(cpu + end - start)
 	
 
-def log_RK(file, step, T, hsize, err, N, planets):
+def log_RK(file, step, T, hsize, err, N, planets, state = None, epot = None):
 	""" This function logs the current Step, time T, Total energy of the system,
 	StepSize, Error, and the x,y,z coordinates of all the objects.
+	If 'state' is given (e.g. an interpolated one), it is logged instead of the planets' state.
+	'epot' is the potential energy of the logged state, if the force evaluation already calculated it.
 	"""
-	Etot = total_energy(N, planets)
+	if state is None:
+		state = planets.state
 	
-	if T == 0:
-		file.write('Step T Etot StepSize Error ')
-		for i in range(N):
-			file.write(planets[i].name + 'X ' + planets[i].name + 'Y ' + planets[i].name + 'Z ')
-		file.write('\n' + str(step) + ' ' + str(T) + ' ' + str(Etot) + ' ' + str(hsize) + ' ' + str(err) + ' ')
-		for i in range(N):
-			for j in range(3):
-				file.write(str(planets[i].pos[j]) + ' ')
-	else:
-		file.write('\n' + str(step) + ' ' + str(T) + ' ' + str(Etot) + ' ' + str(hsize) + ' ' + str(err) + ' ')
-		for i in range(N):
-			for j in range(3):
-				file.write(str(planets[i].pos[j]) + ' ')
-				
-				
-def log_errors(file, T, nodes, planets, errors):
-	""" This function logs the errors of the RKQS step.
+	if isinstance(file, AsyncLogSink):
+		file.append(step, T, np.nan if epot is None else epot, hsize, err, state)	# Energy is derived in the background
+		return
+	
+	Nm = planets.n_massive
+	U = kernel_potential(planets.kernel, planets.mass, state[:N], Nm) if epot is None else epot
+	Etot = kinetic(planets.mass[:Nm], state[N:N + Nm]) - U
+	file.append(step, T, Etot, hsize, err, state[:N])
+	
+	
+def open_errors(errfile, planets, eps, compress = False, mode = 'all', every = 1):
+	""" Opens the binary log of the scaled errors of the RKQS steps:
+	the time T, and the norm of the position and velocity error of every planet.
+	The 'mode' of the ErrorLog is kept in the header; a summary log has a 'Stat' column instead of T.
 	"""
-	if T == 0:
-		file.write('T ')
-		for i in range(int(nodes/2)):
-			file.write(planets[i].name+'_r_err '+planets[i].name+'_v_err ')
-		file.write('\n')
-	else:
-		file.write(str(T) + ' ')
-		for i in range(nodes):
-			file.write(str(norm(errors[i]))+' ')
-		file.write('\n')
+	columns = ['Stat' if mode == 'summary' else 'T']
+	for planet in planets:
+		columns += [planet.name + '_r_err', planet.name + '_v_err']
+	meta = {'bodies': [planet.name for planet in planets], 'method': 'RKDP', 'step': eps, 'mode': mode, 'every': every}
+	if mode == 'summary':
+		meta['edges'] = HIST_EDGES.tolist()
+	
+	return LogWriter(errfile, columns, meta, compress)
@@ -0,0 +1,158 @@
+"""
+Accuracy of the runs against a reference trajectory: the position error of every body vs. time,
+its norms, and the Pareto front of the error vs. the CPU time of the runs, i.e. the cheapest run
+reaching a given orbit accuracy.
+
+The reference is either the log of a (more accurate) run, 'LogReference', or the JPL ephemerides of the bodies,
+'EphemerisReference' (see 'ephemeris'). The ephemerides hold the velocities as well, so they are interpolated
+to the T grid of every run with cubic Hermite interpolation. The logs only hold positions, and the finite difference
+velocities of a logged reference would make that interpolation first order, swamping the errors of the runs:
+a logged reference is only compared at its own epochs (e.g. RKDP with dense output on the runs' output grid).
+Errors are NaN for the bodies and times the reference does not cover.
+"""
+import os
+import warnings
+from glob import iglob
+
+import numpy as np
+import pandas as pd
+
+from ephemeris import EphemerisStore, HORIZONS_IDS, JD_START, hermite
+from trajlog import read_log, log_name
+
+NORMS = ('max', 'rms', 'final')			# Norms of the position error time series [AU]
+EPOCH_TOL = 1.0E-9						# Relative tolerance of matching the epochs of a run and of a logged reference
+
+
+def log_positions(path):
+	""" Times, body names and (len(T), bodies, 3) positions of the log at 'path'.
+	"""
+	dataframe, header = read_log(path)
+	names = header.get('bodies') or [column[:-1] for column in dataframe.columns
+		if column.endswith('X') and column[:-1] + 'Y' in dataframe.columns]
+	columns = [name + axis for name in names for axis in 'XYZ']
+	pos = dataframe[columns].values.reshape(len(dataframe), len(names), 3)
+	return dataframe['T'].values, list(names), pos
+
+
+class LogReference:
+	""" Reference trajectory from the log of a run at 'path' (e.g. RKDP with a tight tolerance and dense output).
+	It is only compared at the epochs it has logged: the times of a run in its span that it has not logged
+	get NaN positions, with a warning, so the two should be logged on a common grid.
+	"""
+
+	def __init__(self, path):
+		self.path = os.path.abspath(path)
+		self.T, self.names, self.pos = log_positions(path)
+
+	def positions(self, T, names):
+		""" Positions of the bodies 'names' at the times 'T', as a (len(T), len(names), 3) array.
+		"""
+		T = np.asarray(T, dtype = float)
+		out = np.full((len(T), len(names), 3), np.nan)
+		right = np.clip(np.searchsorted(self.T, T), 1, len(self.T) - 1)
+		i = np.where(np.abs(self.T[right - 1] - T) <= np.abs(self.T[right] - T), right - 1, right)	# Nearest epoch
+		shared = np.abs(self.T[i] - T) <= EPOCH_TOL * np.maximum(1.0, np.abs(T))
+		inside = (T >= self.T[0]) & (T <= self.T[-1])
+		missing = np.count_nonzero(inside & ~shared)
+		if missing:
+			warnings.warn('{} of the {} epochs within the reference {} are not logged by it, and are left out. '
+				'Log the reference on the output grid of the runs.'.format(missing, np.count_nonzero(inside), self.path))
+
+		known = [k for k, name in enumerate(names) if name in self.names]
+		rows = [self.names.index(names[k]) for k in known]
+		out[np.ix_(np.flatnonzero(shared), known)] = self.pos[i[shared]][:, rows]
+		return out
+
+
+class EphemerisReference:
+	""" Reference trajectory from the JPL ephemerides in the EphemerisStore 'store'; the run's T = 0 is 'jd_start'.
+	By default only the stored span of the ephemerides is used (e.g. what the orbit plots have fetched), so rendering
+	needs no network. With 'fetch', the missing days are queried; if that fails, it is not tried again for the body.
+	"""
+
+	def __init__(self, store = None, jd_start = JD_START, fetch = False):
+		self.store = store or EphemerisStore()
+		self.jd_start = jd_start
+		self.fetch = fetch
+		self.failed = set()
+
+	def positions(self, T, names):
+		out = np.full((len(T), len(names), 3), np.nan)
+		epochs = self.jd_start + np.asarray(T, dtype = float)
+		for k, name in enumerate(names):
+			if name not in HORIZONS_IDS:
+				continue
+			body = HORIZONS_IDS[name]
+			if self.fetch and body not in self.failed:
+				try:
+					self.store.ensure(body, epochs.min(), epochs.max())
+				except Exception:
+					self.failed.add(body)
+					print('Something went wrong with the query of ' + name + '. Using previously downloaded HORIZONS data.')
+			jd, states = self.store.table(body)
+			if len(jd) < 2:
+				continue
+			inside = (epochs >= jd[0]) & (epochs <= jd[-1])
+			out[inside, k] = hermite(jd, states, epochs[inside])[:, :3]
+		return out
+
+
+def position_errors(path, reference):
+	""" Position errors [AU] of the bodies of the log at 'path' vs. the 'reference'.
+	Returns the times, the body names, and the (len(T), bodies) array of the errors.
+	"""
+	T, names, pos = log_positions(path)
+	diff = pos - reference.positions(T, names)
+	return T, names, np.sqrt(np.einsum('tbk,tbk->tb', diff, diff))
+
+
+def error_norms(errors):
+	""" The NORMS of every column of the (len(T), bodies) 'errors', over the times covered by the reference:
+	the largest, the root mean square, and the last error (NaN for the bodies without a reference).
+	"""
+	covered = np.isfinite(errors)
+	last = len(errors) - 1 - np.argmax(covered[::-1], axis = 0)
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', category = RuntimeWarning)			# Bodies without a reference
+		return {'max': np.nanmax(errors, axis = 0), 'rms': np.sqrt(np.nanmean(errors**2, axis = 0)),
+			'final': np.where(covered.any(axis = 0), errors[last, np.arange(errors.shape[1])], np.nan)}
+
+
+def accuracy_table(path, reference, df_CPU = None):
+	""" Error norms of every body of every log matching 'path' (a glob pattern) vs. the 'reference',
+	as a dataframe with the columns Name, Method, Step, Body, the NORMS, and the CPU time from 'df_CPU' (CPUlogs).
+	The log of a LogReference itself is left out.
+	"""
+	rows = []
+	for patho in sorted(iglob(path)):
+		if os.path.abspath(patho) == getattr(reference, 'path', None):
+			continue
+		name = log_name(patho)
+		T, names, errors = position_errors(patho, reference)
+		norms = error_norms(errors)
+		for k, body in enumerate(names):
+			rows.append([name, name[:name.rfind('_')], name[name.rfind('_') + 1:], body] + [norms[n][k] for n in NORMS])
+
+	table = pd.DataFrame(rows, columns = ['Name', 'Method', 'Step', 'Body'] + list(NORMS))
+	if df_CPU is not None:
+		table = table.merge(df_CPU[['Name', 'CPU']].drop_duplicates('Name', keep = 'last'), on = 'Name', how = 'left')
+	return table
+
+
+def pareto(table, body, norm = 'max'):
+	""" Pareto front of the runs in 'table' (see accuracy_table) for 'body': the runs, ordered by CPU time,
+	whose error 'norm' is smaller than that of every cheaper run.
+	"""
+	runs = table[table['Body'] == body].dropna(subset = [norm, 'CPU']).sort_values(['CPU', norm])
+	errors = runs[norm].values
+	best = np.minimum.accumulate(np.concatenate(([np.inf], errors[:-1])))
+	return runs[errors < best]
+
+
+def cheapest(table, body, target, norm = 'max'):
+	""" The cheapest run of 'table' whose error 'norm' for 'body' is at most 'target' [AU] (a row), or None.
+	"""
+	front = pareto(table, body, norm)
+	hits = front[front[norm] <= target]
+	return hits.iloc[0] if len(hits) else None
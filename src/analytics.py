@@ -0,0 +1,82 @@
+"""
+Energy analytics of the logged runs: the relative change of the total energy, its change per logged step,
+and the energy drift (the slope of the relative change vs. time), as vectorized operations on the Etot column.
+
+The results of every log are cached on disk in 'CACHE_DIR', keyed by the path, size and modification time
+of the log (and the version of this module), so re-rendering the plots of unchanged runs does not
+even read their logs again. A log that is rewritten or appended to gets a new key.
+"""
+import hashlib
+import os
+from glob import iglob
+from os import sep
+
+import numpy as np
+
+from checkpoint import save, load
+from trajlog import read_log, log_name
+
+CACHE_DIR = '.' + sep + 'logs' + sep + 'analytics' + sep
+VERSION = 1								# Bump to invalidate the cached results
+
+
+def energy_change(Etot):
+	""" Relative change of the total energy since the start: -(E - E0) / E0.
+	"""
+	Etot = np.asarray(Etot, dtype = float)
+	return -(Etot - Etot[0]) / Etot[0]
+
+
+def energy_change_per_step(Etot):
+	""" Change of the total energy between consecutive rows in percent, -(E[j] - E[j-1]) / E[j-1] * 100,
+	in the row j-1 (the last row is NaN).
+	"""
+	Etot = np.asarray(Etot, dtype = float)
+	change = np.full(len(Etot), np.nan)
+	change[:-1] = -100.0 * np.diff(Etot) / Etot[:-1]
+	return change
+
+
+def drift(T, change):
+	""" Energy drift: the absolute slope of the least squares line of 'change' vs. 'T'.
+	"""
+	T = np.asarray(T, dtype = float)
+	if len(T) < 2:
+		return np.nan
+	dT = T - T.mean()
+	return abs(np.dot(dT, change - change.mean()) / np.dot(dT, dT))
+
+
+def cache_key(path):
+	""" Key of a log in the cache: a hash of its absolute path, size and modification time.
+	"""
+	status = os.stat(path)
+	identity = '{}:{}:{}:{}'.format(os.path.abspath(path), status.st_size, status.st_mtime_ns, VERSION)
+	return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def energy_analytics(path, cache_dir = CACHE_DIR):
+	""" Energy analytics of the log at 'path': a dictionary of the arrays T, percTot (see energy_change)
+	and Ediff (see energy_change_per_step), and the drift 'slope'. Taken from the cache, if the log is unchanged.
+	"""
+	cached = cache_dir + cache_key(path) + '.npz'
+	results = load(cached)
+	if results is not None:
+		results['slope'] = results['slope'].item()
+		return results
+
+	dataframe, header = read_log(path)
+	T = dataframe['T'].values
+	percTot = energy_change(dataframe['Etot'].values)
+	results = {'T': T, 'percTot': percTot, 'Ediff': energy_change_per_step(dataframe['Etot'].values),
+		'slope': drift(T, percTot)}
+
+	os.makedirs(cache_dir, exist_ok = True)
+	save(cached, **results)
+	return results
+
+
+def path_to_analytics(path, cache_dir = CACHE_DIR):
+	""" Energy analytics of every log matching 'path' (a glob pattern), by the names of the runs.
+	"""
+	return {log_name(patho): energy_analytics(patho, cache_dir) for patho in iglob(path)}
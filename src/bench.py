@@ -0,0 +1,314 @@
+"""
+Microbenchmarks of the hot paths of the integrators: Acceleration, Derivatives, one RKDP step, RKQS,
+total_energy and log_data, timed on their own over a range of body counts, timesteps and tolerances.
+
+Every case is warmed up first, then timed in 'REPEATS' repeats of 'number' calls each, 'number' being
+calibrated so a repeat takes at least 'MIN_TIME'; the summary statistics are of the time per call.
+The results are written as JSON ('RESULTS_FILE'), and compared against a stored baseline ('BASELINE_FILE'),
+e.g. of the previous version of the code, giving the speedup of every case.
+
+Systems of up to the 9 bodies of the initial conditions are their first N bodies; larger ones add massive
+asteroids on circular orbits, so every body takes part in the force evaluation.
+
+'crossover' compares one force evaluation of the direct sum and of the tree code (see 'octree') on large systems,
+with the median relative error of the tree code's accelerations, to find the N above which the tree pays off.
+
+Run from the root folder of the repo (as the notebook does), e.g.
+	python src/bench.py --quick
+	python src/bench.py --save-baseline
+	python src/bench.py --kernels= --crossover
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from os import sep
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+import functions as fu
+from functions import Planet, System, Acceleration, StageBuffers, total_energy, log_data
+from forces import G, kernel
+from RK_DP import Derivatives, RKDP, RKQS, NRController, ErrorLog, TINY
+from sweep import INIT_FILE, LOG_DIR, code_version
+
+RESULTS_FILE = LOG_DIR + 'bench.json'
+BASELINE_FILE = LOG_DIR + 'bench_baseline.json'
+KERNELS = ('Acceleration', 'Derivatives', 'RKDP', 'RKQS', 'total_energy', 'log_data')
+BODY_COUNTS = (5, 9, 64, 256)			# N of the benchmarked systems
+TIMESTEPS = (1.0, 10.0)					# Step-sizes of the RKDP step [days]
+TOLERANCES = (1.0E-06, 1.0E-10)			# Tolerances of the RKQS step
+BACKEND = 'direct'						# Force kernel, see 'forces.kernel'
+WARMUP = 3								# Untimed repeats before the timing
+REPEATS = 15							# Timed repeats of every case
+MIN_TIME = 0.01							# Shortest time of a repeat [s]
+THRESHOLD = 0.10						# Relative change of the median counted as a speedup or regression
+CROSSOVER_COUNTS = (1000, 2000, 5000, 10000, 20000)	# N of the direct sum vs. tree code comparison
+THETAS = (0.3, 0.5, 0.8)				# Opening angles of the tree code in the comparison
+CROSSOVER_REPEATS = 3					# Timed repeats of the (slow) evaluations at large N
+ASTEROID_MASS = 1.0E+20					# [kg]
+SEED = 42
+
+
+def bench_system(N, backend = BACKEND, seed = SEED):
+	""" A System of 'N' bodies: the first N of the initial conditions, and asteroids beyond those,
+	on circular orbits between 2 and 30 AU around the Sun, with inclinations of up to 5 degrees.
+	"""
+	planets = list(fu.SolarSystem_init(INIT_FILE, True, True))[:N]
+	sun = planets[0]
+	rng = np.random.default_rng(seed)
+	for k in range(N - len(planets)):
+		r = rng.uniform(2.0, 30.0)
+		phi = rng.uniform(0.0, 2*np.pi)
+		inc = np.radians(rng.uniform(0.0, 5.0))
+		v = np.sqrt(G * sun.mass / r)
+		asteroid = Planet('A' + str(k), ASTEROID_MASS)
+		asteroid.pos_init = sun.pos_init + r * np.array([np.cos(phi), np.sin(phi)*np.cos(inc), np.sin(phi)*np.sin(inc)])
+		asteroid.vel_init = sun.vel_init + v * np.array([-np.sin(phi), np.cos(phi)*np.cos(inc), np.cos(phi)*np.sin(inc)])
+		asteroid.pos = asteroid.pos_init
+		asteroid.vel = asteroid.vel_init
+		planets.append(asteroid)
+	return System(planets, kernel = kernel(backend))
+
+
+def error_scale(u, dudt, h, out):
+	""" Scaling of the errors of RKQS, as in RungeKutta.
+	"""
+	np.abs(dudt, out = out)
+	out *= h
+	out += np.abs(u)
+	out += TINY
+	return out
+
+
+def cases(planets, kernels, folder, timesteps = TIMESTEPS, tolerances = TOLERANCES):
+	""" The benchmark cases of the System 'planets': tuples of the kernel, its parameters (a dict),
+	and the function of no arguments making one call of it. Logs are written into 'folder'.
+	RKQS tries the step-size its tolerance settles to, starting from the largest of the 'timesteps'.
+	"""
+	N = len(planets)
+	n = 2*N
+	u = planets.state
+	work = StageBuffers(n, 7)
+	dudt = Derivatives(0.0, u, planets).copy()
+
+	if 'Acceleration' in kernels:
+		yield 'Acceleration', {}, lambda: Acceleration(N, planets)
+	if 'Derivatives' in kernels:
+		out = np.empty_like(u)
+		yield 'Derivatives', {}, lambda: Derivatives(0.0, u, planets, out = out)
+	if 'RKDP' in kernels:
+		for h in timesteps:
+			yield 'RKDP', {'h': h}, lambda h = h: RKDP(u, dudt, n, 0.0, h, Derivatives, planets, work)
+	if 'RKQS' in kernels:
+		u0 = u.copy()
+		err_log = ErrorLog(None, planets, None, mode = 'off')
+		for eps in tolerances:
+			control = NRController()
+			h = max(timesteps)
+			for _ in range(10):										# Settle the step-size of the tolerance
+				np.copyto(u, u0)
+				h = RKQS(u, dudt, n, 0.0, h, error_scale(u, dudt, h, work.uscale), Derivatives, eps, planets, err_log,
+					work, control = control)[2]
+
+			def step(eps = eps, h = h, control = control):
+				np.copyto(u, u0)										# Every call takes the same step
+				RKQS(u, dudt, n, 0.0, h, error_scale(u, dudt, h, work.uscale), Derivatives, eps, planets, err_log,
+					work, control = control)
+			yield 'RKQS', {'eps': eps}, step
+			np.copyto(u, u0)
+	if 'total_energy' in kernels:
+		yield 'total_energy', {}, lambda: total_energy(N, planets)
+	if 'log_data' in kernels:
+		for background in (False, True):
+			log = fu.open_log(folder + 'bench_' + str(N) + '_' + str(background) + '.clog', planets, 'bench', 0,
+				background = background)
+			yield 'log_data', {'background': background}, lambda log = log: log_data(log, 0, 0.0, N, planets)
+			log.close()
+
+
+def time_case(call, warmup = WARMUP, repeats = REPEATS, min_time = MIN_TIME):
+	""" Times 'call': the number of calls per repeat is doubled until a repeat takes 'min_time',
+	then 'warmup' untimed and 'repeats' timed repeats are made.
+	Returns the number of calls per repeat, and the times per call of the repeats [s].
+	"""
+	number = 1
+	while True:
+		start = timer()
+		for _ in range(number):
+			call()
+		if timer() - start >= min_time:
+			break
+		number *= 2
+
+	times = np.zeros(repeats)
+	for r in range(-warmup, repeats):
+		start = timer()
+		for _ in range(number):
+			call()
+		if r >= 0:
+			times[r] = (timer() - start) / number
+	return number, times
+
+
+def statistics(times):
+	""" Summary statistics of the times per call [s].
+	"""
+	q1, median, q3 = np.percentile(times, [25, 50, 75])
+	return {'min': times.min(), 'median': median, 'mean': times.mean(), 'std': times.std(ddof = 1) if len(times) > 1 else 0.0,
+		'iqr': q3 - q1}
+
+
+def run(kernels = KERNELS, body_counts = BODY_COUNTS, timesteps = TIMESTEPS, tolerances = TOLERANCES, backend = BACKEND,
+		warmup = WARMUP, repeats = REPEATS, min_time = MIN_TIME):
+	""" Times every case of the 'kernels' on systems of the 'body_counts'.
+	Returns the results: the environment ('meta'), and a list of the cases ('results'), each with the kernel,
+	N, its parameters, the calls per repeat, and the statistics of the time per call.
+	"""
+	meta = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(), 'numpy': np.__version__,
+		'machine': platform.machine(), 'processor': platform.processor(), 'backend': backend, 'code': code_version(),
+		'warmup': warmup, 'repeats': repeats, 'min_time': min_time}
+	results = []
+	folder = tempfile.mkdtemp() + sep
+	try:
+		for N in body_counts:
+			planets = bench_system(N, backend)
+			for name, params, call in cases(planets, kernels, folder, timesteps, tolerances):
+				number, times = time_case(call, warmup, repeats, min_time)
+				results.append({'kernel': name, 'N': N, 'params': params, 'number': number, 'stats': statistics(times)})
+				print('{:>14} N = {:<5} {:<32} median {:.3e} s'.format(name, N, json.dumps(params), results[-1]['stats']['median']))
+	finally:
+		shutil.rmtree(folder, ignore_errors = True)
+	return {'meta': meta, 'results': results}
+
+
+def crossover(body_counts = CROSSOVER_COUNTS, thetas = THETAS, repeats = CROSSOVER_REPEATS):
+	""" Times one force evaluation of the direct sum and of the tree code with every opening angle of 'thetas'
+	on systems of the 'body_counts'. Returns the cases (as in 'run'), those of the tree code with the
+	median relative 'error' of its accelerations vs. the direct sum.
+	"""
+	results = []
+	for N in body_counts:
+		planets = bench_system(N, 'direct')
+		mass, pos = planets.mass, planets.pos.copy()
+		out = np.empty_like(pos)
+		reference = kernel('direct')(mass, pos)
+		size = np.linalg.norm(reference, axis = 1)
+		for theta in (None,) + tuple(thetas):
+			force = kernel('direct') if theta is None else kernel('tree', theta = theta)
+			number, times = time_case(lambda: force(mass, pos, out = out), 1, repeats, 0.0)
+			result = {'kernel': 'direct' if theta is None else 'tree', 'N': N, 'params': {} if theta is None else {'theta': theta},
+				'number': number, 'stats': statistics(times)}
+			if theta is not None:
+				result['error'] = np.median(np.linalg.norm(out - reference, axis = 1) / size)
+			results.append(result)
+			print('{:>14} N = {:<5} {:<32} median {:.3e} s'.format(result['kernel'], N, json.dumps(result['params']),
+				result['stats']['median']) + ('   error {:.1e}'.format(result['error']) if theta is not None else ''))
+	return results
+
+
+def crossovers(results):
+	""" The smallest N at which the tree code is faster than the direct sum, for every opening angle in the
+	cases of 'crossover' (None if it never is).
+	"""
+	direct = {r['N']: r['stats']['median'] for r in results if r['kernel'] == 'direct'}
+	found = {}
+	for r in sorted((r for r in results if r['kernel'] == 'tree'), key = lambda r: r['N']):
+		theta = r['params']['theta']
+		found.setdefault(theta, None)
+		if found[theta] is None and r['stats']['median'] < direct[r['N']]:
+			found[theta] = r['N']
+	return found
+
+
+def case_key(result):
+	return (result['kernel'], result['N'], json.dumps(result['params'], sort_keys = True))
+
+
+def compare(results, baseline, threshold = THRESHOLD):
+	""" Compares the medians of 'results' to those of the 'baseline' (both as returned by 'run'), case by case.
+	A case is 'faster' or 'slower' if its median changed by more than 'threshold' (relative),
+	and by more than the mean of the two interquartile ranges (the noise of the timings).
+	Returns a dataframe with the kernel, N, parameters, both medians, the speedup and the verdict of every common case.
+	"""
+	base = {case_key(result): result['stats'] for result in baseline['results']}
+	rows = []
+	for result in results['results']:
+		key = case_key(result)
+		if key not in base:
+			continue
+		old, new = base[key], result['stats']
+		diff = new['median'] - old['median']
+		changed = abs(diff) > threshold * old['median'] and abs(diff) > 0.5 * (old['iqr'] + new['iqr'])
+		verdict = ('slower' if diff > 0 else 'faster') if changed else ''
+		rows.append(list(key) + [old['median'], new['median'], old['median'] / new['median'], verdict])
+	return pd.DataFrame(rows, columns = ['Kernel', 'N', 'Params', 'Baseline [s]', 'Median [s]', 'Speedup', 'Change'])
+
+
+def save(results, path):
+	""" Writes the 'results' as JSON to 'path', atomically.
+	"""
+	os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+	with open(path + '.tmp', 'w') as file:
+		json.dump(results, file, indent = 1)
+	os.replace(path + '.tmp', path)
+
+
+def load(path):
+	""" The results stored at 'path', or None if there are none.
+	"""
+	if not os.path.exists(path):
+		return None
+	with open(path) as file:
+		return json.load(file)
+
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = 'Microbenchmarks of the integrator hot paths.')
+	parser.add_argument('--kernels', default = ','.join(KERNELS), help = 'comma separated kernels to time')
+	parser.add_argument('--bodies', default = ','.join(map(str, BODY_COUNTS)), help = 'comma separated body counts')
+	parser.add_argument('--quick', action = 'store_true', help = 'fewer repeats, for a rough check')
+	parser.add_argument('--out', default = RESULTS_FILE, help = 'file of the results')
+	parser.add_argument('--baseline', default = BASELINE_FILE, help = 'file of the baseline to compare to')
+	parser.add_argument('--save-baseline', action = 'store_true', help = 'store the results as the new baseline')
+	parser.add_argument('--crossover', action = 'store_true', help = 'also compare the direct sum and the tree code at large N')
+	parser.add_argument('--crossover-bodies', default = ','.join(map(str, CROSSOVER_COUNTS)),
+		help = 'comma separated body counts of the comparison')
+	args = parser.parse_args(argv)
+
+	kernels = [name for name in args.kernels.split(',') if name]
+	unknown = set(kernels) - set(KERNELS)
+	if unknown:
+		raise ValueError('Unknown kernels: ' + str(sorted(unknown)) + '. Choose from ' + str(KERNELS) + '.')
+	repeats, min_time = (5, 0.002) if args.quick else (REPEATS, MIN_TIME)
+
+	results = run(kernels, [int(N) for N in args.bodies.split(',') if N], repeats = repeats, min_time = min_time)
+	if args.crossover:
+		cases = crossover([int(N) for N in args.crossover_bodies.split(',') if N])
+		results['results'] += cases
+		for theta, N in crossovers(cases).items():
+			print('Tree code (theta = {}) faster than the direct sum from N = {}'.format(theta, N) if N else
+				'Tree code (theta = {}) not faster than the direct sum up to N = {}'.format(theta, max(r['N'] for r in cases)))
+	save(results, args.out)
+	print('Results written to ' + args.out)
+
+	baseline = load(args.baseline)
+	if baseline is not None:
+		table = compare(results, baseline)
+		with pd.option_context('display.width', 200, 'display.max_rows', None):
+			print('\nCompared to the baseline of ' + baseline['meta']['date'] + ':')
+			print(table.to_string(index = False, float_format = '{:.3e}'.format, formatters = {'Speedup': '{:.2f}'.format}))
+		print('\n{} faster, {} slower, {} unchanged.'.format((table['Change'] == 'faster').sum(),
+			(table['Change'] == 'slower').sum(), (table['Change'] == '').sum()))
+	if args.save_baseline:
+		save(results, args.baseline)
+		print('Baseline written to ' + args.baseline)
+
+
+if __name__ == "__main__":
+	main()
@@ -1,20 +1,25 @@
-from glob import iglob
 from os import sep
 
 import pandas as pd
 import numpy as np
-from scipy import stats
 
 from bokeh.io import show, output_notebook
 from bokeh.plotting import figure
 from bokeh.models import ColumnDataSource, HoverTool, NumeralTickFormatter, Label
-from bokeh.models.widgets import Panel, Tabs 
+from bokeh.models.widgets import Panel, Tabs, DataTable, TableColumn
+from bokeh.layouts import column
 from bokeh.transform import factor_cmap
 from bokeh.palettes import viridis, inferno, Category20, Category10
+
+from bokehlod import lod_line, share
+from analytics import path_to_analytics
+from accuracy import LogReference, EphemerisReference, accuracy_table, pareto, NORMS
 output_notebook()
 
 PLOT_WIDTH = 780
 PLOT_HEIGHT = 500
+REFERENCE = None			# Reference of the position errors: the log of a run on the runs' output grid (e.g. './logs/output_RKDP_12.clog' with a 10 day output interval), or None for the JPL ephemerides
+FETCH_EPHEMERIDES = False	# Query JPL Horizons for the days of the runs missing from the ephemeris store (needs network), or use the stored days only
 
 
 def all_cpu_tab(df_CPU):
@@ -80,22 +85,13 @@ def fix_cpu_tab(df_CPU):
 	
 def energy_change_perstep_tab(dtfrms):
 
-	p3 = figure(plot_height = PLOT_HEIGHT, plot_width = PLOT_WIDTH, toolbar_location="right", tools = "pan, wheel_zoom, box_zoom, reset, save", active_drag = "box_zoom")
+	p3 = figure(plot_height = PLOT_HEIGHT, plot_width = PLOT_WIDTH, toolbar_location="right", tools = "pan, wheel_zoom, box_zoom, reset, save", active_drag = "box_zoom", output_backend = "webgl")
 	i = 0
 	
 	for name in dtfrms:
-		elem = dtfrms[name]['Etot']
-		ser = []
-		
-		# Calculating change in Total energy by percentage, compared to previous step:
-		for j in range(1, len(elem)):
-			percentage_change = (((elem[j]) - (elem[j-1])) / (elem[j-1])) * 100
-			ser.append(-1*percentage_change)
-
-		# Creating new column in dataframe:
-		dtfrms[name]['Ediff'] = pd.Series(ser)
 	
-		line = p3.line(x = dtfrms[name]['T'], y = dtfrms[name]['Ediff'], legend = name, line_width = 3, line_color = Category20[20][i], line_join = "round",)
+		# Change in Total energy by percentage, compared to previous step:
+		line = lod_line(p3, {'T': dtfrms[name]['T'], 'Ediff': dtfrms[name]['Ediff']}, 'T', 'Ediff', budget = share(len(dtfrms)), legend = name, line_width = 3, line_color = Category20[20][i], line_join = "round",)
 	
 		p3.add_tools(HoverTool(renderers = [line], tooltips = [("Day", "$x{0,0}"), ("Name", name)]))
 		i += 1
@@ -115,12 +111,12 @@ def energy_change_perstep_tab(dtfrms):
 	
 def total_energy_change_tab(dtfrms):
 
-	p4 = figure(plot_height = PLOT_HEIGHT, plot_width = PLOT_WIDTH, toolbar_location="right", tools = "pan, wheel_zoom, box_zoom, reset, save", active_drag = "box_zoom")
+	p4 = figure(plot_height = PLOT_HEIGHT, plot_width = PLOT_WIDTH, toolbar_location="right", tools = "pan, wheel_zoom, box_zoom, reset, save", active_drag = "box_zoom", output_backend = "webgl")
 	i = 0
 	
 	for name in dtfrms:
 
-		line = p4.line(x = dtfrms[name]['T'], y = dtfrms[name]['percTot'], legend = name, line_width = 3, line_color = Category20[20][i], line_join = "round",)
+		line = lod_line(p4, {'T': dtfrms[name]['T'], 'percTot': dtfrms[name]['percTot']}, 'T', 'percTot', budget = share(len(dtfrms)), legend = name, line_width = 3, line_color = Category20[20][i], line_join = "round",)
 	
 		p4.add_tools(HoverTool(renderers = [line], tooltips = [("Day", "$x{0,0}"), ("Name", name)]))
 		i += 1
@@ -138,35 +134,47 @@ def total_energy_change_tab(dtfrms):
 	return tab
 	
 	
+def method_marker(plot, nam, x, y, marker_size = 13, **kwargs):
+	""" Draws the marker of the method 'nam' at 'x', 'y' into 'plot'. Returns the renderer.
+	"""
+	if nam == 'RK4':
+		return plot.circle(x = x, y = y, size = marker_size, color = Category10[4][3], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'E':
+		return plot.square(x = x, y = y, size = marker_size, color = Category10[4][0], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'RKDP':
+		return plot.triangle(x = x, y = y, size = marker_size, color = Category10[4][2], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'V':
+		return plot.inverted_triangle(x = x, y = y, size = marker_size, color = Category10[4][1], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'LF':
+		return plot.diamond(x = x, y = y, size = marker_size, color = Category10[7][4], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'Y4':
+		return plot.hex(x = x, y = y, size = marker_size, color = Category10[7][5], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'Y6':
+		return plot.square_pin(x = x, y = y, size = marker_size, color = Category10[7][6], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'H':
+		return plot.star(x = x, y = y, size = marker_size, color = Category10[8][7], line_color = 'black', legend = nam, **kwargs)
+	elif nam == 'HY':
+		return plot.diamond_cross(x = x, y = y, size = marker_size, color = Category10[9][8], line_color = 'black', legend = nam, **kwargs)
+	return plot.x(x = x, y = y, size = marker_size, color = 'black', legend = nam, **kwargs)
+	
+	
 def drift_vs_cpu_tab(dtfrms, df_CPU, label):
  
 	p5 = figure(plot_height = PLOT_HEIGHT, plot_width = PLOT_WIDTH, toolbar_location="right", tools = "pan, wheel_zoom, box_zoom, reset, save", active_drag = "box_zoom", x_axis_type = "log")
 	i = 0
-	marker_size = 13
 	
 	for name in dtfrms:
 	
-		dataframe = dtfrms[name]
 		nam = name[:name.rfind('_')]
 		
-		# Linear regression fitting on the change of Total Energy:
-		y = np.array(dataframe['percTot'])
-		x = np.array(dataframe['T'])
-		slope, intercept, r_value, p_value, std_err = stats.linregress(x,y)
-		slope = abs(slope)
+		# Slope of the linear regression fitting on the change of Total Energy:
+		slope = dtfrms[name]['slope']
 		
 		# Getting CPU time for method:
 		selected_df = df_CPU[df_CPU['Name'] == name].copy()
 		CPU_value = selected_df['CPU']
 		
-		if nam == 'RK4':
-			m = p5.circle(x = slope, y = CPU_value, size = marker_size, color = Category10[4][3], line_color = 'black', legend = nam)
-		elif nam == 'E':
-			m = p5.square(x = slope, y = CPU_value, size = marker_size, color = Category10[4][0], line_color = 'black', legend = nam)
-		elif nam == 'RKDP':
-			m = p5.triangle(x = slope, y = CPU_value, size = marker_size, color = Category10[4][2], line_color = 'black', legend = nam)
-		elif nam == 'V':
-			m = p5.inverted_triangle(x = slope, y = CPU_value, size = marker_size, color = Category10[4][1], line_color = 'black', legend = nam)
+		m = method_marker(p5, nam, slope, CPU_value)
 		
 		p5.add_tools(HoverTool(renderers = [m], tooltips = [("CPU","$y"), ("Slope","$x"), ("Method", name)]))
 		i += 1
@@ -186,33 +194,35 @@ def drift_vs_cpu_tab(dtfrms, df_CPU, label):
 	return tab
 	
 	
-def path_to_dataframes(path):
-	""" This function reads every log file in 'path', 
-	and creates a dictionary containing every dataframe, structured as such: 
-	{method1_stepsize1 : dataframe11, method1_stepsize2 : dataframe12, ..., 
-	method2stepsize1 : dataframe21, ...}
+def accuracy_vs_cpu_tab(table, body, label, norm = 'max'):
+	""" Position error of 'body' vs. the reference (see accuracy_table) against the CPU time of every run,
+	with the Pareto front (the cheapest runs for their accuracy) drawn as a line and listed in a table.
 	"""
+	p6 = figure(plot_height = PLOT_HEIGHT, plot_width = PLOT_WIDTH, toolbar_location="right", tools = "pan, wheel_zoom, box_zoom, reset, save", active_drag = "box_zoom", x_axis_type = "log", y_axis_type = "log")
+	runs = table[table['Body'] == body].dropna(subset = [norm, 'CPU'])
 	
-	dtfrms_dict = {}
-	for patho in iglob(path):
-		nombre = (patho.rstrip('.csv')).lstrip('.' + sep + 'logs' + sep + 'output_')
-		dataframe = pd.read_csv(patho, delim_whitespace = True, float_precision = 'high')
-		dtfrms_dict[nombre] = dataframe
-	return dtfrms_dict
-
-
-def add_E_change_column(dtfrms):
-
-	for name in dtfrms:
-		elem = dtfrms[name]['Etot']
-		ser = []
-		
-		for j in range(0,len(elem)):
-			ser.append(-((elem[j]-elem[0])/elem[0]))
-			
-		dtfrms[name]['percTot'] = pd.Series(ser)
-		
-	return dtfrms
+	for nam, group in runs.groupby('Method'):
+		m = method_marker(p6, nam, norm, 'CPU', source = ColumnDataSource(group))
+		p6.add_tools(HoverTool(renderers = [m], tooltips = [("CPU", "@CPU"), ("Error", "@" + norm), ("Method", "@Name")]))
+	
+	front = pareto(table, body, norm)
+	p6.line(x = front[norm].values, y = front['CPU'].values, line_width = 2, line_color = 'black', line_dash = 'dashed', legend = 'Pareto front')
+	
+	p6.legend.click_policy = "hide"
+	p6.title.text = body + ' position error vs. CPU time'
+	p6.yaxis.axis_label = "CPU time [sec]"
+	p6.xaxis.axis_label = "Position error (" + norm + ") [AU]"
+	p6.xgrid.minor_grid_line_color = 'navy'
+	p6.xgrid.minor_grid_line_alpha = 0.2
+	
+	p6.add_layout(label)
+	
+	columns = [TableColumn(field = 'Name', title = 'Method'), TableColumn(field = 'CPU', title = 'CPU time [s]')] + \
+		[TableColumn(field = n, title = n + ' error [AU]') for n in NORMS]
+	front_table = DataTable(source = ColumnDataSource(front), columns = columns, width = PLOT_WIDTH, height = 200, index_position = None)
+	
+	tab = Panel(child = column(p6, front_table), title = 'Accuracy vs. CPU time')
+	return tab
 	
 	
 def main():
@@ -227,12 +237,12 @@ def main():
 	label = Label(x=280, y=397, x_units='screen', y_units='screen', 
 			text=label_text, render_mode='canvas',  border_line_color='black', border_line_alpha=0.1, background_fill_color='white', background_fill_alpha=1.0)
 	
-	df_CPU = pd.read_csv('.' + sep + 'logs' + sep + 'CPUlogs.csv', delim_whitespace = True, float_precision = 'high')
+	df_CPU = pd.read_csv('.' + sep + 'logs' + sep + 'CPUlogs.csv', sep = r'\s+', float_precision = 'high')
 	df_CPU.Method = df_CPU.Method.astype(str)
 
-	# Creating dataframe dictionary:
-	dtfrms = path_to_dataframes('.' + sep + 'logs' + sep + 'output_*')
-	dtfrms = add_E_change_column(dtfrms)
+	# Energy analytics of every run, structured as such (taken from the cache for unchanged logs):
+	# {method1_stepsize1 : {'T': ..., 'percTot': ..., 'Ediff': ..., 'slope': ...}, method1_stepsize2 : ..., ...}
+	dtfrms = path_to_analytics('.' + sep + 'logs' + sep + 'output_*')
 	
 	# Constructing the tabular structure:
 	tabs_list = []
@@ -242,6 +252,12 @@ def main():
 	tabs_list.append(energy_change_perstep_tab(dtfrms))
 	tabs_list.append(drift_vs_cpu_tab(dtfrms, df_CPU, label))
 	
+	# Position errors of every body of every run vs. the reference, and the cheapest runs for their accuracy:
+	reference = LogReference(REFERENCE) if REFERENCE else EphemerisReference(fetch = FETCH_EPHEMERIDES)
+	table = accuracy_table('.' + sep + 'logs' + sep + 'output_*', reference, df_CPU)
+	body = '67P/C-G' if '67P/C-G' in set(table['Body']) else 'Jupiter'
+	tabs_list.append(accuracy_vs_cpu_tab(table, body, label))
+	
 	tabs_all = Tabs(tabs=tabs_list)
 	show(tabs_all)
 
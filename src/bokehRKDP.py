@@ -2,10 +2,13 @@
 This module plots the error terms of the RKDP method
 (differences of the fourth and fifth order methods) using bokeh.
 Also plots StepSize changes in a subplot, using a shared y_axes range.
+Error logs of every trial, or of every k-th accepted step, are plotted vs. time;
+summary error logs as the maximal and mean error, and the histogram of the errors of every variable.
 """
 from os import sep
 from glob import iglob
 
+import numpy as np
 import pandas as pd
 
 from bokeh.io import show, output_notebook, export_png, save, output_file
@@ -13,40 +16,86 @@ from bokeh.plotting import figure
 from bokeh.models import ColumnDataSource, HoverTool, BoxAnnotation
 from bokeh.models.widgets import Panel, Tabs
 from bokeh.layouts import column
+
+from trajlog import read_log, log_name, LOG_EXT
 output_notebook()
 
 PLOT_WIDTH = 780
 PLOT_HEIGHT = 500
 
+def variable_style(col):
+	""" Color and legend of the error column 'col'.
+	"""
+	if col == '67P/C-G_r_err':
+		return 'red', '67P/C-G(pos)'
+	elif col == '67P/C-G_v_err':
+		return 'gold', '67P/C-G(vel)'
+	elif col == 'Venus_r_err':
+		return 'navy', 'Venus(pos)'
+	return 'green', 'Other'
+
+
+def summary_plot(df_ERR, header):
+	""" Plots of a summary error log: the maximal and the mean scaled error of every variable,
+	and the histograms of their scaled errors over every trial.
+	"""
+	stats = df_ERR.set_index('Stat')
+	variables = list(stats.columns)
+	
+	source = ColumnDataSource(dict(var = variables, max = stats.loc[0].values, mean = stats.loc[1].values))
+	p = figure(x_range = variables, plot_height = (PLOT_HEIGHT//2), plot_width = PLOT_WIDTH, y_axis_type = "log",
+		title = 'Maximal (bars) and mean (circles) scaled error of variables', tools = "save")
+	p.vbar(x = 'var', top = 'max', bottom = 1e-17, width = 0.8, source = source, color = 'navy', alpha = 0.5)
+	p.circle(x = 'var', y = 'mean', size = 8, source = source, color = 'red')
+	p.add_tools(HoverTool(tooltips = [("Name", "@var"), ("Max", "@max"), ("Mean", "@mean")]))
+	p.xaxis.major_label_orientation = 1
+	
+	# Bins of the histograms: below the first edge, between the edges, above the last edge.
+	edges = np.array(header['edges'])
+	centers = np.concatenate(([edges[0] - 0.5], (edges[:-1] + edges[1:]) / 2.0, [edges[-1] + 0.5]))
+	
+	p2 = figure(plot_height = (PLOT_HEIGHT//2), plot_width = PLOT_WIDTH, title = 'Histogram of scaled errors', active_drag = "box_zoom")
+	for col in variables:
+		color, legend = variable_style(col)
+		line = p2.line(x = centers, y = stats.loc[2:, col].values, line_width = 2, color = color, legend = legend)
+		p2.add_tools(HoverTool(renderers = [line], tooltips=[("Name", col)]))
+	p2.xaxis.axis_label = "log10(Error (scaled))"
+	p2.yaxis.axis_label = "Number of trials"
+	
+	return p, p2
+
+
 def process_rkdp_err(path):
 	""" This function gets a filepath (path) to a log file of errors in the RKDP method,
 	and draws the two subplots using dataframes. Creates the layout, which is stored in a tab; the tab is returned.
+	A summary error log is drawn with 'summary_plot', above the StepSize subplot.
 	"""
-	name = (path.rstrip('.csv')).lstrip('.' + sep + 'logs' + sep + 'RKDP_')
-	df_ERR = pd.read_csv(path, delim_whitespace= True, float_precision = 'high')
+	name = log_name(path)
+	df_ERR, header = read_log(path)
+	mode = header.get('mode', 'all')
 	
-	method = '.' + sep + 'logs' + sep + 'output_RKDP_'+(name.lstrip('ERRS_'))+'.csv'
-	df_RKDP = pd.read_csv(method, delim_whitespace= True, float_precision = 'high')
+	method = '.' + sep + 'logs' + sep + 'output_RKDP_'+(name[name.rfind('_') + 1:])+LOG_EXT
+	df_RKDP, _ = read_log(method)
+	source2 = ColumnDataSource(df_RKDP)
+	
+	if mode == 'summary':
+		p, p_hist = summary_plot(df_ERR, header)
+		p2 = figure(plot_width = PLOT_WIDTH, plot_height = (PLOT_HEIGHT//3), tools = "save")
+		p2.line(x = 'T', y = 'StepSize', source = source2, color = 'navy')
+		p2.yaxis.axis_label = "Time Step [days]"
+		p2.xaxis.axis_label = "Time [days]"
+		p2.y_range.start = 0
+		return Panel(child = column(p, p_hist, p2), title = str(name))
 	
 	source = ColumnDataSource(df_ERR)
-	source2 = ColumnDataSource(df_RKDP)
 	
-	p = figure(plot_height = (3*PLOT_HEIGHT//4), plot_width = PLOT_WIDTH, title = 'Scaled error of variables vs. Time', active_drag = "box_zoom")
+	title = 'Scaled error of variables vs. Time'
+	if mode == 'sample':
+		title += ' (every ' + str(header['every']) + '. accepted step)'
+	p = figure(plot_height = (3*PLOT_HEIGHT//4), plot_width = PLOT_WIDTH, title = title, active_drag = "box_zoom")
 	
 	for col in source.column_names[1:-1]:
-		if col == '67P/C-G_r_err':
-			color = 'red'
-			legend = '67P/C-G(pos)'
-		elif col == '67P/C-G_v_err':
-			color = 'gold'
-			legend = '67P/C-G(vel)'
-		elif col == 'Venus_r_err':
-			color = 'navy'
-			legend = 'Venus(pos)'
-		else: 
-			color = 'green'
-			legend = 'Other'
-			
+		color, legend = variable_style(col)
 		line = p.line(x = 'T', y = col, source = source, line_width = 2, color = color, legend = legend)
 		p.add_tools(HoverTool(renderers = [line], tooltips=[("Name", col)]))
 	
@@ -79,7 +128,7 @@ def main():
 
 	tablist = []
 	
-	for path in iglob('.' + sep + 'logs' + sep + 'RKDP_*'):
+	for path in iglob('.' + sep + 'logs' + sep + 'RKDP_ERRS_*'):
 		tablist.append(process_rkdp_err(path))
 	
 	tabs = Tabs(tabs=tablist)
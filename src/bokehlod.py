@@ -0,0 +1,115 @@
+"""
+Level-of-detail rendering of long logged series in bokeh.
+
+A series is decimated into a pyramid of levels (see 'decimate'), which are embedded in the document once,
+as ColumnDataSources that are not drawn. A glyph draws a view source holding a bounded number of points:
+at first the coarsest level, and on every change of the plot ranges (zoom, pan, reset) a CustomJS callback
+copies into it the visible rows of the finest level that has at most 'points' of them in view.
+So the browser never draws more than about 'points' points per series, however long the run was.
+The figures of these plots use the WebGL backend (output_backend = "webgl").
+
+The documents are static (there is no server to load the finer levels from on demand), so every level
+is embedded in them, and their size is bounded by a budget instead: the levels of all the series of a figure
+hold at most 'FIGURE_POINTS' rows together, shared evenly by the series (see 'share'). A series longer than
+its share is not embedded in full: zooming in on it stops refining at the finest level that fits.
+"""
+import numpy as np
+
+from bokeh.models import ColumnDataSource, CustomJS
+
+from decimate import minmax, lttb, pyramid
+
+ENERGY_POINTS = 2000					# Points per energy series in view
+ORBIT_POINTS = 1000						# Points per orbit in view
+FIGURE_POINTS = 2**19					# Rows embedded per figure, at most (of all the levels of all of its series)
+
+# Picks the finest level with at most 'points' visible rows. 'line' views keep the visible stretch of rows
+# (x is sorted) and its two neighbours, so the line runs on to the edges; the others keep the rows inside the box.
+LOD_CODE = """
+const x0 = Math.min(xr.start, xr.end), x1 = Math.max(xr.start, xr.end);
+const y0 = Math.min(yr.start, yr.end), y1 = Math.max(yr.start, yr.end);
+let chosen = levels[0], picks = null;
+for (let k = 1; k < levels.length; k++) {
+	const x = levels[k].data[xkey], y = levels[k].data[ykey];
+	let keep = [];
+	for (let i = 0; i < x.length; i++) {
+		if (x[i] >= x0 && x[i] <= x1 && (line || (y[i] >= y0 && y[i] <= y1))) {
+			keep.push(i);
+		}
+	}
+	if (keep.length > points) {
+		break;
+	}
+	if (line && keep.length > 0) {
+		const lo = Math.max(keep[0] - 1, 0), hi = Math.min(keep[keep.length - 1] + 1, x.length - 1);
+		keep = Array.from({length: hi - lo + 1}, (_, i) => lo + i);
+	}
+	chosen = levels[k];
+	picks = keep;
+}
+const data = {};
+for (const key of Object.keys(chosen.data)) {
+	const column = chosen.data[key];
+	data[key] = picks === null ? column : picks.map(i => column[i]);
+}
+view.data = data;
+"""
+
+
+def share(nseries, budget = FIGURE_POINTS):
+	""" Rows of the levels of one of the 'nseries' series of a figure, within its 'budget'.
+	"""
+	return budget // max(nseries, 1)
+
+
+def level_sources(data, levels):
+	""" ColumnDataSources of the rows 'levels' (index arrays, coarsest first) of the columns in the dict 'data'.
+	"""
+	return [ColumnDataSource({key: np.asarray(column)[rows] for key, column in data.items()}) for rows in levels]
+
+
+def energy_levels(data, ykey, points = ENERGY_POINTS, budget = FIGURE_POINTS):
+	""" Pyramid of a time series (the columns in 'data', sorted by time), with min/max decimation of 'ykey',
+	of at most 'budget' rows.
+	"""
+	y = np.asarray(data[ykey], dtype = float)
+	return level_sources(data, pyramid(lambda size: minmax(y, size), len(y), points, budget = budget))
+
+
+def orbit_levels(data, xkey, ykey, points = ORBIT_POINTS, budget = FIGURE_POINTS):
+	""" Pyramid of an orbit (the columns in 'data', in the order of time), with LTTB decimation in the 'xkey', 'ykey' plane,
+	of at most 'budget' rows.
+	"""
+	x = np.asarray(data[xkey], dtype = float)
+	y = np.asarray(data[ykey], dtype = float)
+	return level_sources(data, pyramid(lambda size: lttb(x, y, size), len(x), points, budget = budget))
+
+
+def lod_view(plot, levels, xkey, ykey, points, line = False):
+	""" View source of the pyramid 'levels' in 'plot', starting with the coarsest level, and refined
+	on every change of the ranges of the plot. 'line' is for series sorted by 'xkey' (e.g. time),
+	whose view only follows the x range.
+	"""
+	view = ColumnDataSource(dict(levels[0].data))
+	if len(levels) > 1:
+		callback = CustomJS(args = dict(levels = levels, view = view, xr = plot.x_range, yr = plot.y_range,
+			xkey = xkey, ykey = ykey, points = points, line = line), code = LOD_CODE)
+		for r in (plot.x_range,) if line else (plot.x_range, plot.y_range):
+			r.js_on_change('start', callback)
+			r.js_on_change('end', callback)
+	return view
+
+
+def lod_line(plot, data, xkey, ykey, points = ENERGY_POINTS, budget = FIGURE_POINTS, **style):
+	""" Draws the time series 'ykey' vs. 'xkey' of the columns in 'data' into 'plot' as a level-of-detail line,
+	embedding at most 'budget' rows of it (its share of the figure's, see 'share'). Returns the renderer.
+	"""
+	levels = energy_levels(data, ykey, points, budget)
+	return plot.line(x = xkey, y = ykey, source = lod_view(plot, levels, xkey, ykey, points, line = True), **style)
+
+
+def lod_circle(plot, levels, xkey, ykey, points = ORBIT_POINTS, **style):
+	""" Draws the pyramid 'levels' of an orbit (see 'orbit_levels') into 'plot' as level-of-detail circles;
+	the levels can be shared by several plots. Returns the renderer.
+	"""
+	return plot.circle(x = xkey, y = ykey, source = lod_view(plot, levels, xkey, ykey, points), **style)
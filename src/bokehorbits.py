@@ -2,8 +2,6 @@ from glob import iglob
 from os import sep
 import math
 
-from astroquery.jplhorizons import Horizons
-
 import pandas as pd
 import numpy as np
 
@@ -11,6 +9,10 @@ from bokeh.io import show, output_notebook
 from bokeh.plotting import figure
 from bokeh.models.widgets import Panel, Tabs
 from bokeh.models import ColumnDataSource, HoverTool
+
+from trajlog import read_log, log_name
+from bokehlod import orbit_levels, lod_circle, share
+from ephemeris import EphemerisStore, JD_START, HORIZONS_IDS
 output_notebook()
 
 def jd_to_date(jd):
@@ -96,47 +98,31 @@ def page_setup(pages, df_JPL_CG, df_JPL_JUP, hover):
 		page.xaxis.axis_label = "X [AU]"
 		
 
-def JPL_query(Ttot, ts):
+def JPL_query(Ttot, ts, store = None):
 	"""
-	Querying JPL Horizons system for the state-vectors of Jupiter and 67P/C-G,
-	then converting the tables to pandas dataframes.
+	State-vectors of Jupiter and 67P/C-G every 'ts' days of the integration, as pandas dataframes,
+	served from the local ephemeris 'store' (see 'ephemeris'), which queries the JPL Horizons system
+	only for the days it does not have yet.
 	"""
-	JD_period_end = 2415020.5 + Ttot
+	store = store or EphemerisStore()
+	epochs = JD_START + ts * np.arange(Ttot // ts + 1)
+	fetch = True
 	
-	if JD_period_end > 2667387.5:
+	if epochs[-1] > 2667387.5:
 		print('Timescale is too large for query. Using previously downloaded HORIZONS data.')
-		df1 = pd.read_csv('.' + sep + 'addendum' + sep + 'Jupiter_1900_2000_1.csv', skipinitialspace = True, float_precision = 'high')
-		df2 = pd.read_csv('.' + sep + 'addendum' + sep + '67P_1900_2000_1.csv', skipinitialspace = True, float_precision = 'high')
-		
-	else:
-		try:
-			# Creating the necessary date format for querying:
-			endy, endm, endd = jd_to_date(JD_period_end)
-			end = str(endy) + '-' + str(endm) + '-' + str(endd)
+		fetch = False
 		
-			print(f'Querying HORIZONS with a {ts} days timestep...')
+	try:
+		df1 = store.dataframe(HORIZONS_IDS['Jupiter'], epochs, fetch)
+		df2 = store.dataframe(HORIZONS_IDS['67P/C-G'], epochs, fetch)
 		
-			# Jupiter data:
-			Jup = Horizons(id = '599', id_type = 'id', location = '500@0', epochs = {'start': '1900-01-01', 'stop': end, 'step': (str(ts)+'d')})
-			vec = Jup.vectors()
+	except Exception:
+		# In case there is no internet, or querying fails anyhow, use the stored days only:
 		
-			df1 = vec.to_pandas()
+		print('Something went wrong with the query. Using previously downloaded HORIZONS data.')
 		
-			# 67P/C-G data:
-			CG = Horizons(id = '900681', id_type = 'id', location = '500@0', epochs = {'start': '1900-01-01', 'stop': end, 'step': (str(ts)+'d')})
-			vec2 = CG.vectors()
-		
-			df2 = vec2.to_pandas()
-			
-			print('Done.')
-			
-		except:
-			# In case there is no internet, or querying fails anyhow, use standard addendum logs:
-			
-			print('Something went wrong with the query. Using previously downloaded HORIZONS data.')
-			
-			df1 = pd.read_csv('.' + sep + 'addendum' + sep + 'Jupiter_1900_2000_1.csv', skipinitialspace = True, float_precision = 'high')
-			df2 = pd.read_csv('.' + sep + 'addendum' + sep + '67P_1900_2000_1.csv', skipinitialspace = True, float_precision = 'high')
+		df1 = store.dataframe(HORIZONS_IDS['Jupiter'], epochs, fetch = False)
+		df2 = store.dataframe(HORIZONS_IDS['67P/C-G'], epochs, fetch = False)
 			
 	return df1, df2
 	
@@ -179,21 +165,27 @@ def main():
 		("Day", "@T{0,0}"),
 	])
 
-	page1 = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom")
+	page1 = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", output_backend = "webgl")
 	pages.append(page1)
 	
-	pageE = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom")
+	pageE = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", output_backend = "webgl")
 	pages.append(pageE)
 
-	pageV = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom") 
+	pageV = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", output_backend = "webgl") 
 	pages.append(pageV)
 
-	pageRK4 = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", x_range = pageV.x_range, y_range = pageV.y_range)
+	pageRK4 = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", output_backend = "webgl", x_range = pageV.x_range, y_range = pageV.y_range)
 	pages.append(pageRK4)
 
-	pageRKDP = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", x_range = pageV.x_range, y_range = pageV.y_range)
+	pageRKDP = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", output_backend = "webgl", x_range = pageV.x_range, y_range = pageV.y_range)
 	pages.append(pageRKDP)
 	
+	# Symplectic, Hermite and Hybrid methods, one page each:
+	pageSY = {}
+	for tag in ['LF', 'Y4', 'Y6', 'H', 'HY']:
+		pageSY[tag] = figure(plot_width = plot_width, plot_height = plot_height, active_drag = "box_zoom", output_backend = "webgl", x_range = pageV.x_range, y_range = pageV.y_range)
+		pages.append(pageSY[tag])
+	
 	# Setting up pages and plotting JPL:
 	page_setup(pages, df_JPL_CG, df_JPL_JUP, hover)
 	
@@ -201,42 +193,54 @@ def main():
 	alpha_arr_fix = np.linspace(0.1, 1.0, num=(ts_range_max - ts_range_min + 1))
 	alpha_arr_ada = np.linspace(0.1, 1.0, num=(tol_range_max - tol_range_min + 1))
 	i, j, k, l = 0, 0, 0, 0
+	count_SY = {'LF': 0, 'Y4': 0, 'Y6': 0, 'H': 0, 'HY': 0}
+	colors_SY = {'LF': (255, 0, 255), 'Y4': (0, 255, 255), 'Y6': (255, 128, 0), 'H': (128, 0, 255), 'HY': (0, 128, 128)}
 	
-	# Reading every dataframe produced by 'comp.py':
-	for path in iglob('.' + sep + 'logs' + sep + 'output_*'):					
+	# Reading every dataframe produced by 'comp.py'; they share the embedded rows of the first page, which shows them all:
+	paths = list(iglob('.' + sep + 'logs' + sep + 'output_*'))
+	for path in paths:					
 
-		nombre = (path.rstrip('.csv')).lstrip('.' + sep + 'logs' + sep + 'output_')
-		ts_tol = int((path[path.rfind('_') + 1:]).rstrip('.csv'))
+		nombre = log_name(path)
+		ts_tol = int(nombre[nombre.rfind('_') + 1:])
 	
-		dataframe = pd.read_csv(path, delim_whitespace = True, float_precision = 'high')
-	
-		source = ColumnDataSource(dataframe)
+		dataframe, header = read_log(path)
 		
 		namex = name+'X'
 		namey = name+'Y'
+		
+		# Pyramid of the orbit, drawn with a bounded number of points on its own page and on the first one:
+		levels = orbit_levels({'T': dataframe['T'], namex: dataframe[namex], namey: dataframe[namey]}, namex, namey,
+			budget = share(len(paths)))
 	
 		if nombre[:nombre.rfind('_')] == 'RK4':
 			r, g, b = 255, 0, 0
-			pageRK4.circle(x = namex, y = namey, source = source, size = circle_size, color = (r, g, b), fill_alpha = alpha_arr_fix[i], line_color = 'black', legend = nombre)
-			page1.circle(x = namex, y = namey, source = source, size = circle_size, color = (r, g, b), fill_alpha = alpha_arr_fix[i], line_color = 'black', legend = nombre)
+			lod_circle(pageRK4, levels, namex, namey, size = circle_size, color = (r, g, b), fill_alpha = alpha_arr_fix[i], line_color = 'black', legend = nombre)
+			lod_circle(page1, levels, namex, namey, size = circle_size, color = (r, g, b), fill_alpha = alpha_arr_fix[i], line_color = 'black', legend = nombre)
 			i += 1
 		elif nombre[:nombre.rfind('_')] == 'E':
 			r, g, b = 0, 0, 255
-			pageE.circle(x = namex, y = namey, source = source, size = circle_size, color = ((r+5*ts_tol), g+10*ts_tol, b), fill_alpha = alpha_arr_fix[j], line_color = 'black', legend = nombre)
-			page1.circle(x = namex, y = namey, source = source, size = circle_size, color = ((r+5*ts_tol), g+10*ts_tol, b), fill_alpha = alpha_arr_fix[j], line_color = 'black', legend = nombre)
+			lod_circle(pageE, levels, namex, namey, size = circle_size, color = ((r+5*ts_tol), g+10*ts_tol, b), fill_alpha = alpha_arr_fix[j], line_color = 'black', legend = nombre)
+			lod_circle(page1, levels, namex, namey, size = circle_size, color = ((r+5*ts_tol), g+10*ts_tol, b), fill_alpha = alpha_arr_fix[j], line_color = 'black', legend = nombre)
 			j += 1
 		
 		elif nombre[:nombre.rfind('_')] == 'RKDP':
 			r, g, b = 0, 255, 0
-			pageRKDP.circle(x = namex, y = namey, source = source, size = circle_size, color = (r+5*ts_tol, g, b+10*ts_tol), fill_alpha = alpha_arr_ada[k], line_color = 'black', legend = nombre)
-			page1.circle(x = namex, y = namey, source = source, size = circle_size, color = (r+5*ts_tol, g, b+10*ts_tol), fill_alpha = alpha_arr_ada[k], line_color = 'black', legend = nombre)
+			lod_circle(pageRKDP, levels, namex, namey, size = circle_size, color = (r+5*ts_tol, g, b+10*ts_tol), fill_alpha = alpha_arr_ada[k], line_color = 'black', legend = nombre)
+			lod_circle(page1, levels, namex, namey, size = circle_size, color = (r+5*ts_tol, g, b+10*ts_tol), fill_alpha = alpha_arr_ada[k], line_color = 'black', legend = nombre)
 			k += 1
 		
 		elif nombre[:nombre.rfind('_')] == 'V':
 			r, g, b = 255, 255, 0
-			pageV.circle(x = namex, y = namey, source = source, size = circle_size, color = (r, g, b+10*ts_tol), fill_alpha = alpha_arr_fix[l], line_color = 'black', legend = nombre)
-			page1.circle(x = namex, y = namey, source = source, size = circle_size, color = (r, g, b+10*ts_tol), fill_alpha = alpha_arr_fix[l], line_color = 'black', legend = nombre)
+			lod_circle(pageV, levels, namex, namey, size = circle_size, color = (r, g, b+10*ts_tol), fill_alpha = alpha_arr_fix[l], line_color = 'black', legend = nombre)
+			lod_circle(page1, levels, namex, namey, size = circle_size, color = (r, g, b+10*ts_tol), fill_alpha = alpha_arr_fix[l], line_color = 'black', legend = nombre)
 			l += 1
+		
+		elif nombre[:nombre.rfind('_')] in pageSY:
+			tag = nombre[:nombre.rfind('_')]
+			r, g, b = colors_SY[tag]
+			lod_circle(pageSY[tag], levels, namex, namey, size = circle_size, color = (r, g, b), fill_alpha = alpha_arr_fix[count_SY[tag]], line_color = 'black', legend = nombre)
+			lod_circle(page1, levels, namex, namey, size = circle_size, color = (r, g, b), fill_alpha = alpha_arr_fix[count_SY[tag]], line_color = 'black', legend = nombre)
+			count_SY[tag] += 1
 			
 	page1.legend.location = "bottom_left"
 	
@@ -248,7 +252,7 @@ def main():
 		page.legend.click_policy = "hide"
 		page.circle([0],[0], size = circle_size+2, fill_color = 'white', line_color = 'black', line_width = 2)
 		page.circle([0],[0], size = 2, fill_color = 'black')
-		title = ['All', 'Euler', 'Verlet', 'RK4', 'RKDP']
+		title = ['All', 'Euler', 'Verlet', 'RK4', 'RKDP', 'Leapfrog', 'Yoshida4', 'Yoshida6', 'Hermite', 'Hybrid']
 		tab = Panel(child = page, title = title[z])
 		tablist.append(tab)
 		z += 1
@@ -0,0 +1,94 @@
+"""
+Checkpoints of long integrations, to resume them after a crash, or to extend a finished run to a longer Ttot.
+
+A checkpoint is an .npz file holding the state vector of a run, its time T, its step count,
+its CPU time so far, the sizes of its logs (offsets), and whatever else the integrator needs to continue
+(e.g. the current step-size of RKDP). It is written into a temporary file first, which then replaces
+the previous checkpoint, so a crash while writing leaves the previous one intact.
+On resume, the logs are truncated to their sizes at the checkpoint (dropping the rows written after it),
+and appended to from there on.
+A checkpoint also records the settings of its run (a hash of everything but the run's length, e.g. 'Ttot'),
+and the key of the run that wrote it (see sweep.run_key). A checkpoint of a run with other settings,
+or one that is already past the end of the run, is not resumed from.
+"""
+import os
+import warnings
+from timeit import default_timer as timer
+
+import numpy as np
+
+EVERY = 300.0							# Wall-clock time between the checkpoints of a run [s]
+
+
+def save(path, **fields):
+	""" Writes the arrays and scalars of 'fields' into the checkpoint at 'path', atomically.
+	"""
+	temp = path + '.tmp'
+	with open(temp, 'wb') as file:
+		np.savez(file, **fields)
+		file.flush()
+		os.fsync(file.fileno())
+	os.replace(temp, path)
+
+
+def load(path):
+	""" Returns the fields of the checkpoint at 'path' as a dictionary (scalars as 0-d arrays),
+	or None if there is no checkpoint.
+	"""
+	if not os.path.exists(path):
+		return None
+	with np.load(path) as data:
+		return {key: data[key] for key in data.files}
+
+
+def restore(saved, planets, logs):
+	""" Restores the state of 'planets' from the checkpoint 'saved', and truncates the logs at the paths 'logs'
+	to their sizes at the checkpoint. Returns the T, step and CPU time of the run at the checkpoint.
+	"""
+	planets.state[...] = saved['state']
+	for path, offset in zip(logs, saved['offsets']):
+		os.truncate(path, int(offset))
+	return saved['T'].item(), saved['step'].item(), saved['cpu'].item()
+
+
+class Checkpointer:
+	""" Periodic checkpoints of a run into 'path', at most one every 'every' seconds of wall-clock time
+	(None: only when asked to, e.g. at the end of the run).
+	'settings' identifies the run apart from its length, and 'key' is its key in the store;
+	both are saved with every checkpoint.
+	"""
+
+	def __init__(self, path, every = EVERY, settings = '', key = ''):
+		self.path = path
+		self.every = every
+		self.settings = settings
+		self.key = key
+		self.last = timer()
+
+	def load(self, Ttot = None):
+		""" The checkpoint of the run, if there is one that it can continue from: one with the same settings,
+		at most at 'Ttot'. Any other checkpoint is discarded with a warning (the run starts over, and replaces it).
+		"""
+		saved = load(self.path)
+		if saved is None:
+			return None
+		if str(saved.get('settings', '')) != self.settings:
+			reason = 'it belongs to a run with other settings'
+		elif Ttot is not None and saved['T'].item() > Ttot:
+			reason = 'it is at T = ' + str(saved['T'].item()) + ', past the end of the run'
+		else:
+			return saved
+		warnings.warn('Not resuming from ' + self.path + ': ' + reason + '.')
+		return None
+
+	def due(self):
+		return self.every is not None and timer() - self.last >= self.every
+
+	def save(self, state, T, step, cpu, logs, **extra):
+		""" Saves the 'state' of the run at 'T' after 'step' steps and 'cpu' seconds, with the current sizes
+		of its open 'logs' (LogWriters or AsyncLogSinks, which are flushed), and the 'extra' fields.
+		"""
+		offsets = [log.tell() for log in logs]
+		save(self.path, state = state, T = T, step = step, cpu = cpu, offsets = offsets, settings = self.settings,
+			key = self.key, **extra)
+		self.last = timer()
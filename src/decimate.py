@@ -0,0 +1,99 @@
+"""
+Decimation of long logged series for plotting: every function returns the indices of the rows to keep.
+
+	- 'minmax' keeps the smallest and the largest value of every bucket of consecutive rows, so spikes
+	  (e.g. the energy error of a close encounter) survive, however coarse the level is.
+	- 'lttb' is Largest-Triangle-Three-Buckets style selection of a curve (e.g. an orbit in the x, y plane):
+	  from every bucket the point spanning the largest triangle with the averages of the neighbouring buckets
+	  is kept. Unlike the original LTTB, the previous bucket is represented by its average as well
+	  (not by its selected point), so every bucket is decided at once, in a vectorized pass.
+
+A 'pyramid' is a sequence of levels of increasing resolution, 'FACTOR' times finer each,
+from a level of about 'points' rows to the full series, holding at most a 'budget' of rows together
+('MAX_POINTS' by default): a longer series ends with the finest level that fits in the budget.
+Reference: Steinarsson: Downsampling Time Series for Visual Representation (2013).
+"""
+import numpy as np
+
+FACTOR = 4								# Resolution ratio of consecutive levels of a pyramid
+MAX_POINTS = 2**18						# Rows of all the levels of a pyramid together, at most
+
+
+def buckets(n, nbuckets):
+	""" Start indices of 'nbuckets' buckets of nearly equal size over the 'n' inner rows of a series
+	(the first and the last row are always kept), and the bucket of every inner row.
+	"""
+	starts = np.unique(np.linspace(0, n, nbuckets + 1).astype(np.int64)[:-1])
+	ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+	return starts, ids
+
+
+def first_max(values, starts, ids):
+	""" Index of the (first) largest value of every bucket.
+	"""
+	maxima = np.maximum.reduceat(values, starts)
+	hits = np.flatnonzero(values == maxima[ids])
+	_, first = np.unique(ids[hits], return_index = True)
+	return hits[first]
+
+
+def minmax(y, points):
+	""" Indices of about 'points' rows of 'y': the first and the last row, and the smallest and the largest value
+	of every bucket of rows in between.
+	"""
+	y = np.asarray(y, dtype = float)
+	n = len(y)
+	if n <= points:
+		return np.arange(n)
+
+	starts, ids = buckets(n - 2, max(points // 2 - 1, 1))
+	inner = y[1:n - 1]
+	high = first_max(np.where(np.isnan(inner), -np.inf, inner), starts, ids)
+	low = first_max(np.where(np.isnan(inner), -np.inf, -inner), starts, ids)
+	return np.unique(np.concatenate(([0], low + 1, high + 1, [n - 1])))
+
+
+def lttb(x, y, points):
+	""" Indices of about 'points' rows of the curve ('x', 'y'): the first and the last row,
+	and the row of every bucket in between spanning the largest triangle with the averages of its neighbours.
+	"""
+	x = np.asarray(x, dtype = float)
+	y = np.asarray(y, dtype = float)
+	n = len(x)
+	if n <= points:
+		return np.arange(n)
+
+	starts, ids = buckets(n - 2, max(points - 2, 1))
+	counts = np.bincount(ids)
+	xi, yi = x[1:n - 1], y[1:n - 1]
+	xm = np.add.reduceat(xi, starts) / counts
+	ym = np.add.reduceat(yi, starts) / counts
+
+	# Neighbours of every bucket: the averages of the previous and the next ones (the end points at the ends):
+	ax, ay = np.concatenate(([x[0]], xm[:-1])), np.concatenate(([y[0]], ym[:-1]))
+	cx, cy = np.concatenate((xm[1:], [x[-1]])), np.concatenate((ym[1:], [y[-1]]))
+	ax, ay, cx, cy = ax[ids], ay[ids], cx[ids], cy[ids]
+	area = np.abs((ax - cx)*(yi - ay) - (ax - xi)*(cy - ay))
+
+	return np.concatenate(([0], first_max(np.nan_to_num(area, nan = -1.0), starts, ids) + 1, [n - 1]))
+
+
+def pyramid(select, n, points, factor = FACTOR, budget = MAX_POINTS):
+	""" Levels of a series of 'n' rows, coarsest first: the indices chosen by 'select(size)'
+	for sizes of 'points', 'factor * points', ..., closed by the full series, as long as all the levels together
+	hold at most 'budget' rows. Otherwise the last level is the one chosen for the rest of the budget
+	(the first level is kept in any case, so a series is never left without one).
+	"""
+	levels = []
+	total = 0
+	size = points
+	while size < n and total + size <= budget:
+		levels.append(select(size))
+		total += len(levels[-1])
+		size *= factor
+	rest = budget - total
+	if n <= rest:
+		levels.append(np.arange(n))
+	elif not levels or rest > len(levels[-1]):
+		levels.append(select(max(rest, min(points, n))))
+	return levels
@@ -0,0 +1,223 @@
+"""
+Close encounters: a hybrid symplectic stepper that resolves them locally, with a smooth changeover
+(after Chambers' hybrid integrator in Mercury, MNRAS 304, 793, 1999).
+
+The step is the mixed-variable symplectic (Wisdom-Holman) map in democratic heliocentric coordinates:
+heliocentric positions Q and barycentric velocities V, so every body moves on an exact Kepler orbit
+around the central body (the heaviest one) during the drift, however close it passes it (e.g. a comet at its
+perihelion), and the mutual attraction of the other bodies acts as kicks, together with the "jump" of the
+positions by the momentum of the central body.
+
+The potential of every pair of non-central bodies is split by a changeover function K(r) of its distance,
+smooth (C2) from 1 (close) inside 'INNER' * r_crit to 0 (far) outside r_crit: U = K U + (1 - K) U.
+The far parts give the kicks of the large step, and the close parts act in its drift: the bodies of the close
+pairs are advanced together with sub-steps (Kepler drifts between kicks of the close parts) short enough
+to resolve their encounter, while the others drift along their Kepler orbits. Every part is a Hamiltonian
+of its own, so the step is symplectic (up to the choice of the number of sub-steps), and a pair changes over
+gradually as it approaches, without switching between the two treatments.
+
+The critical distance r_crit of a pair is fixed for the run: 'HILL_FACTOR' Hill radii of its larger member
+(the Hill radius of a body of mass m at distance d from the central body of mass M is 'd * (m / 3M)^(1/3)',
+taken at the initial positions), or the distance where the pair's dynamical time is 'DYN_FACTOR' timesteps,
+if that is larger.
+"""
+import numpy as np
+
+from forces import G, kernel_potential
+
+HILL_FACTOR = 3.0					# Critical distance of a pair [Hill radii of its larger member]
+DYN_FACTOR = 4.0					# Pairs with a dynamical time sqrt(r^3 / G(m1 + m2)) under this many timesteps are close
+INNER = 0.1							# Fraction of the critical distance inside which a pair is fully close
+SUB_RESOLUTION = 0.02				# Largest fraction of the encounter time scale per sub-step
+MAX_SUBSTEPS = 4096
+KEPLER_ITERATIONS = 50				# Iterations of the Kepler solver at most
+LAGUERRE = 5.0						# Order of the Laguerre-Conway iteration of the Kepler solver
+STUMPFF_SERIES = 0.1				# Stumpff functions of |z| below this are summed as series,
+STUMPFF_TERMS = 8					# of this many terms
+FACTORIALS = np.cumprod([1.0] + list(range(1, 2*STUMPFF_TERMS + 2)))
+
+
+def stumpff(z):
+	""" Stumpff functions c2(z) and c3(z) of the universal variable formulation of the Kepler problem:
+	their series for small |z|, and the closed forms (1 - cos s) / z and (s - sin s) / (z s), s = sqrt(z)
+	(with cosh and sinh for z < 0), otherwise.
+	"""
+	series2, series3 = 0.0, 0.0
+	for k in range(STUMPFF_TERMS - 1, -1, -1):									# Horner's scheme of the series in -z
+		series2 = 1.0 / FACTORIALS[2*k + 2] - z * series2
+		series3 = 1.0 / FACTORIALS[2*k + 3] - z * series3
+	s = np.sqrt(np.abs(z))
+	elliptic = z > 0
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		c2 = (1.0 - np.where(elliptic, np.cos(s), np.cosh(s))) / z
+		c3 = (s - np.where(elliptic, np.sin(s), np.sinh(s))) / (z * s)
+	small = np.abs(z) < STUMPFF_SERIES
+	return np.where(small, series2, c2), np.where(small, series3, c3)
+
+
+def kepler_drift(pos, vel, mu, dt):
+	""" Advances the (n, 3) relative positions 'pos' and velocities 'vel' of bodies on Kepler orbits
+	around a mass of 'mu' = G M over 'dt', in place, with Gauss' f and g functions in universal variables.
+	"""
+	r0 = np.sqrt(np.einsum('ik,ik->i', pos, pos))
+	eta = np.einsum('ik,ik->i', pos, vel)
+	beta = 2.0 * mu / r0 - np.einsum('ik,ik->i', vel, vel)				# mu / a
+	zeta = mu - beta * r0
+
+	x = dt / r0																# Universal anomaly (times sqrt(mu)): first guess
+	for _ in range(KEPLER_ITERATIONS):
+		c2, c3 = stumpff(beta * x**2)
+		g1 = x * (1.0 - beta * x**2 * c3)									# G-functions G1, G2, G3 of the anomaly
+		g2 = x**2 * c2
+		g3 = x**3 * c3
+		f = r0 * x + eta * g2 + zeta * g3 - dt
+		fp = r0 + eta * g1 + zeta * g2
+		fpp = eta * (1.0 - beta * g2) + zeta * g1
+		root = np.sqrt(np.abs((LAGUERRE - 1.0)**2 * fp**2 - LAGUERRE * (LAGUERRE - 1.0) * f * fpp))
+		dx = LAGUERRE * f / (fp + np.copysign(root, fp))
+		x -= dx
+		if np.all(np.abs(dx) <= 1e-14 * np.abs(x)):
+			break
+
+	c2, c3 = stumpff(beta * x**2)
+	g1, g2, g3 = x * (1.0 - beta * x**2 * c3), x**2 * c2, x**3 * c3
+	r = r0 + eta * g1 + zeta * g2
+	f = 1.0 - mu * g2 / r0
+	g = dt - mu * g3
+	fdot = -mu * g1 / (r * r0)
+	gdot = 1.0 - mu * g2 / r
+	new = f[:, np.newaxis] * pos + g[:, np.newaxis] * vel
+	vel[...] = fdot[:, np.newaxis] * pos + gdot[:, np.newaxis] * vel
+	pos[...] = new
+
+
+def critical_radii(mass, pos, dt):
+	""" Critical distances of the pairs of the bodies at 'pos' (the initial positions), as an (n, n) array,
+	for a timestep of 'dt'. 'mass' includes the central body, which is the heaviest one.
+	"""
+	center = np.argmax(mass)
+	d = np.sqrt(np.einsum('ik,ik->i', pos - pos[center], pos - pos[center]))
+	hill = d * np.cbrt(mass / (3.0 * mass[center]))
+	gm = G * (mass[:, np.newaxis] + mass[np.newaxis, :])
+	return np.maximum(HILL_FACTOR * np.maximum(hill[:, np.newaxis], hill[np.newaxis, :]), np.cbrt(gm * (DYN_FACTOR * dt)**2))
+
+
+def changeover(r, crit):
+	""" The changeover function K of pairs at the distances 'r' with critical distances 'crit',
+	and 'r * dK/dr'. K is 1 inside 'INNER' * crit, 0 outside crit, and a quintic smoothstep in between.
+	"""
+	width = (1.0 - INNER) * crit
+	y = np.clip((r - INNER * crit) / width, 0.0, 1.0)
+	K = 1.0 - y**3 * (10.0 - 15.0*y + 6.0*y**2)
+	return K, -30.0 * y**2 * (1.0 - y)**2 * r / width
+
+
+def pairs(pos, n_massive):
+	""" Separations dr[i, j] = r_j - r_i of every body from the first 'n_massive' ones, their distances,
+	and the mask of the pairs of different bodies.
+	"""
+	dr = pos[np.newaxis, :n_massive, :] - pos[:, np.newaxis, :]
+	r = np.sqrt(np.einsum('ijk,ijk->ij', dr, dr))
+	other = np.ones(r.shape, dtype = bool)
+	other[np.arange(n_massive), np.arange(n_massive)] = False
+	return dr, r, other
+
+
+def split_acceleration(mass, pos, crit, n_massive, part):
+	""" Acceleration of the bodies at 'pos' by the 'close' or 'far' parts of their pairs with the first 'n_massive'
+	ones, 'crit' being the critical distances of the pairs. The gradient of K U (of (1 - K) U) gives
+	the newtonian acceleration of the pair times 'K - r dK/dr' ('1 - K + r dK/dr').
+	"""
+	dr, r, other = pairs(pos, n_massive)
+	crit = crit[:, :n_massive]
+	w = np.zeros(r.shape)
+	near = other & (r < crit)
+	K, rdK = changeover(r[near], crit[near])
+	if part == 'close':
+		w[near] = K - rdK
+	else:
+		w[other] = 1.0
+		w[near] = 1.0 - K + rdK
+	w *= G * mass[:n_massive] / np.where(other, r, 1.0)**3
+	return np.einsum('ij,ijk->ik', w, dr)
+
+
+def find_encounters(mass, pos, vel, crit, n_massive, dt):
+	""" Bodies of the pairs that may be closer than their critical distance during a step of 'dt'
+	(in ascending order, so the massive ones come first), and the shortest time scale of those pairs
+	(the distance over the relative speed, or the dynamical time, at the closest distance they may reach).
+	"""
+	dr, r, other = pairs(pos, n_massive)
+	dv = vel[np.newaxis, :n_massive, :] - vel[:, np.newaxis, :]
+	speed = np.sqrt(np.einsum('ijk,ijk->ij', dv, dv))
+	near = other & (r - 2.0 * speed * dt < crit[:, :n_massive])
+	i, j = np.nonzero(near)
+	if len(i) == 0:
+		return i, np.inf
+
+	reach = np.maximum(r[i, j] - speed[i, j] * dt, 0.1 * r[i, j])
+	scale = np.minimum(reach / np.maximum(speed[i, j], 1e-300), np.sqrt(reach**3 / (G * (mass[i] + mass[j]))))
+	return np.union1d(i, j), scale.min()
+
+
+def Hybrid(N, pl, dt, potential = False):
+	""" One step of 'dt' of the hybrid symplectic stepper for the System 'pl' (see the module): half a kick
+	of the far parts of the pair forces and half a jump, a Kepler drift around the central body
+	in which the bodies of the close pairs are sub-stepped with their close parts, half a jump and half a kick.
+	With 'potential', the potential energy at the new positions is left in 'pl.epot'.
+	Test particles are drifted and kicked, but do not attract, nor move the central body.
+	The critical distances are set at the first step, from the initial positions of the bodies.
+	"""
+	nm = pl.n_massive
+	c = np.argmax(pl.mass[:nm])											# The central body
+	others = np.delete(np.arange(N), c)
+	mass = pl.mass[others]
+	nmo = nm - 1														# Massive bodies among the others
+	mu = G * pl.mass[c]
+	if getattr(pl, 'changeover', (None,))[0] != dt:
+		initial = np.array([planet.pos_init for planet in pl])
+		crit = critical_radii(pl.mass, initial, dt)
+		pl.changeover = (dt, crit[np.ix_(others, others)])
+	crit = pl.changeover[1]
+
+	# To democratic heliocentric coordinates:
+	mtot = pl.mass[:nm].sum()
+	xcm = pl.mass[:nm] @ pl.pos[:nm] / mtot
+	vcm = pl.mass[:nm] @ pl.vel[:nm] / mtot
+	Q = pl.pos[others] - pl.pos[c]
+	V = pl.vel[others] - vcm
+
+	V += (0.5 * dt) * split_acceleration(mass, Q, crit, nmo, 'far')	# kick (far parts)
+	Q += (0.5 * dt / pl.mass[c]) * (mass[:nmo] @ V[:nmo])				# jump
+
+	close, scale = find_encounters(mass, Q, V, crit, nmo, dt)
+	drift = np.ones(N - 1, dtype = bool)
+	drift[close] = False
+	Qd, Vd = Q[drift], V[drift]
+	kepler_drift(Qd, Vd, mu, dt)										# drift
+	Q[drift], V[drift] = Qd, Vd
+
+	if len(close):														# drift of the close pairs, sub-stepped
+		nsub = int(np.clip(np.ceil(dt / (SUB_RESOLUTION * scale)), 1, MAX_SUBSTEPS))
+		h = dt / nsub
+		mc, cc, ncm = mass[close], crit[np.ix_(close, close)], np.count_nonzero(close < nmo)
+		Qc, Vc = Q[close], V[close]
+		acc = split_acceleration(mc, Qc, cc, ncm, 'close')
+		for k in range(nsub):
+			Vc += (0.5 * h) * acc
+			kepler_drift(Qc, Vc, mu, h)
+			acc = split_acceleration(mc, Qc, cc, ncm, 'close')
+			Vc += (0.5 * h) * acc
+		Q[close], V[close] = Qc, Vc
+
+	Q += (0.5 * dt / pl.mass[c]) * (mass[:nmo] @ V[:nmo])				# jump
+	V += (0.5 * dt) * split_acceleration(mass, Q, crit, nmo, 'far')	# kick (far parts)
+
+	# Back to barycentric coordinates (the centre of mass moves uniformly):
+	xcm += dt * vcm
+	pl.pos[c] = xcm - mass[:nmo] @ Q[:nmo] / mtot
+	pl.vel[c] = vcm - mass[:nmo] @ V[:nmo] / pl.mass[c]
+	pl.pos[others] = Q + pl.pos[c]
+	pl.vel[others] = V + vcm
+	if potential:
+		pl.epot = kernel_potential(pl.kernel, pl.mass, pl.pos, nm)
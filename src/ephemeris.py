@@ -0,0 +1,182 @@
+"""
+Local store of ephemerides (barycentric state vectors from JPL Horizons), interpolated to any epochs.
+
+Every body has a binary log (see 'trajlog') in 'STORE_DIR', with the columns datetime_jd, x, y, z, vx, vy, vz
+[AU, AU/day] on a regular grid of 'STEP' days, sorted by time. A lookup outside the stored span fetches
+the missing days once (extending the span, so it stays contiguous), and every lookup is then served from the
+store: the states at the requested epochs are cubic Hermite interpolations of the neighbouring rows.
+
+The fetcher is injectable: 'fetch(body, start, stop, step)' returns a dataframe of the columns above
+from the Julian Day 'start' to 'stop' (inclusive) every 'step' days. 'horizons_fetcher' queries Horizons
+(astroquery is only needed then), and 'kepler_fetcher' is an offline stand-in, serving Keplerian orbits,
+e.g. to test the store without a connection.
+"""
+import os
+from os import sep
+
+import numpy as np
+import pandas as pd
+
+from trajlog import LogWriter, read_columns, LOG_EXT
+
+STORE_DIR = '.' + sep + 'addendum' + sep + 'ephemeris' + sep
+STEP = 1.0								# Grid of the stored states [days]
+COLUMNS = ['datetime_jd', 'x', 'y', 'z', 'vx', 'vy', 'vz']
+GM_SUN = 2.9591220828559115E-04			# [AU^3 / day^2]
+JD_START = 2415020.5					# Start of the integrations: 1900-01-01 00:00
+HORIZONS_IDS = {'Sun': '10', 'Venus': '299', 'Earth': '399', 'Mars': '499', 'Jupiter': '599',	# Horizons ids of the bodies
+	'Saturn': '699', 'Uranus': '799', 'Neptune': '899', '67P/C-G': '900681'}
+
+
+def horizons_fetcher(body, start, stop, step):
+	""" Barycentric state vectors of the Horizons 'body' (an id, e.g. '599' for Jupiter) from the Julian Day
+	'start' to 'stop' every 'step' days, queried from JPL Horizons.
+	"""
+	from astroquery.jplhorizons import Horizons
+	from astropy.time import Time
+
+	epochs = {'start': Time(start, format = 'jd').iso, 'stop': Time(stop, format = 'jd').iso, 'step': str(int(step)) + 'd'}
+	vec = Horizons(id = body, id_type = 'id', location = '500@0', epochs = epochs).vectors()
+	return vec.to_pandas()[COLUMNS]
+
+
+def kepler_fetcher(elements):
+	""" Offline stand-in of 'horizons_fetcher': Keplerian orbits around the origin in the x, y plane.
+	'elements' maps the bodies to (a [AU], e, perihelion time [JD], argument of perihelion [rad]).
+	Also counts its calls in 'fetch.calls'.
+	"""
+	def fetch(body, start, stop, step):
+		fetch.calls += 1
+		a, e, t_peri, omega = elements[body]
+		jd = start + step * np.arange(round((stop - start) / step) + 1)
+		n = np.sqrt(GM_SUN / a**3)
+		M = n * (jd - t_peri)
+		E = M.copy()
+		for _ in range(50):											# Newton's method on Kepler's equation
+			E -= (E - e*np.sin(E) - M) / (1.0 - e*np.cos(E))
+		x, y = a*(np.cos(E) - e), a*np.sqrt(1.0 - e*e)*np.sin(E)
+		Edot = n / (1.0 - e*np.cos(E))
+		vx, vy = -a*np.sin(E)*Edot, a*np.sqrt(1.0 - e*e)*np.cos(E)*Edot
+		c, s = np.cos(omega), np.sin(omega)
+		return pd.DataFrame({'datetime_jd': jd, 'x': c*x - s*y, 'y': s*x + c*y, 'z': np.zeros_like(jd),
+			'vx': c*vx - s*vy, 'vy': s*vx + c*vy, 'vz': np.zeros_like(jd)})
+
+	fetch.calls = 0
+	return fetch
+
+
+def hermite_positions(x0, v0, x1, v1, dt, s):
+	""" Cubic Hermite interpolation of the positions between (x0, v0) and (x1, v1), 'dt' apart,
+	at the fraction 's' of the step.
+	"""
+	h00 = 2.0*s**3 - 3.0*s**2 + 1.0
+	h10 = s**3 - 2.0*s**2 + s
+	h01 = -2.0*s**3 + 3.0*s**2
+	h11 = s**3 - s**2
+	return h00*x0 + (h10*dt)*v0 + h01*x1 + (h11*dt)*v1
+
+
+def hermite(jd, states, epochs):
+	""" Cubic Hermite interpolation of the (n, 6) position and velocity 'states' at the sorted times 'jd'
+	to the 'epochs' (within the span of 'jd'). Returns an (len(epochs), 6) array.
+	"""
+	i = np.clip(np.searchsorted(jd, epochs, side = 'right') - 1, 0, len(jd) - 2)
+	h = (jd[i + 1] - jd[i])[:, np.newaxis]
+	s = ((epochs - jd[i]) / h[:, 0])[:, np.newaxis]
+	x0, v0, x1, v1 = states[i, :3], states[i, 3:], states[i + 1, :3], states[i + 1, 3:]
+
+	pos = hermite_positions(x0, v0, x1, v1, h, s)
+	vel = (6.0*s**2 - 6.0*s)/h*x0 + (3.0*s**2 - 4.0*s + 1.0)*v0 + (-6.0*s**2 + 6.0*s)/h*x1 + (3.0*s**2 - 2.0*s)*v1
+	return np.hstack((pos, vel))
+
+
+class EphemerisStore:
+	""" Ephemerides of bodies, stored in 'folder', and fetched with 'fetch' (Horizons by default) when missing.
+	The tables are kept in memory once read, so repeated lookups do not touch the disk either.
+	"""
+
+	def __init__(self, folder = STORE_DIR, fetch = horizons_fetcher, step = STEP):
+		self.folder = folder
+		self.fetch = fetch
+		self.step = step
+		self.tables = {}
+
+	def path(self, body):
+		return self.folder + 'body_' + str(body) + LOG_EXT
+
+	def table(self, body):
+		""" The stored times and (n, 6) states of 'body' (empty arrays if nothing is stored).
+		"""
+		if body not in self.tables:
+			if os.path.exists(self.path(body)):
+				_, data = read_columns(self.path(body))
+				self.tables[body] = (data[0], data[1:].T.copy())
+			else:
+				self.tables[body] = (np.zeros(0), np.zeros((0, 6)))
+		return self.tables[body]
+
+	def ensure(self, body, start, stop):
+		""" Makes sure the stored span of 'body' covers the Julian Days 'start' to 'stop',
+		fetching the missing days before and after the stored span, on the grid of the stored rows.
+		"""
+		jd, states = self.table(body)
+		if len(jd) and jd[0] <= start and stop <= jd[-1]:
+			return
+
+		parts = []
+		if len(jd) == 0:
+			parts.append(self.fetch(body, start - self.step, stop + self.step, self.step))
+		else:
+			if start < jd[0]:
+				parts.append(self.fetch(body, jd[0] - self.step * (np.ceil((jd[0] - start) / self.step) + 1),
+					jd[0] - self.step, self.step))
+			if stop > jd[-1]:
+				parts.append(self.fetch(body, jd[-1] + self.step,
+					jd[-1] + self.step * (np.ceil((stop - jd[-1]) / self.step) + 1), self.step))
+
+		fetched = np.vstack([np.asarray(part[COLUMNS], dtype = float) for part in parts])
+		rows = np.vstack((np.column_stack((jd, states)), fetched))
+		rows = rows[np.unique(rows[:, 0], return_index = True)[1]]				# Sorted by time, without repeats
+		self.write(body, rows)
+		self.tables[body] = (rows[:, 0].copy(), rows[:, 1:].copy())
+
+	def write(self, body, rows):
+		""" Rewrites the log of 'body' with 'rows', atomically.
+		"""
+		os.makedirs(self.folder, exist_ok = True)
+		temp = self.path(body) + '.tmp'
+		with LogWriter(temp, COLUMNS, {'body': body, 'step': self.step}) as writer:
+			writer.write_rows(rows)
+		os.replace(temp, self.path(body))
+
+	def states(self, body, epochs):
+		""" States (x, y, z, vx, vy, vz) of 'body' at the Julian Days 'epochs', as an (len(epochs), 6) array.
+		"""
+		epochs = np.asarray(epochs, dtype = float)
+		self.ensure(body, epochs.min(), epochs.max())
+		jd, states = self.table(body)
+		return hermite(jd, states, epochs)
+
+	def stored(self, body, epochs):
+		""" The 'epochs' within the stored span of 'body', without fetching anything.
+		"""
+		jd, _ = self.table(body)
+		epochs = np.asarray(epochs, dtype = float)
+		if len(jd) == 0:
+			return epochs[:0]
+		return epochs[(epochs >= jd[0]) & (epochs <= jd[-1])]
+
+	def dataframe(self, body, epochs, fetch = True):
+		""" States of 'body' at the Julian Days 'epochs' as a dataframe of the columns of Horizons' vectors
+		(datetime_jd, x, y, z, vx, vy, vz). Without 'fetch', only the epochs within the stored span are served.
+		"""
+		epochs = np.asarray(epochs, dtype = float)
+		if not fetch:
+			epochs = self.stored(body, epochs)
+			if len(epochs) == 0:
+				return pd.DataFrame({column: [] for column in COLUMNS})
+			jd, states = self.table(body)
+			values = hermite(jd, states, epochs)
+		else:
+			values = self.states(body, epochs)
+		return pd.DataFrame(dict(zip(COLUMNS, np.column_stack((epochs, values)).T)))
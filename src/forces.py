@@ -0,0 +1,185 @@
+"""
+Vectorized gravitational force kernels.
+Bodies are stored as a structure of arrays: masses in an (N,) array,
+positions and accelerations in contiguous (N, 3) arrays.
+"""
+from functools import partial
+import warnings
+
+import numpy as np
+
+G = 1.487856e-34	# [AU^3*d^-2*kg^-1]
+BACKENDS = ('direct', 'tree', 'jit')
+TEST_CHUNK = 4096		# Test particles handled in one broadcast (bounds the memory of the pass)
+PAIR_CHUNK = 2**21		# Pairs handled in one broadcast by the direct sum (bounds its memory at large N)
+
+
+def acceleration(mass, pos, out = None, potential = False, n_massive = None):
+	""" Calculates the newtonian acceleration of every body in 'pos' caused by all the others,
+	evaluating every pair in one broadcast instead of a per-pair loop.
+	'mass' is an (N,) array, 'pos' is an (..., N, 3) array; leading axes are carried along.
+	The result is written into 'out' if given, and returned.
+	With 'potential', the potential energy of the bodies is calculated from the same pairwise distances,
+	and '(acc, U)' is returned.
+	With 'n_massive', only the first 'n_massive' bodies attract, the rest are test particles:
+	the cost is O(Nm^2 + Nt*Nm) instead of O(N^2), and 'U' is the potential energy of the massive bodies.
+	More than 'PAIR_CHUNK' pairs are handled in chunks of rows (see 'direct_rows'), so the direct sum
+	also runs (e.g. as the reference of the tree code) for large N.
+	"""
+	n = pos.shape[-2]
+	if n_massive is not None and n_massive < n:
+		return test_particles(mass, pos, out, potential, n_massive)
+	if n * n * int(np.prod(pos.shape[:-2])) > PAIR_CHUNK:
+		return direct_rows(mass, pos, out, potential)
+
+	# Separation vectors: dist[..., i, j] = r_j - r_i
+	dist = pos[..., np.newaxis, :, :] - pos[..., :, np.newaxis, :]
+	r2 = np.einsum('...k,...k->...', dist, dist)
+
+	# No self-interaction: the diagonal is masked out before the division.
+	diag = np.arange(n)
+	r2[..., diag, diag] = 1.0
+	inv_r3 = r2 ** -1.5
+	inv_r3[..., diag, diag] = 0.0
+	
+	if potential:
+		inv_r = inv_r3 * r2
+		U = 0.5 * G * np.einsum('...ij,i,j->...', inv_r, mass, mass)		# Every pair counted twice
+	
+	inv_r3 *= G * mass
+	acc = np.einsum('...ij,...ijk->...ik', inv_r3, dist, out = out)
+
+	return (acc, U) if potential else acc
+
+
+def direct_rows(mass, pos, out, potential):
+	""" 'acceleration' of every body by the direct sum, for chunks of rows (the attracted bodies) at a time,
+	each chunk broadcast against every body, so at most about 'PAIR_CHUNK' pairs are held at once.
+	"""
+	n = pos.shape[-2]
+	if out is None:
+		out = np.empty(pos.shape)
+	U = 0.0
+	gm = G * mass
+	rows = max(1, PAIR_CHUNK // (n * int(np.prod(pos.shape[:-2]))))
+	for a in range(0, n, rows):
+		b = min(a + rows, n)
+		dist = pos[..., np.newaxis, :, :] - pos[..., a:b, np.newaxis, :]		# dist[..., i, j] = r_j - r_(a+i)
+		r2 = np.einsum('...k,...k->...', dist, dist)
+		own = np.arange(b - a)
+		r2[..., own, a + own] = 1.0
+		inv_r3 = r2 ** -1.5
+		inv_r3[..., own, a + own] = 0.0
+		if potential:
+			U = U + 0.5 * G * np.einsum('...ij,i,j->...', inv_r3 * r2, mass[a:b], mass)	# Every pair counted twice
+		inv_r3 *= gm
+		np.einsum('...ij,...ijk->...ik', inv_r3, dist, out = out[..., a:b, :])
+	return (out, U) if potential else out
+
+
+def test_particles(mass, pos, out, potential, n_massive):
+	""" 'acceleration' of 'n_massive' massive bodies followed by test particles:
+	the massive bodies attract each other, and the test particles, in chunks of 'TEST_CHUNK'.
+	"""
+	n = pos.shape[-2]
+	if out is None:
+		out = np.empty(pos.shape)
+	result = acceleration(mass[:n_massive], pos[..., :n_massive, :], out = out[..., :n_massive, :], potential = potential)
+
+	source = pos[..., np.newaxis, :n_massive, :]
+	gm = G * mass[:n_massive]
+	for a in range(n_massive, n, TEST_CHUNK):
+		b = min(a + TEST_CHUNK, n)
+		dist = source - pos[..., a:b, np.newaxis, :]						# dist[..., i, j] = r_j - r_i
+		inv_r3 = np.einsum('...k,...k->...', dist, dist) ** -1.5
+		inv_r3 *= gm
+		np.einsum('...ij,...ijk->...ik', inv_r3, dist, out = out[..., a:b, :])
+
+	return (out, result[1]) if potential else out
+
+
+def acceleration_jerk(mass, pos, vel, targets = None, n_massive = None):
+	""" Acceleration and jerk (its time derivative) of the bodies 'targets' (indices, all by default)
+	caused by the first 'n_massive' bodies (all by default), for the Hermite integrator.
+	'pos' and 'vel' are (N, 3) arrays. Returns two (len(targets), 3) arrays.
+	"""
+	n = len(pos)
+	nm = n if n_massive is None else n_massive
+	targets = np.arange(n) if targets is None else targets
+
+	dr = pos[np.newaxis, :nm, :] - pos[targets, np.newaxis, :]			# dr[i, j] = r_j - r_i
+	dv = vel[np.newaxis, :nm, :] - vel[targets, np.newaxis, :]
+	r2 = np.einsum('...k,...k->...', dr, dr)
+
+	# No self-interaction:
+	own = targets[:, np.newaxis] == np.arange(nm)
+	r2[own] = 1.0
+	inv_r3 = r2 ** -1.5
+	inv_r3[own] = 0.0
+	inv_r3 *= G * mass[:nm]
+	rv = 3.0 * np.einsum('...k,...k->...', dr, dv) / r2
+
+	acc = np.einsum('ij,ijk->ik', inv_r3, dr)
+	jerk = np.einsum('ij,ijk->ik', inv_r3, dv) - np.einsum('ij,ijk->ik', inv_r3 * rv, dr)
+	return acc, jerk
+
+
+def kinetic(mass, vel):
+	""" Kinetic energy of the bodies moving with 'vel'; leading axes are carried along.
+	"""
+	return 0.5 * np.einsum('i,...ik,...ik->...', mass, vel, vel)
+
+
+def potential(mass, pos):
+	""" Potential energy (as a positive number) of the bodies at 'pos', by a separate pass over every pair;
+	leading axes are carried along.
+	"""
+	n = pos.shape[-2]
+	i, j = np.triu_indices(n, 1)											# Every pair once
+	dist = pos[..., j, :] - pos[..., i, :]
+	r = np.sqrt(np.einsum('...k,...k->...', dist, dist))
+	return G * np.sum(mass[i] * mass[j] / r, axis = -1)
+
+
+def energy(mass, pos, vel):
+	""" Total energy (kinetic - potential) of the bodies at 'pos' moving with 'vel'.
+	Leading axes of 'pos' and 'vel' are carried along, giving one energy per snapshot.
+	"""
+	return kinetic(mass, vel) - potential(mass, pos)
+
+
+def kernel(backend = 'direct', **options):
+	""" The acceleration kernel of 'backend': 'direct' is 'acceleration' (every pair, exact),
+	'tree' is the Barnes-Hut 'octree.acceleration', with its 'options' (e.g. 'theta', 'leaf_size') bound,
+	'jit' is the Numba-compiled 'jit.acceleration', or 'acceleration' if Numba is not installed.
+	Every kernel has the signature 'kernel(mass, pos, out = None, potential = False, n_massive = None)'.
+	"""
+	if backend == 'direct':
+		return acceleration
+	if backend == 'tree':
+		import octree
+		return partial(octree.acceleration, **options)
+	if backend == 'jit':
+		import jit
+		if not jit.AVAILABLE:
+			warnings.warn('Numba is not installed: using the NumPy force kernel.')
+			return acceleration
+		return jit.acceleration
+	raise ValueError('Unknown force backend: ' + str(backend) + '. Choose from ' + str(BACKENDS) + '.')
+
+
+def kernel_potential(kernel, mass, pos, n_massive = None):
+	""" Potential energy (as a positive number) of the bodies at 'pos', consistent with 'kernel':
+	a separate pass over every pair for the direct kernel, the kernel's own estimate otherwise.
+	With 'n_massive', only the first 'n_massive' (massive) bodies count. Leading axes are carried along.
+	"""
+	if n_massive is not None:
+		mass, pos = mass[:n_massive], pos[..., :n_massive, :]
+	if kernel is acceleration:
+		return potential(mass, pos)
+	import jit
+	if kernel is jit.acceleration:
+		return jit.potential(mass, pos)
+	if pos.ndim == 2:
+		return kernel(mass, pos, potential = True)[1]
+	return np.array([kernel_potential(kernel, mass, p) for p in pos])
@@ -3,46 +3,142 @@ import os
 from os import sep
 
 import numpy as np
-from numpy.linalg import norm
 import pandas as pd
 
-G = 1.487856e-34	# [AU^3*d^-2*kg^-1]
+from forces import acceleration, kernel, kernel_potential, kinetic
+from trajlog import LogWriter, AsyncLogSink
 
 class Planet:
 	""" An object with name, mass, pos, vel, acc, frc.
-	The force(self, other) function calculates
-	newtonian gravitational force applied upon this object by the 'other'.
+	Once bound to a System, 'pos', 'vel' and 'acc' are views into the System's arrays:
+	assigning to them writes the values in place, without rebinding.
 	"""
+	__slots__ = ('name', 'mass', 'pos_init', 'vel_init', '_pos', '_vel', '_acc')
 	
 	def __init__(self, name, mass):
 		self.name = name
 		self.mass = mass
-		self.pos = np.array([])
 		self.pos_init = np.array([])
-		self.vel = np.array([])
 		self.vel_init = np.array([])
-		self.acc = np.array([0.,0.,0.])
-		self.acc_temp = np.array([0.,0.,0.])
-		self.frc = np.array([0.,0.,0.])
+		self._pos = np.zeros(3)
+		self._vel = np.zeros(3)
+		self._acc = np.zeros(3)
 		
-	def force(self, other):
+	@property
+	def pos(self):
+		return self._pos
+		
+	@pos.setter
+	def pos(self, value):
+		self._pos[...] = value
+		
+	@property
+	def vel(self):
+		return self._vel
+		
+	@vel.setter
+	def vel(self, value):
+		self._vel[...] = value
+		
+	@property
+	def acc(self):
+		return self._acc
+		
+	@acc.setter
+	def acc(self, value):
+		self._acc[...] = value
+		
+	@property
+	def frc(self):
+		return self.mass * self._acc
+		
+	def bind(self, pos, vel, acc):
+		""" Makes 'pos', 'vel' and 'acc' views of the given rows, keeping their current values.
+		"""
+		pos[...] = self._pos
+		vel[...] = self._vel
+		acc[...] = self._acc
+		self._pos, self._vel, self._acc = pos, vel, acc
+		
+		
+class System(list):
+	""" A list of Planet objects which also owns their state.
+	'state' is the (2N, 3) state vector 'u = [r1, ..., rN, v1, ..., vN]', 'pos' and 'vel' are its two halves,
+	'acc' holds the (N, 3) accelerations and 'mass' the (N,) masses.
+	The Planets' pos/vel/acc are row views into these arrays, so the integrators can work on
+	the arrays directly, and the Planet API sees the same values without any copying.
+	If 'state' and 'acc' are given, the System uses them as its storage instead of allocating its own.
+	'kernel' is the acceleration kernel of the System (see 'forces.kernel'), the direct sum by default.
+	The first 'n_massive' bodies (all by default) are massive, the rest are test particles:
+	they feel the massive bodies, but do not attract anything, and their energy is not part of the total.
+	"""
+	
+	def __init__(self, planets = (), state = None, acc = None, kernel = acceleration, n_massive = None):
+		super().__init__(planets)
+		N = len(self)
+		self.mass = np.array([planet.mass for planet in self], dtype = float)
+		self.state = np.zeros((2*N, 3)) if state is None else state
+		self.pos = self.state[:N]
+		self.vel = self.state[N:]
+		self.acc = np.zeros((N, 3)) if acc is None else acc
+		self.acc_temp = np.zeros((N, 3))
+		self.epot = None						# Potential energy from the last force evaluation that asked for it
+		self.kernel = kernel
+		self.n_massive = N if n_massive is None else n_massive
+		
+		for i in range(N):
+			self[i].bind(self.pos[i], self.vel[i], self.acc[i])
+			
+			
+class Ensemble:
+	""" 'B' copies (members) of a System, integrated together in one vectorized pass.
+	Same layout as a System with a leading batch axis: 'state' is (B, 2N, 3), 'pos', 'vel', 'acc' are (B, N, 3),
+	and the masses are shared. 'members[b]' is a System viewing the arrays of member 'b',
+	e.g. for logging. The integrators take 'dt' as a (B, 1, 1) array, so every member can have its own timestep.
+	"""
 	
-		mass_product = self.mass * other.mass
-		distance = other.pos - self.pos
+	def __init__(self, planets, B):
+		N = len(planets)
+		self.mass = planets.mass.copy()
+		self.state = np.repeat(planets.state[np.newaxis], B, axis = 0)
+		self.pos = self.state[:, :N]
+		self.vel = self.state[:, N:]
+		self.acc = np.repeat(planets.acc[np.newaxis], B, axis = 0)
+		self.acc_temp = np.zeros((B, N, 3))
+		self.epot = None
+		self.kernel = planets.kernel
+		self.n_massive = planets.n_massive
 		
-		fr = G * mass_product * distance / (norm(distance)**3)
-		return fr
+		self.members = []
+		for b in range(B):
+			copies = []
+			for planet in planets:
+				copy = Planet(planet.name, planet.mass)
+				copy.pos_init, copy.vel_init = planet.pos_init, planet.vel_init
+				copy.pos, copy.vel, copy.acc = planet.pos, planet.vel, planet.acc
+				copies.append(copy)
+			self.members.append(System(copies, self.state[b], self.acc[b], planets.kernel, planets.n_massive))
+			
+	def __len__(self):
+		return len(self.mass)
 		
 		
-def SolarSystem_init(init_file_path, inbb, cg):
+def SolarSystem_init(init_file_path, inbb, cg, extra = (), backend = 'direct', test_mass = 0.0, **options):
 	""" This function reads a csv file containing the Names, Masses,
 	initial positions and velocities of the planets, and stores them in
-	a list of planet objects called 'planets', which it returns.
+	a System (a list of planet objects) called 'planets', which it returns.
 	Also receives a flag 'inbb', which is True, if it should include the inner planets (except Mercury),
 	and False if not.
+	'extra' lists further csv files of the same format (e.g. minor bodies), whose bodies are all included.
+	'backend' and its 'options' select the acceleration kernel of the System (see 'forces.kernel'),
+	e.g. backend = 'tree' with theta = 0.5 for large numbers of bodies.
+	Bodies lighter than 'test_mass' [kg] (e.g. comets and asteroids) are test particles, placed after the massive ones.
 	"""
 	
 	df_start = pd.read_csv(init_file_path, skipinitialspace = True, float_precision = 'high')
+	if extra:
+		df_start = pd.concat([df_start] + [pd.read_csv(path, skipinitialspace = True, float_precision = 'high')
+			for path in extra], ignore_index = True)
 	planets = []
 	inner_planets = ['Venus', 'Earth', 'Mars']
 	
@@ -64,106 +160,188 @@ def SolarSystem_init(init_file_path, inbb, cg):
 		planet.vel = planet.vel_init
 		
 		planets.append(planet)
-		
-	return planets
+	
+	massive = [planet for planet in planets if planet.mass >= test_mass]
+	test = [planet for planet in planets if planet.mass < test_mass]
+	
+	return System(massive + test, kernel = kernel(backend, **options), n_massive = len(massive))
 
 	
-def Acceleration(N, planets):
-	""" Calculates the applied resultant force on 'N' 'planets' by all the others.
-	Then calculates acceleration as well.
+def Acceleration(N, planets, potential = False):
+	""" Calculates the acceleration of 'N' 'planets' caused by all the others.
+	On a System (or an Ensemble) its vectorized kernel ('forces.acceleration' by default) writes straight into its 'acc' array.
+	With 'potential', the potential energy at the current positions is calculated in the same pass,
+	and stored in its 'epot'.
+	A plain list of Planets is handled by a thin adapter: the positions are gathered
+	into an (N, 3) array, and the results are scattered back onto the Planet objects.
 	"""
+	if isinstance(planets, (System, Ensemble)):
+		if potential:
+			_, planets.epot = planets.kernel(planets.mass, planets.pos, out = planets.acc, potential = True,
+				n_massive = planets.n_massive)
+		else:
+			planets.kernel(planets.mass, planets.pos, out = planets.acc, n_massive = planets.n_massive)
+		return
 	
-	# Redrawing the forcematrix every time:
-	Fmat = [[[0.0] for x in range(N)] for x in range(N)]
+	mass = np.array([planets[i].mass for i in range(N)])
+	pos = np.array([planets[i].pos for i in range(N)])
+	acc = acceleration(mass, pos)
 	
 	for i in range(N):
-		j = i+1
-		planets[i].frc = np.array([0.,0.,0.])				
-	
-		# Forcematrix:
-		while j < N:
-			Fmat[i][j] = planets[i].force(planets[j])
-			Fmat[j][i] = (-1) * Fmat[i][j]
-			j += 1
-		
-		# Resultant force:
-		for k in range(N):
-			planets[i].frc += Fmat[i][k]					
-		
-		# Calculating acceleration:
-		planets[i].acc = planets[i].frc / planets[i].mass
+		planets[i].acc = acc[i]
 
 
-def Euler(N, pl, dt):
+def Euler(N, pl, dt, potential = False):
 	""" One round of Euler integration for N planets, using a fixed dt timestep.
 	Putting the acceleration update between the pos and vel updates creates the Euler-Cromer method,
 	which is a much more stable alternative.
+	'pl.acc' must hold the acceleration at the start, as for Verlet; the acceleration at the new positions
+	is left in it for the next step. With 'potential', the potential energy at the new positions is left in 'pl.epot'.
+	'pl' is a System (or an Ensemble): the update is done on its arrays in place.
 	"""
 	
-	Acceleration(N, pl)									# acceleration update
+	pl.pos += dt * pl.vel								# position update
+	pl.vel += dt * pl.acc								# velocity update
 	
-	for i in range(N):
-		pl[i].pos = pl[i].pos + dt * pl[i].vel			# position update
-		pl[i].vel = pl[i].vel + dt * pl[i].acc			# velocity update
+	Acceleration(N, pl, potential)						# acceleration update, for the next step
 
 
-def Verlet(N, pl, dt):
+def Verlet(N, pl, dt, potential = False):
 	""" Does one round of Verlet integration from initial r, v, a of 'N' number of planets,
-	using 'pl' as a list of planet objects, and using a 'dt' timestep.
+	using 'pl' as a System of planet objects (or an Ensemble), and using a 'dt' timestep.
+	With 'potential', the potential energy at the new positions is left in 'pl.epot' (for logging).
 	"""
 	
 	# Update r using acc(t) for all planets:
-	for i in range(N):
-		pl[i].pos = pl[i].pos + pl[i].vel * dt + 0.5 * pl[i].acc * dt**2
-		# Store acc(t) in temp:
-		pl[i].acc_temp = pl[i].acc
+	pl.pos += pl.vel * dt + 0.5 * pl.acc * dt**2
+	# Store acc(t) in temp:
+	np.copyto(pl.acc_temp, pl.acc)
 		
 	# Calculate acc(t+1):
-	Acceleration(N, pl)
+	Acceleration(N, pl, potential)
 	
 	# Calculate v(t+1) using temp + acc(t+1):
-	for i in range(N):
-		pl[i].vel = pl[i].vel + 0.5 * (pl[i].acc_temp + pl[i].acc) * dt
+	pl.vel += 0.5 * (pl.acc_temp + pl.acc) * dt
 
 
-def RK4(u, dudt, n, t, dt, derivs, planets):
+# Weights of the leapfrog substeps of Yoshida's symmetric composition methods:
+YOSHIDA4 = np.array([1.0, -2.0**(1.0/3.0), 1.0]) / (2.0 - 2.0**(1.0/3.0))	# 4th order, "triple jump"
+_Y6 = np.array([0.784513610477560, 0.235573213359357, -1.17767998417887])		# 6th order, solution A
+YOSHIDA6 = np.concatenate((_Y6, [1.0 - 2.0*_Y6.sum()], _Y6[::-1]))
 
-	a21 = (1.0 / 2.0)
-	a31 = 0
-	a32 = (1.0 / 2.0)
-	a41 = 0
-	a42 = 0
-	a43 = 1.0
-	
-	c2 = (1.0 / 2.0)
-	c3 = (1.0 / 2.0)
-	c4 = 1.0
-	
-	b1 = (1.0 / 6.0)
-	b2 = (1.0 / 3.0)
-	b3 = (1.0 / 3.0)
-	b4 = (1.0 / 6.0)
+
+def Leapfrog(N, pl, dt, potential = False):
+	""" One round of kick-drift-kick leapfrog (velocity Verlet) integration of the 'N' planets of 'pl' over 'dt':
+	half a kick with acc(t), a drift with the new velocities, and half a kick with acc(t+dt).
+	One force evaluation per step, whose result is reused by the next step: 'pl.acc' must hold
+	the acceleration at the start, as for Verlet. With 'potential', the potential energy at the new positions
+	is left in 'pl.epot'. 'pl' is a System (or an Ensemble, with a (B, 1, 1) 'dt').
+	"""
+	pl.vel += (0.5 * dt) * pl.acc							# kick
+	pl.pos += dt * pl.vel									# drift
+	Acceleration(N, pl, potential)
+	pl.vel += (0.5 * dt) * pl.acc							# kick
+
+
+def Composition(N, pl, dt, weights, potential = False):
+	""" One step of a symmetric composition method: leapfrog substeps of 'weights[i] * dt' in a row,
+	where the closing half kick of a substep and the opening half kick of the next one are merged.
+	One force evaluation per substep, otherwise the same as Leapfrog.
+	"""
+	kick = 0.5 * weights[0]
+	for i in range(len(weights)):
+		pl.vel += (kick * dt) * pl.acc						# kick
+		pl.pos += (weights[i] * dt) * pl.vel				# drift
+		Acceleration(N, pl, potential and i == len(weights) - 1)
+		kick = 0.5 * (weights[i] + (weights[i + 1] if i + 1 < len(weights) else 0.0))
+	pl.vel += (kick * dt) * pl.acc							# closing kick
+
+
+def Yoshida4(N, pl, dt, potential = False):
+	""" One step of Yoshida's 4th order symplectic integrator: 3 leapfrog substeps.
+	"""
+	Composition(N, pl, dt, YOSHIDA4, potential)
+
+
+def Yoshida6(N, pl, dt, potential = False):
+	""" One step of Yoshida's 6th order symplectic integrator: 7 leapfrog substeps.
+	"""
+	Composition(N, pl, dt, YOSHIDA6, potential)
+
+
+SYMPLECTIC = {'Leapfrog': Leapfrog, 'Yoshida4': Yoshida4, 'Yoshida6': Yoshida6}
+
+
+class StageBuffers:
+	""" Work arrays of an explicit Runge-Kutta stepper with 'stages' stages on an (n, 3) state,
+	allocated once per run and reused on every step. For an Ensemble, 'batch' = (B,) adds the leading batch axis.
+	'K' holds the stage derivatives (K[0] = dudt), 'utemp' the current stage state,
+	'uold' the state at the start of the step, 'unew' the incremented state, 'error' the local error estimate,
+	'scaled' and 'uscale' the scaled errors and scales, and 'norms' the row norms of 'scaled'.
+	'combine' is the stage combination of the steppers: with 'compiled' (and Numba installed)
+	the compiled 'jit.stage_state' for a single state, otherwise 'stage_state'.
+	"""
 	
-	K2, K3, K4 = [np.array([]) for _ in range(3)]	
-	utemp = [np.array([]) for _ in range(n)]
-	unew = [np.array([]) for _ in range(n)]
+	def __init__(self, n, stages, batch = (), compiled = False):
+		shape = tuple(batch) + (n, 3)
+		self.K = np.zeros((stages,) + shape)
+		self.dudt = self.K[0]
+		self.utemp = np.zeros(shape)
+		self.uold = np.zeros(shape)
+		self.unew = np.zeros(shape)
+		self.error = np.zeros(shape)
+		self.scaled = np.zeros(shape)
+		self.uscale = np.zeros(shape)
+		self.norms = np.zeros(shape[:-1])
+		self.combine = stage_state
+		if compiled and not batch:
+			import jit
+			if jit.AVAILABLE:
+				self.combine = jit.stage_state
+
+
+def stage_state(u, h, coeffs, K, out):
+	""" Combines the stages in place: 'out = u + h * sum(coeffs[j] * K[j])',
+	as a single contraction over the stage axis of 'K'.
+	"""
+	np.einsum('s,s...->...', coeffs, K, out = out)
+	out *= h
+	out += u
+	return out
+
+
+# "Classical" Runge-Kutta 4 tableau:
+RK4_A = np.array([
+	[0.0, 0.0, 0.0],
+	[1.0/2.0, 0.0, 0.0],
+	[0.0, 1.0/2.0, 0.0],
+	[0.0, 0.0, 1.0]])
+RK4_B = np.array([1.0/6.0, 1.0/3.0, 1.0/3.0, 1.0/6.0])
+RK4_C = np.array([0.0, 1.0/2.0, 1.0/2.0, 1.0])
+
+
+def RK4(u, dudt, n, t, dt, derivs, planets, work = None):
+	""" One step of "classical" Runge-Kutta 4 integration of the 'n' rows of state 'u' over 'dt',
+	'dudt' being the derivatives at 't'. The stages are kept in the preallocated buffers of 'work'
+	(a StageBuffers with 4 stages), and 'u' is incremented in place and returned.
+	With a leading batch axis on 'u', 'dt' can be a (B, 1, 1) array of timesteps.
+	"""
+	if work is None:
+		work = StageBuffers(n, 4)
+	K = work.K
 	
-	for i in range(n):					  # First step
-		utemp[i] = u[i] + dt*a21*dudt[i]
-	K2 = derivs(t + c2*dt, utemp, planets)	# Second step; Array!
+	if dudt is not work.dudt:
+		np.copyto(work.dudt, dudt)						# First step
 	
-	for i in range(n):						
-		utemp[i] = u[i] + dt*(a31*dudt[i] + a32*K2[i])
-	K3 = derivs(t + c3*dt, utemp, planets)	# Third step
+	for s in range(1, 4):								# Second to fourth step
+		work.combine(u, dt, RK4_A[s, :s], K[:s], work.utemp)
+		derivs(t + RK4_C[s]*dt, work.utemp, planets, out = K[s])
 	
-	for i in range(n):
-		utemp[i] = u[i] + dt*(a41*dudt[i] + a42*K2[i] + a43*K3[i])
-	K4 = derivs(t + c4*dt, utemp, planets)	# Fourth step
+	np.einsum('s,s...->...', RK4_B, K, out = work.unew)	# Accumulate increments
+	work.unew *= dt
+	u += work.unew
 	
-	for i in range(n):						
-		unew[i] = u[i] + dt*(b1*dudt[i] + b2*K2[i] + b3*K3[i] + b4*K4[i])			# Accumulate increments
-		
-	return unew
+	return u
 
 
 def Reset(planets, T, step):
@@ -173,49 +351,72 @@ def Reset(planets, T, step):
 	return 0, 0
 	
 	
-def total_energy(N, planets):
+def total_energy(N, planets, epot = None):
 	""" Calculates total energy of the system of N planets
 	by calculating Kinetic energy K, and Potential energy U.
+	If the potential energy at the current positions is already known from the force evaluation ('epot'),
+	it is used instead of a second pass over every pair. Test particles are left out.
 	"""
+	Nm = planets.n_massive
 	
-	K = 0
-	U = 0
-	
-	for i in range(N):
-		K += 0.5 * planets[i].mass * (norm(planets[i].vel))**2
-	
-	for i in range(N-1):
-		for j in range(i+1, N):
-			U += (G * planets[i].mass * planets[j].mass) / norm(planets[j].pos - planets[i].pos)
+	K = kinetic(planets.mass[:Nm], planets.vel[..., :Nm, :])
+	U = kernel_potential(planets.kernel, planets.mass, planets.pos, Nm) if epot is None else epot
 
 	E = K - U
 	return E
 
 
-def log_data(file, step, T, N, planets):
+def open_log(filename, planets, method, step, extra = (), compress = False, background = False, mode = 'w'):
+	""" Opens the binary log of a run of 'method' with timestep/tolerance 'step'.
+	Its columns are Step, T, Etot, the 'extra' columns, and the x,y,z coordinates of all the objects.
+	With 'background', the log is an AsyncLogSink: the loggers only copy the raw state into its ring buffer,
+	and the total energy is computed and the rows are written by its background thread.
+	With mode = 'a', an existing log (e.g. of a resumed run) is appended to.
+	"""
+	columns = ['Step', 'T', 'Etot'] + list(extra)
+	for planet in planets:
+		columns += [planet.name + 'X', planet.name + 'Y', planet.name + 'Z']
+	meta = {'bodies': [planet.name for planet in planets], 'method': method, 'step': step}
+	writer = LogWriter(filename, columns, meta, compress, mode = mode)
+	
+	if not background:
+		return writer
+	
+	N = len(planets)
+	mass = planets.mass.copy()
+	force = planets.kernel
+	Nm = planets.n_massive
+	ne = len(extra)
+	
+	def derive(raw):
+		# Raw snapshots are [Step, T, potential energy (NaN if unknown), extra..., state]:
+		state = raw[:, 3 + ne:].reshape(len(raw), 2*N, 3)
+		U = raw[:, 2].copy()
+		missing = np.isnan(U)
+		if missing.any():
+			U[missing] = kernel_potential(force, mass, state[missing, :N], Nm)
+		Etot = kinetic(mass[:Nm], state[:, N:N + Nm]) - U
+		return np.column_stack((raw[:, :2], Etot, raw[:, 3:3 + ne], state[:, :N].reshape(len(raw), 3*N)))
+	
+	return AsyncLogSink(writer, 3 + ne + 6*N, derive)
+	
+
+def log_data(file, step, T, N, planets, epot = None):
 	""" This function logs the current time T, the total energy of the system,
-	and the x,y,z coordinates of all the objects.
+	and the x,y,z coordinates of all the objects, as one row of the binary log 'file'.
+	'epot' is the potential energy at the current positions, if the force evaluation already calculated it.
 	"""
+	if isinstance(file, AsyncLogSink):
+		file.append(step, T, np.nan if epot is None else epot, planets.state)	# Energy is derived in the background
+		return
 
-	Etot = total_energy(N, planets)
-	
-	if T == 0:
-		file.write('Step T Etot ')
-		for i in range(N):
-			file.write(planets[i].name + 'X ' + planets[i].name + 'Y ' + planets[i].name + 'Z ')
-		file.write('\n' + str(step) + ' ' + str(T) + ' ' + str(Etot) + ' ')
-		for i in range(N):
-			for j in range(3):
-				file.write(str(planets[i].pos[j]) + ' ')
-	else:
-		file.write('\n' + str(step) + ' ' + str(T) + ' ' + str(Etot) + ' ')
-		for i in range(N):
-			for j in range(3):
-				file.write(str(planets[i].pos[j]) + ' ')
+	Etot = total_energy(N, planets, epot)
+	file.append(step, T, Etot, planets.pos)
 
 				
 def clear_logs():
 	""" A function that prompts the user whether to clear library of previous logs.
+	The stored results of the runs (see 'sweep.run_key') are kept.
 	Returns 
 	1 if the answer is yes,
 	0 if the answer is no.
@@ -229,6 +430,14 @@ def clear_logs():
 		os.remove('.' + sep + 'logs' + sep + 'CPUlogs.csv')
 		for path in iglob('.' + sep + 'logs' + sep + 'RKDP_ERRS_*'):
 			os.remove(path)
+		for path in iglob('.' + sep + 'logs' + sep + 'RKDP_STATS_*'):
+			os.remove(path)
+		for path in iglob('.' + sep + 'logs' + sep + 'H_STATS_*'):
+			os.remove(path)
+		for path in iglob('.' + sep + 'logs' + sep + 'checkpoint_*'):
+			os.remove(path)
+		for path in iglob('.' + sep + 'logs' + sep + 'analytics' + sep + '*.npz'):
+			os.remove(path)
 		print("Library cleared.\n")
 		return 1
 		
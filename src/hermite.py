@@ -0,0 +1,129 @@
+"""
+Fourth order Hermite predictor-corrector integration with individual block timesteps.
+
+Every body has its own timestep, a power-of-two fraction 'dtmax / 2^level' of the largest timestep 'dtmax',
+chosen by Aarseth's criterion from its acceleration and its derivatives. A body's time is always a multiple
+of its timestep, so the bodies due at the same time form a block: on every step only the block is
+corrected, and the forces are only calculated on its members, from the predicted positions and velocities
+of everyone. Slow bodies (e.g. Neptune) take far fewer steps than fast ones (e.g. 67P/C-G at perihelion).
+Times are counted in integer ticks of 'dtmax / 2^MAX_LEVEL', so the blocks line up exactly.
+
+References: Makino & Aarseth (1992), PASJ 44, 141; Aarseth: Gravitational N-Body Simulations (2003).
+"""
+from timeit import default_timer as timer
+
+import numpy as np
+
+from forces import acceleration_jerk
+from functions import open_log, log_data
+from checkpoint import restore
+
+ETA = 0.005							# Accuracy parameter of the timestep criterion (planetary orbits need a small one)
+ETA_START = 0.005					# Accuracy parameter of the starting timesteps
+MAX_LEVEL = 30						# Smallest timestep: dtmax / 2^MAX_LEVEL
+
+
+def row_norm(a):
+	return np.sqrt(np.einsum('ik,ik->i', a, a))
+
+
+def block_level(dt, dtmax):
+	""" Level of the largest power-of-two fraction of 'dtmax' not larger than 'dt'.
+	"""
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		level = np.ceil(np.log2(dtmax / dt))
+	level = np.nan_to_num(level, nan = 0.0, posinf = MAX_LEVEL, neginf = 0.0)
+	return np.clip(level, 0, MAX_LEVEL).astype(np.int64)
+
+
+def aarseth(acc, jerk, snap, crackle, eta = ETA):
+	""" Aarseth's timestep criterion from the acceleration and its first three derivatives.
+	"""
+	a, j, s, c = row_norm(acc), row_norm(jerk), row_norm(snap), row_norm(crackle)
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		return np.sqrt(eta * (a*s + j*j) / (j*c + s*s))
+
+
+def Hermite(Ttot, planets, dtmax, filename, log_every, compress = False, background = False, checkpoint = None,
+		resume = False):
+	""" Integrates 'planets' over 'Ttot' days with Hermite block timesteps of at most 'dtmax' days,
+	logging into 'filename' every 'log_every' days (a multiple of 'dtmax', where every body is synchronized).
+	'Ttot' should be a multiple of 'dtmax' as well, so that the run ends with the bodies synchronized.
+	With a Checkpointer 'checkpoint', the run is checkpointed at the logged times (when it is due) and at its end,
+	together with the accelerations, jerks and timestep levels of the bodies. With 'resume', it continues
+	from its checkpoint (if there is one of the same run, see Checkpointer.load), appending to its log.
+	Returns the CPU time of the integration (including the time before the checkpoint),
+	and the number of force evaluations on single bodies.
+	"""
+	N = len(planets)
+	nm = planets.n_massive
+	mass = planets.mass
+	x, v = planets.pos, planets.vel					# Corrected positions and velocities at the bodies' own times
+	tick = dtmax / 2**MAX_LEVEL
+	t_end = round(Ttot / tick)
+	t_log = round(log_every / tick)
+
+	saved = checkpoint.load(Ttot) if resume and checkpoint is not None else None
+	if saved is None:
+		dat_file = open_log(filename, planets, 'H', dtmax, compress = compress, background = background)
+		log_data(dat_file, 0, 0, N, planets)
+		T, step, cpu = 0, 0, 0.0
+	else:
+		T, step, cpu = restore(saved, planets, [filename])
+		dat_file = open_log(filename, planets, 'H', dtmax, compress = compress, background = background, mode = 'a')
+
+	start = timer()
+
+	if saved is None:
+		a, j = acceleration_jerk(mass, x, v, n_massive = nm)
+		level = block_level(ETA_START * row_norm(a) / row_norm(j), dtmax)
+		evals = 0
+	else:
+		a, j, level, evals = saved['acc'], saved['jerk'], saved['level'], saved['evals'].item()
+	t = np.full(N, round(T / tick), dtype = np.int64)	# Time of every body [ticks]
+	next_log = t[0] + t_log
+
+	while t.min() < t_end:
+		dt = np.left_shift(1, MAX_LEVEL - level)			# Timesteps [ticks]
+		t_next = (t + dt).min()
+		block = np.nonzero(t + dt == t_next)[0]
+
+		# Predict every body to 't_next':
+		h = ((t_next - t) * tick)[:, np.newaxis]
+		xp = x + h*(v + h*(a/2.0 + h*j/6.0))
+		vp = v + h*(a + h*j/2.0)
+
+		# Forces on the block, and the correction:
+		a1, j1 = acceleration_jerk(mass, xp, vp, block, nm)
+		a0, j0 = a[block], j[block]
+		h = h[block]
+		snap = (-6.0*(a0 - a1) - h*(4.0*j0 + 2.0*j1)) / h**2
+		crackle = (12.0*(a0 - a1) + 6.0*h*(j0 + j1)) / h**3
+		x[block] = xp[block] + h**4/24.0*snap + h**5/120.0*crackle
+		v[block] = vp[block] + h**3/6.0*snap + h**4/24.0*crackle
+		a[block], j[block] = a1, j1
+		t[block] = t_next
+
+		# New timesteps: they can shrink freely, but only grow by doubling, and when the new time is commensurate.
+		new = block_level(aarseth(a1, j1, snap + h*crackle, crackle, ETA), dtmax)
+		old = level[block]
+		grow = (new < old) & (t_next % (2*dt[block]) == 0)
+		level[block] = np.where(new < old, np.where(grow, old - 1, old), new)
+
+		step += 1
+		evals += len(block)
+
+		if t_next >= next_log:							# Every body is synchronized here
+			log_data(dat_file, step, t_next * tick, N, planets)
+			next_log += t_log
+			if checkpoint is not None and checkpoint.due():
+				checkpoint.save(planets.state, t_next * tick, step, cpu + timer() - start, [dat_file], acc = a,
+					jerk = j, level = level, evals = evals)
+
+	end = timer()
+	if checkpoint is not None:
+		checkpoint.save(planets.state, t.min() * tick, step, cpu + end - start, [dat_file], acc = a, jerk = j,
+			level = level, evals = evals)
+	dat_file.close()
+
+	return cpu + end - start, evals
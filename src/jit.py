@@ -0,0 +1,115 @@
+"""
+Optional Numba-compiled kernels: the pairwise acceleration (with the potential energy), the potential energy,
+and the combination of Runge-Kutta stages, as plain loops compiled to machine code.
+For the few bodies of the everyday runs these beat the vectorized NumPy kernels, whose cost is
+dominated by the overhead of creating the temporary arrays.
+The compiled code is cached on disk ('cache = True'), so only the first run ever pays for the compilation.
+
+Numba is optional: without it 'AVAILABLE' is False, 'forces.kernel('jit')' falls back to the NumPy kernel,
+and the StageBuffers keep the NumPy stage combination.
+The loops sum in a different order than the NumPy kernels, so the results are not bitwise identical to theirs:
+they agree to a relative 1e-12 (see tests/test_jit.py), and the trajectories of long runs with the 'jit' backend
+drift apart from those of the 'direct' one at round-off level. Runs are only bitwise comparable with the same
+backend (which is part of the key of a run, see 'sweep.run_key').
+"""
+import numpy as np
+
+from forces import G
+
+try:
+	from numba import njit
+	AVAILABLE = True
+except ImportError:
+	AVAILABLE = False
+
+	def njit(*args, **kwargs):
+		""" Stand-in of 'numba.njit': the functions stay plain Python (and are not selected, being slow).
+		"""
+		return lambda function: function
+
+
+@njit(cache = True)
+def _pairs(mass, pos, acc, n_massive):
+	""" Acceleration of every body in the (N, 3) 'pos' into 'acc', visiting every pair once.
+	The first 'n_massive' bodies attract, the rest are test particles. Returns the potential energy of the massive bodies.
+	"""
+	n = pos.shape[0]
+	acc[:, :] = 0.0
+	U = 0.0
+	for i in range(n_massive):
+		for j in range(i + 1, n):
+			dx = pos[j, 0] - pos[i, 0]
+			dy = pos[j, 1] - pos[i, 1]
+			dz = pos[j, 2] - pos[i, 2]
+			inv_r = 1.0 / np.sqrt(dx*dx + dy*dy + dz*dz)
+			inv_r3 = inv_r * inv_r * inv_r
+			if j < n_massive:
+				a = G * mass[j] * inv_r3
+				acc[i, 0] += a * dx
+				acc[i, 1] += a * dy
+				acc[i, 2] += a * dz
+				U += G * mass[i] * mass[j] * inv_r
+			a = G * mass[i] * inv_r3
+			acc[j, 0] -= a * dx
+			acc[j, 1] -= a * dy
+			acc[j, 2] -= a * dz
+	return U
+
+
+@njit(cache = True)
+def _potential(mass, pos, n_massive):
+	U = 0.0
+	for i in range(n_massive):
+		for j in range(i + 1, n_massive):
+			dx = pos[j, 0] - pos[i, 0]
+			dy = pos[j, 1] - pos[i, 1]
+			dz = pos[j, 2] - pos[i, 2]
+			U += G * mass[i] * mass[j] / np.sqrt(dx*dx + dy*dy + dz*dz)
+	return U
+
+
+@njit(cache = True)
+def _combine(u, h, coeffs, K, out):
+	for i in range(u.shape[0]):
+		for k in range(3):
+			total = 0.0
+			for s in range(coeffs.shape[0]):
+				total += coeffs[s] * K[s, i, k]
+			out[i, k] = u[i, k] + h * total
+
+
+def acceleration(mass, pos, out = None, potential = False, n_massive = None):
+	""" Compiled counterpart of 'forces.acceleration', with the same interface.
+	Leading (batch) axes of 'pos' are looped over.
+	"""
+	if out is None:
+		out = np.empty(pos.shape)
+	n_massive = pos.shape[-2] if n_massive is None else n_massive
+
+	if pos.ndim == 2:
+		U = _pairs(mass, pos, out, n_massive)
+	else:
+		U = np.zeros(pos.shape[:-2])
+		for index in np.ndindex(pos.shape[:-2]):
+			U[index] = _pairs(mass, pos[index], out[index], n_massive)
+
+	return (out, U) if potential else out
+
+
+def potential(mass, pos, n_massive = None):
+	""" Compiled counterpart of 'forces.potential'; leading axes are looped over.
+	"""
+	n_massive = pos.shape[-2] if n_massive is None else n_massive
+	if pos.ndim == 2:
+		return _potential(mass, pos, n_massive)
+	U = np.zeros(pos.shape[:-2])
+	for index in np.ndindex(pos.shape[:-2]):
+		U[index] = _potential(mass, pos[index], n_massive)
+	return U
+
+
+def stage_state(u, h, coeffs, K, out):
+	""" Compiled counterpart of 'functions.stage_state', for a single (n, 3) state and a scalar 'h'.
+	"""
+	_combine(u, float(h), coeffs, K, out)
+	return out
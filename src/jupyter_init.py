@@ -23,12 +23,30 @@ def error_range(x):
 	print("RKDP simulation will run {0} times. \n".format(n))
 	return x
 	
+def dense_choice(x):
+	if x > 0:
+		print("RKDP will log its trajectory every {0} days, using dense output. \n".format(x))
+	else:
+		print("RKDP will log its trajectory at every accepted step. \n")
+	return x
+	
 def cg_choice(x):
 	return x
 	
 def innpl_choice(x):
 	return x
 	
+def par_choice(x):
+	return x
+	
+def batch_choice(x):
+	return x
+	
+def resume_choice(x):
+	if x:
+		print("Runs with a checkpoint in the logs continue from it, appending to their logs. \n")
+	return x
+	
 w_Ttot = interactive(total_choice, x = widgets.BoundedIntText(
 	value = 36524,
 	min = 10,				#integration time limits! [days]
@@ -66,8 +84,17 @@ w_err_range = interactive(error_range, x = widgets.IntRangeSlider(
 	readout_format='d',
 ))
 
+w_dense = interactive(dense_choice, x = widgets.BoundedIntText(
+	value = 0,
+	min = 0,
+	max = 3650,
+	description = '5.) RKDP output interval [days] (0: every step):',
+	style = style,
+	disabled = False
+))
+
 w_Ich = interactive(integrator_choice, x = widgets.SelectMultiple(
-	options = ['Euler', 'Verlet', 'RK4', 'RKDP'],
+	options = ['Euler', 'Verlet', 'RK4', 'RKDP', 'Leapfrog', 'Yoshida4', 'Yoshida6', 'Hermite', 'Hybrid'],
 	value = ['Euler', 'Verlet', 'RK4', 'RKDP'],
 	description = '1.) Integrator:',
 	disabled = False
@@ -83,10 +110,29 @@ w_InnPl = interactive(innpl_choice, x = widgets.Checkbox(
 	description = 'Include inner planets'
 ))
 
+w_par = interactive(par_choice, x = widgets.Checkbox(
+	value = False,
+	description = 'Run integrations in parallel (one per physical core; the CPU times are less comparable)'
+))
+
+w_batch = interactive(batch_choice, x = widgets.Checkbox(
+	value = False,
+	description = 'Batch the fixed timesteps of a method into one vectorized run'
+))
+
+w_resume = interactive(resume_choice, x = widgets.Checkbox(
+	value = False,
+	description = 'Resume the runs from their checkpoints (e.g. to extend them to a longer total time)'
+))
+
 print("Please set the required parameters:")
 display(w_Ich)
 display(w_Ttot)
 display(w_ts_range)
 display(w_err_range)
+display(w_dense)
 display(w_cg)
 display(w_InnPl)
+display(w_par)
+display(w_batch)
+display(w_resume)
@@ -0,0 +1,174 @@
+"""
+Barnes-Hut tree code: an O(N log N) alternative of 'forces.acceleration' for large numbers of bodies.
+
+Every evaluation builds an octree over the positions, one level at a time for all the nodes of the level,
+and walks it for a chunk of bodies at a time: a node seen from a body under an angle smaller than
+the opening angle 'theta' (side length / distance) acts as a point mass at its centre of mass,
+otherwise it is opened. Leaves hold up to 'leaf_size' bodies, which act one by one.
+With 'theta' = 0 every node is opened, and the result equals the direct sum up to round-off.
+"""
+import numpy as np
+
+from forces import G
+
+THETA = 0.5							# Default opening angle
+LEAF_SIZE = 8						# Default number of bodies in a leaf
+MAX_DEPTH = 48						# Coincident bodies end up in one leaf at this depth
+CHUNK = 4096						# Bodies walking the tree together (bounds the memory of the walk)
+OCTANTS = np.array([[(k >> b) & 1 for b in range(3)] for k in range(8)]) * 2.0 - 1.0
+
+
+def ranges(starts, counts):
+	""" Concatenation of 'arange(start, start + count)' for every pair of 'starts' and 'counts'.
+	"""
+	total = counts.sum()
+	if total == 0:
+		return np.zeros(0, dtype = int)
+	offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+	return offsets + np.arange(total)
+
+
+class Octree:
+	""" Octree over the bodies of masses 'mass' at 'pos', stored as arrays over the nodes:
+	'center' and 'half' (half of the side length) of their cells, 'mass' and 'com' (centre of mass) of their bodies,
+	'first' and 'nchild' of their children, and for the leaves 'start' and 'count' of their bodies in 'order'.
+	"""
+
+	def __init__(self, mass, pos, leaf_size = LEAF_SIZE):
+		n = len(pos)
+		lo, hi = pos.min(axis = 0), pos.max(axis = 0)
+
+		centers = [(lo + hi)[np.newaxis] / 2.0]
+		halves = [np.array([max((hi - lo).max(), 1e-12) * 0.5001])]
+		parents = [np.array([-1])]
+		levels = [(0, 1)]							# Node range of every level
+		node = np.zeros(n, dtype = int)				# Node of every body on the current level
+		leaf = np.zeros(n, dtype = int)				# Leaf of every body
+		active = np.arange(n)						# Bodies in nodes still to be split
+
+		for depth in range(MAX_DEPTH + 1):
+			first, M = levels[-1]
+			counts = np.bincount(node[active] - first, minlength = M - first)
+			split = counts > leaf_size if depth < MAX_DEPTH else np.zeros(M - first, dtype = bool)
+			stays = ~split[node[active] - first]
+			leaf[active[stays]] = node[active[stays]]
+			active = active[~stays]
+			if len(active) == 0:
+				break
+
+			# Children of the split nodes, one for every occupied octant:
+			parent = node[active]
+			octant = ((pos[active] > centers[-1][parent - first]) * [1, 2, 4]).sum(axis = 1)
+			keys, inverse = np.unique(parent * 8 + octant, return_inverse = True)
+			half = halves[-1][keys // 8 - first] / 2.0
+			centers.append(centers[-1][keys // 8 - first] + OCTANTS[keys % 8] * half[:, np.newaxis])
+			halves.append(half)
+			parents.append(keys // 8)
+			node[active] = M + inverse.ravel()
+			levels.append((M, M + len(keys)))
+
+		M = levels[-1][1]
+		self.center = np.concatenate(centers)
+		self.half = np.concatenate(halves)
+		parent = np.concatenate(parents)
+
+		# The children of a node are created together, so they are contiguous:
+		self.nchild = np.bincount(parent[1:], minlength = M)
+		self.first = np.zeros(M, dtype = int)
+		inner = self.nchild > 0
+		self.first[inner] = np.searchsorted(parent[1:], np.nonzero(inner)[0]) + 1
+		self.leaf = ~inner
+
+		# Bodies of the leaves, as contiguous ranges of 'order':
+		self.order = np.argsort(leaf, kind = 'stable')
+		self.count = np.bincount(leaf, minlength = M)
+		self.start = np.concatenate(([0], np.cumsum(self.count)[:-1]))
+
+		# Masses and centres of mass, summed up from the deepest level to the root:
+		self.bodymass = mass
+		self.mass = np.bincount(leaf, weights = mass, minlength = M)
+		moment = np.stack([np.bincount(leaf, weights = mass * pos[:, k], minlength = M) for k in range(3)], axis = 1)
+		for a, b in reversed(levels[1:]):
+			self.mass += np.bincount(parent[a:b], weights = self.mass[a:b], minlength = M)
+			for k in range(3):
+				moment[:, k] += np.bincount(parent[a:b], weights = moment[a:b, k], minlength = M)
+		massive = self.mass > 0
+		self.com = self.center.copy()				# Cells of massless bodies only act with no mass anyway
+		self.com[massive] = moment[massive] / self.mass[massive, np.newaxis]
+
+	def walk(self, pos, bodies, theta, potential = False):
+		""" Sum of 'mass / r^3 * (r_source - r_body)' over the sources acting on every body in 'bodies',
+		and with 'potential', of 'mass / r' as well. Returns them as a (len(bodies), 3) and a (len(bodies),) array.
+		"""
+		n = len(bodies)
+		acc = np.zeros((n, 3))
+		phi = np.zeros(n) if potential else None
+		body = np.arange(n)							# Index of the body in 'bodies'
+		node = np.zeros(n, dtype = int)
+
+		while len(body):
+			target = pos[bodies[body]]
+
+			# Nodes far enough act as point masses. Nodes containing the body are always opened.
+			d = self.com[node] - target
+			r2 = np.einsum('ik,ik->i', d, d)
+			inside = (np.abs(target - self.center[node]) <= self.half[node, np.newaxis]).all(axis = 1)
+			far = ~inside & (4.0 * self.half[node]**2 < theta**2 * r2)
+			self._add(acc, phi, body[far], self.mass[node[far]], d[far], r2[far])
+
+			body, node = body[~far], node[~far]
+			leaf = self.leaf[node]
+
+			# Opened leaves act body by body:
+			count = self.count[node[leaf]]
+			source = self.order[ranges(self.start[node[leaf]], count)]
+			near = np.repeat(body[leaf], count)
+			other = source != bodies[near]
+			source, near = source[other], near[other]
+			d = pos[source] - pos[bodies[near]]
+			self._add(acc, phi, near, self.bodymass[source], d, np.einsum('ik,ik->i', d, d))
+
+			# Opened inner nodes are replaced by their children:
+			count = self.nchild[node[~leaf]]
+			node = ranges(self.first[node[~leaf]], count)
+			body = np.repeat(body[~leaf], count)
+
+		return acc, phi
+
+	@staticmethod
+	def _add(acc, phi, body, mass, d, r2):
+		n = len(acc)
+		r = np.sqrt(r2)
+		w = mass / (r2 * r)
+		for k in range(3):
+			acc[:, k] += np.bincount(body, weights = w * d[:, k], minlength = n)
+		if phi is not None:
+			phi += np.bincount(body, weights = mass / r, minlength = n)
+
+
+def acceleration(mass, pos, out = None, potential = False, n_massive = None, theta = THETA, leaf_size = LEAF_SIZE):
+	""" Barnes-Hut approximation of 'forces.acceleration', with the same interface:
+	the acceleration of every body in the (N, 3) 'pos' is written into 'out' if given, and returned,
+	and with 'potential', '(acc, U)' is returned. 'theta' is the opening angle, trading accuracy for speed.
+	With 'n_massive', the tree holds only the first 'n_massive' bodies, and the rest walk it as test particles.
+	The tree code takes a single set of positions: leading (batch) axes are not supported.
+	"""
+	if pos.ndim != 2:
+		raise ValueError('The tree code takes an (N, 3) array of positions, not ' + str(pos.shape) + '.')
+
+	n = len(pos)
+	nm = n if n_massive is None else n_massive
+	tree = Octree(mass[:nm], pos[:nm], leaf_size)
+	acc = np.empty((n, 3)) if out is None else out
+	phi = np.zeros(n)
+
+	for a in range(0, n, CHUNK):
+		b = min(a + CHUNK, n)
+		acc[a:b], chunk_phi = tree.walk(pos, np.arange(a, b), theta, potential)
+		if potential:
+			phi[a:b] = chunk_phi
+	acc *= G
+
+	if potential:
+		return acc, 0.5 * G * np.dot(mass[:nm], phi[:nm])		# Every pair counted twice
+	return acc
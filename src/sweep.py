@@ -0,0 +1,579 @@
+"""
+The single integration runs of the comparison, and their execution as a sweep.
+Every run builds its own copy of the initial conditions and writes its own output files,
+so the runs are independent of each other, and can be sent to a pool of processes.
+"""
+import hashlib
+import json
+import os
+import shutil
+import warnings
+from os import sep
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from timeit import default_timer as timer
+
+import numpy as np
+
+import functions as fu
+from functions import Euler, Verlet, RK4, Acceleration, StageBuffers, Ensemble, SYMPLECTIC
+from RK_DP import Derivatives, RungeKutta, CONTROLLERS
+from hermite import Hermite
+from encounters import Hybrid
+from checkpoint import Checkpointer, load, restore
+from trajlog import LOG_EXT
+
+INIT_FILE = '.' + sep + 'addendum' + sep + 'start_pos.csv'
+LOG_DIR = '.' + sep + 'logs' + sep
+M = 10									# Logging frequency for fixed ts methods (!!!)
+COMPRESS_LOGS = False					# zlib compression of the binary logs
+BACKGROUND_LOGS = True					# Derive and write the logs on a background thread
+TAGS = {'Euler': 'E', 'Verlet': 'V', 'RK4': 'RK4',	# Name prefixes of the fixed ts methods' logs
+	'Leapfrog': 'LF', 'Yoshida4': 'Y4', 'Yoshida6': 'Y6', 'Hermite': 'H', 'Hybrid': 'HY'}
+FIXED = ['Euler', 'Verlet', 'RK4', 'Leapfrog', 'Yoshida4', 'Yoshida6']
+STEPPERS = dict(SYMPLECTIC, Hybrid = Hybrid)				# Steppers of run_symplectic
+EXTRA_BODIES = ()						# Further initial condition files (e.g. minor bodies), see SolarSystem_init
+BACKEND = 'direct'						# Force kernel: 'direct' (every pair), 'tree' (Barnes-Hut) or 'jit' (Numba)
+THETA = 0.5								# Opening angle of the tree backend
+CONTROLLER = 'NR'						# Step-size controller of RKDP: 'NR' (Numerical Recipes, the default) or 'PI' (Gustafsson, opt-in)
+ERROR_MODE = 'all'						# Logging of the RKDP trial errors: 'all' (the default), 'sample', 'summary' or 'off'
+ERROR_EVERY = 10						# Every k-th accepted step is logged in 'sample' mode (unused otherwise)
+TEST_MASS = 0.0							# Bodies lighter than this [kg] are test particles (opt-in, e.g. 1.0E+15 for 67P/C-G; 0.0: every body is massive)
+CHECKPOINT_EVERY = 300.0				# Wall-clock time between the checkpoints of a run [s] (None: only at its end)
+STORE_DIR = LOG_DIR + 'store' + sep		# Results of the finished runs, by their keys (see run_key)
+USE_STORE = True						# Skip the runs whose results are already stored
+CODE_MODULES = ('forces', 'octree', 'jit', 'functions', 'RK_DP', 'hermite', 'encounters', 'sweep', 'checkpoint', 'trajlog')
+
+
+def init_system(inbb, cg):
+	""" Initial conditions of a run, with the force backend of the sweep.
+	"""
+	options = {'theta': THETA} if BACKEND == 'tree' else {}
+	return fu.SolarSystem_init(INIT_FILE, inbb, cg, EXTRA_BODIES, BACKEND, TEST_MASS, **options)
+
+
+def checkpointer(name, meth, step, Ttot, inbb, cg, dT = None, dense_dt = 0):
+	""" The Checkpointer of the run 'name', with the settings and the key of the run (see run_key).
+	"""
+	settings = run_settings(meth, step, inbb, cg, dT, dense_dt)
+	return Checkpointer(LOG_DIR + 'checkpoint_' + name + '.npz', CHECKPOINT_EVERY, digest(settings),
+		digest(dict(settings, Ttot = Ttot)))
+
+
+def open_run(name, planets, meth, dT, Ttot, inbb, cg, resume = False):
+	""" Opens the log of the fixed timestep run 'name' of the method 'meth', and its Checkpointer.
+	With 'resume' and a checkpoint of the run with the same settings (at most at 'Ttot', see Checkpointer.load),
+	'planets' continue from the checkpoint and the log is appended to, otherwise a new log is started
+	with the initial data. Returns the log, the Checkpointer, and the T, step and CPU time the run continues from.
+	"""
+	filename = LOG_DIR + 'output_' + name + LOG_EXT
+	tag = TAGS[meth]
+	ckpt = checkpointer(name, meth, dT, Ttot, inbb, cg)
+	saved = ckpt.load(Ttot) if resume else None
+	if saved is None:
+		dat_file = fu.open_log(filename, planets, tag, dT, compress = COMPRESS_LOGS, background = BACKGROUND_LOGS)
+		fu.log_data(dat_file, 0, 0, len(planets), planets)
+		return dat_file, ckpt, 0, 0, 0.0
+	
+	T, step, cpu = restore(saved, planets, [filename])
+	dat_file = fu.open_log(filename, planets, tag, dT, compress = COMPRESS_LOGS, background = BACKGROUND_LOGS, mode = 'a')
+	return dat_file, ckpt, T, step, cpu
+
+
+def code_version():
+	""" Hash of the source of the modules the results depend on ('CODE_MODULES').
+	"""
+	digest = hashlib.sha256()
+	folder = os.path.dirname(os.path.abspath(__file__))
+	for module in CODE_MODULES:
+		with open(os.path.join(folder, module + '.py'), 'rb') as file:
+			digest.update(file.read())
+	return digest.hexdigest()
+
+
+def run_settings(meth, step, inbb, cg, dT = None, dense_dt = 0):
+	""" Everything the results of a run depend on, but its length: the method, its timestep
+	(or tolerance exponent, and starting timestep 'dT' and output interval 'dense_dt' for RKDP),
+	the body selection, the contents of the initial condition files, the settings of the sweep and the code version.
+	"""
+	initial = hashlib.sha256()
+	for path in (INIT_FILE,) + tuple(EXTRA_BODIES):
+		with open(path, 'rb') as file:
+			initial.update(file.read())
+	settings = {'method': meth, 'step': step, 'inbb': inbb, 'cg': cg, 'M': M, 'backend': BACKEND,
+		'theta': THETA if BACKEND == 'tree' else None, 'test_mass': TEST_MASS, 'compress': COMPRESS_LOGS,
+		'initial': initial.hexdigest(), 'code': code_version()}
+	if meth == 'RKDP':
+		settings.update(dT = dT, dense_dt = dense_dt, controller = CONTROLLER, error_mode = ERROR_MODE,
+			error_every = ERROR_EVERY)
+	return settings
+
+
+def digest(settings):
+	return hashlib.sha256(json.dumps(settings, sort_keys = True).encode('utf-8')).hexdigest()
+
+
+def run_key(meth, step, Ttot, inbb, cg, dT = None, dense_dt = 0):
+	""" Key of a run in the store: a hash of its settings (see run_settings) and 'Ttot'.
+	"""
+	return digest(dict(run_settings(meth, step, inbb, cg, dT, dense_dt), Ttot = Ttot))
+
+
+def run_files(row):
+	""" Names of the files a run writes into LOG_DIR, from its line in CPUlogs.
+	"""
+	kind, tag, name, step = row.split()[:4]
+	files = ['output_' + name + LOG_EXT, 'checkpoint_' + name + '.npz']
+	if tag == 'RKDP':
+		files += ['RKDP_ERRS_' + step + LOG_EXT, 'RKDP_STATS_' + step + '.json']
+	elif tag == 'H':
+		files += ['H_STATS_' + step + '.json']
+	return files
+
+
+def checkpoint_key(row):
+	""" Key of the run that wrote the checkpoint of the CPUlogs line 'row' (None if there is no checkpoint).
+	"""
+	saved = load(LOG_DIR + run_files(row)[1])
+	return None if saved is None else str(saved.get('key', ''))
+
+
+def store(key, row):
+	""" Stores the files and the CPUlogs line 'row' of a finished run under 'key',
+	as a directory that appears at once (it is written under a temporary name first).
+	"""
+	target = STORE_DIR + key
+	if os.path.isdir(target):
+		return
+	temp = target + '.' + str(os.getpid())
+	os.makedirs(temp, exist_ok = True)
+	for name in run_files(row):
+		if os.path.exists(LOG_DIR + name):
+			shutil.copy2(LOG_DIR + name, temp)
+	with open(temp + sep + 'row.txt', 'w') as file:
+		file.write(row)
+	try:
+		os.replace(temp, target)
+	except OSError:										# Stored by another process meanwhile
+		shutil.rmtree(temp, ignore_errors = True)
+
+
+def stored(key):
+	return USE_STORE and os.path.isfile(STORE_DIR + key + sep + 'row.txt')
+
+
+def run_cached(key):
+	""" Runner of a stored run: copies its files into LOG_DIR, and returns its line in CPUlogs.
+	"""
+	folder = STORE_DIR + key + sep
+	for name in os.listdir(folder):
+		if name != 'row.txt':
+			shutil.copy2(folder + name, LOG_DIR + name)
+	with open(folder + 'row.txt') as file:
+		return file.read()
+
+
+def run_stored(keys, runner, *args):
+	""" Runs the task 'runner' with 'args', and stores the results of its runs under 'keys' (one per CPUlogs line).
+	A result is only stored if the checkpoint at the end of its run has the same key, i.e. the logs are those of
+	the run of the key (and not, e.g., of a longer run resumed from).
+	"""
+	rows = RUNNERS[runner](*args)
+	rows = rows if isinstance(rows, list) else [rows]
+	for key, row in zip(keys, rows):
+		if checkpoint_key(row) == key:
+			store(key, row)
+		else:
+			warnings.warn('Not storing the results of ' + row.split()[2] + ': its checkpoint is not of the run ' + key + '.')
+	return rows
+
+
+def run_euler(dT, Ttot, inbb, cg, resume = False):
+	""" Euler integration with a 'dT' days timestep. Returns the line of the run in CPUlogs.
+	With 'resume', the run continues from its checkpoint (see open_run).
+	"""
+	planets = init_system(inbb, cg)
+	N = len(planets)
+	nsteps = Ttot//dT
+
+	# Adaptive filenaming, logging header and initial data:
+	name = 'E_' + str(dT)
+	dat_file, ckpt, T, step, cpu0 = open_run(name, planets, 'Euler', dT, Ttot, inbb, cg, resume)
+
+	startE = timer()
+	Acceleration(N, planets)								# initial acceleration
+
+	# Start integration:
+	# Running it M times before logging:
+	for i in range(step // M, round(nsteps / M)):
+		for j in range(M):
+			step += 1
+			T += dT
+			Euler(N, planets, dT, potential = (j == M - 1))	# The last one also gives the potential energy
+		fu.log_data(dat_file, step, T, N, planets, planets.epot)
+		if ckpt.due():
+			ckpt.save(planets.state, T, step, cpu0 + timer() - startE, [dat_file])
+
+	# Logging CPU time:
+	cpuE = cpu0 + timer() - startE
+	ckpt.save(planets.state, T, step, cpuE, [dat_file])
+	dat_file.close()
+
+	return 'fix E '+name+' '+str(dT)+' '+str(cpuE)+'\n'
+
+
+def run_verlet(dT, Ttot, inbb, cg, resume = False):
+	""" Verlet integration with a 'dT' days timestep. Returns the line of the run in CPUlogs.
+	With 'resume', the run continues from its checkpoint (see open_run).
+	"""
+	planets = init_system(inbb, cg)
+	N = len(planets)
+	nsteps = Ttot//dT
+	name = 'V_' + str(dT)
+	dat_file, ckpt, T, step, cpu0 = open_run(name, planets, 'Verlet', dT, Ttot, inbb, cg, resume)
+
+	startV = timer()
+	Acceleration(N, planets)								# initial acceleration
+	for i in range(step // M, round(nsteps / M)):
+
+		for j in range(M):									# Running it M times before logging
+			step += 1
+			T += dT
+			Verlet(N, planets, dT, potential = (j == M - 1))	# Stepper; the last one also gives the potential energy
+
+		fu.log_data(dat_file, step, T, N, planets, planets.epot)
+		if ckpt.due():
+			ckpt.save(planets.state, T, step, cpu0 + timer() - startV, [dat_file])
+
+	cpuV = cpu0 + timer() - startV
+	ckpt.save(planets.state, T, step, cpuV, [dat_file])
+	dat_file.close()
+
+	return 'fix V '+name+' '+str(dT)+' '+str(cpuV)+'\n'
+
+
+def run_symplectic(meth, dT, Ttot, inbb, cg, resume = False):
+	""" Integration with the symplectic method 'meth' (Leapfrog, Yoshida4, Yoshida6 or Hybrid) with a 'dT' days timestep.
+	Returns the line of the run in CPUlogs. With 'resume', the run continues from its checkpoint (see open_run).
+	"""
+	planets = init_system(inbb, cg)
+	N = len(planets)
+	nsteps = Ttot//dT
+	stepper = STEPPERS[meth]
+	name = TAGS[meth] + '_' + str(dT)
+	dat_file, ckpt, T, step, cpu0 = open_run(name, planets, meth, dT, Ttot, inbb, cg, resume)
+
+	start = timer()
+	Acceleration(N, planets)								# initial acceleration
+	for i in range(step // M, round(nsteps / M)):
+
+		for j in range(M):									# Running it M times before logging
+			step += 1
+			T += dT
+			stepper(N, planets, dT, potential = (j == M - 1))
+
+		fu.log_data(dat_file, step, T, N, planets, planets.epot)
+		if ckpt.due():
+			ckpt.save(planets.state, T, step, cpu0 + timer() - start, [dat_file])
+
+	cpu = cpu0 + timer() - start
+	ckpt.save(planets.state, T, step, cpu, [dat_file])
+	dat_file.close()
+
+	return 'fix '+TAGS[meth]+' '+name+' '+str(dT)+' '+str(cpu)+'\n'
+
+
+def rk4_derivatives(t, u, planets, work, potential = False):
+	""" Starting diffs of the next RK4 step at the state 'u' just reached, written into 'work.dudt'.
+	With 'potential', the potential energy at 'u' is calculated in the same pass and left in 'planets.epot',
+	so the logging of the state does not take a second pass over every pair.
+	"""
+	if potential:
+		dudt, planets.epot = Derivatives(t, u, planets, out = work.dudt, potential = True)
+		return dudt
+	return Derivatives(t, u, planets, out = work.dudt)
+
+
+def run_rk4(dT, Ttot, inbb, cg, resume = False):
+	""" Runge-Kutta 4 integration with a 'dT' days timestep. Returns the line of the run in CPUlogs.
+	With 'resume', the run continues from its checkpoint (see open_run).
+	"""
+	planets = init_system(inbb, cg)
+	N = len(planets)
+	nodes = (2*N)
+	nsteps = Ttot//dT
+	name = 'RK4_' + str(dT)
+	dat_file, ckpt, T, step, cpu0 = open_run(name, planets, 'RK4', dT, Ttot, inbb, cg, resume)
+
+	u = planets.state							# The state-vector, shared with the planets
+	work = StageBuffers(nodes, 4, compiled = (BACKEND == 'jit'))	# Stage buffers, reused on every step
+
+	startRK4 = timer()
+	dudt = Derivatives(T, u, planets, out = work.dudt)			# Starting diffs
+
+	for i in range(step // M, round(nsteps / M)):
+		for j in range(M):									# Running it M times before logging
+			step += 1
+			u = RK4(u, dudt, nodes, T, dT, Derivatives, planets, work)		# Step
+			T += dT
+			dudt = rk4_derivatives(T, u, planets, work, potential = (j == M - 1))	# Diffs of the next step
+		fu.log_data(dat_file, step, T, N, planets, planets.epot)
+		if ckpt.due():
+			ckpt.save(u, T, step, cpu0 + timer() - startRK4, [dat_file])
+
+	cpuRK4 = cpu0 + timer() - startRK4
+	ckpt.save(u, T, step, cpuRK4, [dat_file])
+	dat_file.close()
+
+	return 'fix RK4 '+name+' '+str(dT)+' '+str(cpuRK4)+'\n'
+
+
+def run_rkdp(k, Ttot, inbb, cg, dT, dense_dt = 0, resume = False):
+	""" Runge-Kutta Dormand-Prince integration with a tolerance of 1.0E-'k',
+	starting with a 'dT' days timestep. Returns the line of the run in CPUlogs.
+	With a 'dense_dt' > 0, the trajectory is logged on a regular grid of 'dense_dt' days, using dense output.
+	The counts of accepted and rejected steps are written into 'RKDP_STATS_k.json'.
+	With 'resume', the run continues from its checkpoint (see RungeKutta).
+	"""
+	planets = init_system(inbb, cg)
+	tol = pow(10, -k)
+	name = 'RKDP_' + str(k)
+	filename = LOG_DIR + 'output_RKDP_' + str(k) + LOG_EXT
+	errfile = LOG_DIR + 'RKDP_ERRS_'+ str(k) + LOG_EXT
+
+	t_out = np.arange(dense_dt, Ttot + 0.5*dense_dt, dense_dt) if dense_dt > 0 else None
+
+	control = CONTROLLERS[CONTROLLER]()
+	cpuRKDP = RungeKutta(Ttot, planets, dT, tol, filename, errfile, COMPRESS_LOGS, BACKGROUND_LOGS, t_out, control,
+		ERROR_MODE, ERROR_EVERY, checkpointer(name, 'RKDP', k, Ttot, inbb, cg, dT, dense_dt), resume)
+	with open(LOG_DIR + 'RKDP_STATS_' + str(k) + '.json', 'w') as stats_file:
+		json.dump(control.stats(), stats_file)
+
+	return 'adap RKDP '+name+' '+str(k)+' '+str(cpuRKDP)+'\n'
+
+
+def run_hermite(dT, Ttot, inbb, cg, resume = False):
+	""" Hermite integration with block timesteps of at most 'dT' days, logged every 'M*dT' days
+	over as many days as the fixed timestep runs. Returns the line of the run in CPUlogs.
+	The number of force evaluations on single bodies is written into 'H_STATS_dT.json'.
+	With 'resume', the run continues from its checkpoint (see Hermite).
+	"""
+	planets = init_system(inbb, cg)
+	name = 'H_' + str(dT)
+	nlogs = round((Ttot//dT) / M)
+
+	cpuH, evals = Hermite(nlogs * M * dT, planets, dT, LOG_DIR + 'output_' + name + LOG_EXT, M * dT,
+		COMPRESS_LOGS, BACKGROUND_LOGS, checkpointer(name, 'Hermite', dT, Ttot, inbb, cg), resume)
+	with open(LOG_DIR + 'H_STATS_' + str(dT) + '.json', 'w') as stats_file:
+		json.dump({'evaluations': evals, 'bodies': len(planets)}, stats_file)
+
+	return 'fix H '+name+' '+str(dT)+' '+str(cpuH)+'\n'
+
+
+def run_batch(meth, dTs, Ttot, inbb, cg):
+	""" Runs the fixed timestep method 'meth' with every timestep in 'dTs' at once, as the members of an Ensemble,
+	advanced together by one acceleration kernel. A member stops moving (its timestep is set to 0)
+	once it has taken as many steps as its single run would. Writes the same output files as the single runs,
+	and returns their lines in CPUlogs: the CPU time of the batch is shared evenly by its members.
+	Every member leaves the checkpoint of its single run at the end, so it can be resumed (or extended) as one.
+	Needs the direct force backend, the tree code takes a single set of positions.
+	"""
+	planets = init_system(inbb, cg)
+	N = len(planets)
+	nodes = (2*N)
+	B = len(dTs)
+	ensemble = Ensemble(planets, B)
+	
+	dt = np.array(dTs, dtype = float).reshape(B, 1, 1)			# Timestep of every member
+	nlogs = [round((Ttot//dT) / M) for dT in dTs]				# Number of logged rows of every member
+	names = [TAGS[meth] + '_' + str(dT) for dT in dTs]
+	dat_files = [fu.open_log(LOG_DIR + 'output_' + names[b] + LOG_EXT, planets, TAGS[meth], dTs[b],
+		compress = COMPRESS_LOGS, background = BACKGROUND_LOGS) for b in range(B)]
+	for b in range(B):
+		fu.log_data(dat_files[b], 0, 0, N, ensemble.members[b])
+		
+	for b in range(B):
+		if nlogs[b] == 0:
+			dt[b] = 0.0
+	
+	u = ensemble.state
+	work = StageBuffers(nodes, 4, batch = (B,))
+	
+	start = timer()
+	if meth == 'RK4':
+		dudt = Derivatives(0, u, ensemble, out = work.dudt)		# Starting diffs
+	else:
+		Acceleration(N, ensemble)							# initial acceleration
+	
+	for i in range(max(nlogs)):
+		for j in range(M):									# Running it M times before logging
+			if meth == 'Euler':
+				Euler(N, ensemble, dt, potential = (j == M - 1))
+			elif meth == 'Verlet':
+				Verlet(N, ensemble, dt, potential = (j == M - 1))
+			elif meth in SYMPLECTIC:
+				SYMPLECTIC[meth](N, ensemble, dt, potential = (j == M - 1))
+			else:
+				RK4(u, dudt, nodes, 0, dt, Derivatives, ensemble, work)
+				dudt = rk4_derivatives(0, u, ensemble, work, potential = (j == M - 1))
+		
+		for b in range(B):
+			if i < nlogs[b]:
+				step = (i + 1) * M
+				fu.log_data(dat_files[b], step, step * dTs[b], N, ensemble.members[b], ensemble.epot[b])
+			if i + 1 >= nlogs[b]:
+				dt[b] = 0.0									# Member is done
+				
+	cpu = (timer() - start) / B
+	for b in range(B):
+		steps = nlogs[b] * M
+		ckpt = checkpointer(names[b], meth, dTs[b], Ttot, inbb, cg)
+		ckpt.save(ensemble.members[b].state, steps * dTs[b], steps, cpu, [dat_files[b]])
+		dat_files[b].close()
+	
+	return ['fix '+TAGS[meth]+' '+names[b]+' '+str(dTs[b])+' '+str(cpu)+'\n' for b in range(B)]
+
+
+RUNNERS = {'Euler': run_euler, 'Verlet': run_verlet, 'RK4': run_rk4, 'RKDP': run_rkdp, 'batch': run_batch,
+	'cached': run_cached, 'stored': run_stored,
+	'Leapfrog': partial(run_symplectic, 'Leapfrog'), 'Yoshida4': partial(run_symplectic, 'Yoshida4'),
+	'Yoshida6': partial(run_symplectic, 'Yoshida6'), 'Hermite': run_hermite, 'Hybrid': partial(run_symplectic, 'Hybrid')}
+TITLES = {'Euler': 'Euler integration...', 'Verlet': 'Verlet integration...', 'RK4': 'RK4 integration...',
+	'RKDP': 'Runge-Kutta Dormand-Prince integration...', 'Leapfrog': 'Leapfrog (kick-drift-kick) integration...',
+	'Yoshida4': 'Yoshida 4th order integration...', 'Yoshida6': 'Yoshida 6th order integration...',
+	'Hermite': 'Hermite block timestep integration...', 'Hybrid': 'Hybrid symplectic integration, with a smooth changeover for close encounters...'}
+
+
+def plan(method, Ttot, inbb, cg, ts_range, tol_range, batched = False, dense_dt = 0, resume = False):
+	""" Lists the runs of a sweep as (method, step, args) tuples, in the order of CPUlogs:
+	every fixed timestep method with every timestep in 'ts_range',
+	Hermite with every timestep in 'ts_range' as its largest block timestep, Hybrid with every timestep,
+	and RKDP with every tolerance exponent in 'tol_range', starting from the largest timestep.
+	With 'batched', every fixed timestep method runs all of its timesteps in one batch.
+	A 'dense_dt' > 0 is the output interval of RKDP's dense output.
+	With 'resume', the runs continue from their checkpoints, e.g. after a crash, or to extend them to a longer 'Ttot';
+	they are not batched then, as the batches are not checkpointed.
+	A run whose results are already in the store (see run_key) is not integrated again, its files are copied
+	into the logs instead; the results of the new runs are stored when they finish.
+	"""
+	tasks = []
+	batched = batched and BACKEND == 'direct' and not resume		# The tree code has no batch axis
+	dTs = tuple(range(ts_range[0], ts_range[1] + 1))
+
+	def add(meth, step, key, args):
+		if stored(key):
+			tasks.append((meth, step, ('cached', key)))
+		else:
+			tasks.append((meth, step, ('stored', [key]) + args))
+
+	for meth in FIXED:
+		if meth in method:
+			keys = {dT: run_key(meth, dT, Ttot, inbb, cg) for dT in dTs}
+			if batched:
+				for dT in dTs:
+					if stored(keys[dT]):
+						tasks.append((meth, dT, ('cached', keys[dT])))
+				new = tuple(dT for dT in dTs if not stored(keys[dT]))
+				if new:
+					tasks.append((meth, new, ('stored', [keys[dT] for dT in new], 'batch', meth, new, Ttot, inbb, cg)))
+				continue
+			for dT in dTs:
+				add(meth, dT, keys[dT], (meth, dT, Ttot, inbb, cg, resume))
+
+	for meth in ['Hermite', 'Hybrid']:								# Not batchable
+		if meth in method:
+			for dT in dTs:
+				add(meth, dT, run_key(meth, dT, Ttot, inbb, cg), (meth, dT, Ttot, inbb, cg, resume))
+
+	if 'RKDP' in method:
+		for k in range(tol_range[0], tol_range[1] + 1):
+			add('RKDP', k, run_key('RKDP', k, Ttot, inbb, cg, ts_range[1], dense_dt),
+				('RKDP', k, Ttot, inbb, cg, ts_range[1], dense_dt, resume))
+
+	return tasks
+
+
+def run_task(runner, *args):
+	""" Runs one task of 'plan' with the runner named 'runner', and returns its list of CPUlogs lines;
+	a module level function, so that it can be sent to other processes.
+	"""
+	rows = RUNNERS[runner](*args)
+	return rows if isinstance(rows, list) else [rows]
+
+
+def report(rows):
+	for row in rows:
+		name, cpu = row.split()[2], float(row.split()[-1])
+		print('{}:\t{:.4f} seconds.'.format(name, cpu))
+
+
+def physical_cores():
+	""" Number of physical cores (hyperthreads sharing a core are counted once): from psutil if it is installed,
+	otherwise from /proc/cpuinfo, and the logical count as a last resort.
+	"""
+	try:
+		import psutil
+		cores = psutil.cpu_count(logical = False)
+		if cores:
+			return cores
+	except ImportError:
+		pass
+	try:
+		with open('/proc/cpuinfo') as cpuinfo:
+			cores, physical = set(), None
+			for line in cpuinfo:
+				key, _, value = line.partition(':')
+				if key.strip() == 'physical id':
+					physical = value.strip()
+				elif key.strip() == 'core id':
+					cores.add((physical, value.strip()))
+		if cores:
+			return len(cores)
+	except OSError:
+		pass
+	return os.cpu_count() or 1
+
+
+def run_sweep(tasks, parallel = False, workers = None):
+	""" Runs every task of 'plan', and returns their CPUlogs lines in the order of 'tasks'.
+	By default the runs are serial, so their CPU times are comparable. With 'parallel', they are sent to a pool
+	of 'workers' processes (at most one per physical core), so the sweep takes about as long as its slowest run,
+	but runs sharing a core (or its caches and memory bandwidth) may report longer CPU times.
+	"""
+	if not tasks:
+		return []
+	rows = [[] for _ in tasks]
+
+	if not parallel:
+		current = None
+		for i, (meth, step, args) in enumerate(tasks):
+			if meth != current:
+				print(TITLES[meth])
+				current = meth
+			stored_note = ' (stored result)' if args[0] == 'cached' else ''
+			if meth == 'RKDP':
+				print('{} tolerance{}:'.format(pow(10, -step), stored_note), end='\t')
+			elif isinstance(step, tuple):
+				print('{} days timesteps, batched:'.format(step))
+			else:
+				print('{} days timestep{}:'.format(step, stored_note), end='\t')
+			rows[i] = run_task(*args)
+			if isinstance(step, tuple):
+				report(rows[i])
+				print()
+			else:
+				print('{:.4f} seconds.\n'.format(float(rows[i][0].split()[-1])))
+		return [row for task_rows in rows for row in task_rows]
+
+	workers = min(workers or len(tasks), len(tasks), physical_cores())
+	print(f'Running {len(tasks)} integrations on {workers} processes...\n')
+
+	with ProcessPoolExecutor(max_workers = workers) as pool:
+		futures = {pool.submit(run_task, *args): i for i, (meth, step, args) in enumerate(tasks)}
+		for future in as_completed(futures):
+			i = futures[future]
+			rows[i] = future.result()
+			report(rows[i])
+	print()
+
+	return [row for task_rows in rows for row in task_rows]
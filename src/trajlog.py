@@ -0,0 +1,278 @@
+"""
+Binary columnar log format of the trajectories, step sizes and errors.
+
+A log file consists of:
+	- the magic bytes 'CMPLOG1\n',
+	- a little-endian uint32 header length, and a JSON header with the column names,
+	  the body names, the method, its timestep or tolerance, and the compression ('zlib' or None),
+	- a sequence of chunks: uint32 row count, uint32 payload length, and the payload:
+	  the rows of the chunk stored column after column as little-endian float64, zlib-compressed if set.
+Chunks are self-delimiting, so a log can be appended to, and a truncated last chunk is ignored on reading.
+
+An AsyncLogSink moves the work of logging off the integration loop: the loop only copies raw snapshots
+into a ring buffer, and a background thread derives the logged columns and writes them in large chunks.
+"""
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'CMPLOG1\n'
+LOG_EXT = '.clog'
+DTYPE = np.dtype('<f8')
+CHUNK_ROWS = 4096
+
+
+class LogWriter:
+	""" Writes rows of float64 values to a binary columnar log at 'path'.
+	The rows are collected in a preallocated buffer of 'chunk' rows, which is written as one chunk when full.
+	'meta' holds the rest of the header (bodies, method, step), 'compress' turns on zlib compression.
+	With mode = 'a', an existing log is appended to, and its header is kept.
+	"""
+
+	def __init__(self, path, columns, meta = None, compress = False, chunk = CHUNK_ROWS, mode = 'w'):
+		self.path = path
+		self.nrows = 0
+
+		if mode == 'a':
+			header, _ = read_header(path)
+			self.columns = header['columns']
+			self.compress = header['compression'] == 'zlib'
+			self.file = open(path, 'ab')
+		else:
+			self.columns = list(columns)
+			self.compress = compress
+			header = dict(meta or {})
+			header['columns'] = self.columns
+			header['compression'] = 'zlib' if compress else None
+			blob = json.dumps(header).encode('utf-8')
+			self.file = open(path, 'wb')
+			self.file.write(MAGIC + struct.pack('<I', len(blob)) + blob)
+
+		self.buffer = np.zeros((chunk, len(self.columns)), dtype = DTYPE)
+
+	def append(self, *parts):
+		""" Appends one row, made of the scalars and arrays in 'parts', flattened in order.
+		"""
+		row = self.buffer[self.nrows]
+		k = 0
+		for part in parts:
+			if np.ndim(part) == 0:
+				row[k] = part
+				k += 1
+			else:
+				part = np.ravel(part)
+				row[k:k + len(part)] = part
+				k += len(part)
+		self.nrows += 1
+		if self.nrows == len(self.buffer):
+			self.flush()
+
+	def write_rows(self, rows):
+		""" Appends a 2D array of rows, as one chunk.
+		"""
+		self.flush()
+		self._write_chunk(np.asarray(rows, dtype = DTYPE))
+
+	def flush(self):
+		if self.nrows:
+			self._write_chunk(self.buffer[:self.nrows])
+			self.nrows = 0
+		self.file.flush()
+
+	def tell(self):
+		""" Size of the log on disk after flushing, i.e. the offset a later append continues from.
+		"""
+		self.flush()
+		return self.file.tell()
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+	def _write_chunk(self, rows):
+		payload = np.ascontiguousarray(rows.T).tobytes()
+		if self.compress:
+			payload = zlib.compress(payload)
+		self.file.write(struct.pack('<II', len(rows), len(payload)) + payload)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+class AsyncLogSink:
+	""" Background writer in front of a LogWriter.
+	'append' copies a raw snapshot (scalars and arrays, flattened into 'width' values) into a preallocated ring
+	of 'slots' rows, and returns at once; it only waits if the ring is full. A background thread takes
+	the snapshots in batches of up to 'batch' rows, turns them into log rows with 'derive' (a vectorized
+	function of a (rows, width) array, e.g. computing the total energy), and writes them as one chunk.
+	"""
+
+	def __init__(self, writer, width, derive, slots = 8192, batch = 1024):
+		self.writer = writer
+		self.derive = derive
+		self.ring = np.zeros((slots, width), dtype = DTYPE)
+		self.batch = batch
+		self.head = 0								# Number of snapshots appended
+		self.tail = 0								# Number of snapshots written
+		self.closing = False
+		self.flushing = False
+		self.error = None
+		self.cond = threading.Condition()
+		self.thread = threading.Thread(target = self._run, daemon = True)
+		self.thread.start()
+
+	def append(self, *parts):
+		""" Copies one raw snapshot, made of the scalars and arrays in 'parts', into the ring.
+		"""
+		slots = len(self.ring)
+		if self.head - self.tail >= slots:
+			with self.cond:
+				while self.head - self.tail >= slots and self.error is None:
+					self.cond.wait()
+
+		row = self.ring[self.head % slots]
+		k = 0
+		for part in parts:
+			if np.ndim(part) == 0:
+				row[k] = part
+				k += 1
+			else:
+				part = np.ravel(part)
+				row[k:k + len(part)] = part
+				k += len(part)
+
+		with self.cond:
+			self.head += 1
+			if self.head - self.tail >= self.batch:
+				self.cond.notify_all()
+
+	def _run(self):
+		slots = len(self.ring)
+		while True:
+			with self.cond:
+				while self.head - self.tail < (1 if self.flushing or self.closing else self.batch):
+					if self.closing:
+						break
+					self.cond.wait()
+				start, stop = self.tail, self.head
+			if start == stop:
+				break										# Closing, and everything is written
+
+			try:
+				# The ring is read in place: its slots are not reused until 'tail' moves past them.
+				first, last = start % slots, (stop - 1) % slots + 1
+				segments = [(first, last)] if first < last else [(first, slots), (0, last)]
+				for a, b in segments:
+					self.writer.write_rows(self.derive(self.ring[a:b]))
+			except Exception as exc:
+				self.error = exc
+
+			with self.cond:
+				self.tail = stop
+				self.cond.notify_all()
+			if self.error is not None:
+				break
+
+	def flush(self):
+		""" Waits until every appended snapshot is written.
+		"""
+		with self.cond:
+			self.flushing = True
+			self.cond.notify_all()
+			while self.tail < self.head and self.error is None:
+				self.cond.wait()
+			self.flushing = False
+		self.writer.flush()
+
+	def tell(self):
+		""" Size of the log on disk after every appended snapshot is written.
+		"""
+		self.flush()
+		return self.writer.tell()
+
+	def close(self):
+		with self.cond:
+			self.closing = True
+			self.cond.notify_all()
+		self.thread.join()
+		self.writer.close()
+		if self.error is not None:
+			raise self.error
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def read_header(path):
+	""" Returns the header dictionary of a binary log, and the offset of its first chunk.
+	"""
+	with open(path, 'rb') as file:
+		if file.read(len(MAGIC)) != MAGIC:
+			raise ValueError(path + ' is not a binary log.')
+		hlen, = struct.unpack('<I', file.read(4))
+		header = json.loads(file.read(hlen).decode('utf-8'))
+	return header, len(MAGIC) + 4 + hlen
+
+
+def read_columns(path):
+	""" Reads a binary log. Returns its header, and its data as a (columns, rows) float64 array.
+	"""
+	header, offset = read_header(path)
+	ncols = len(header['columns'])
+	chunks = []
+
+	with open(path, 'rb') as file:
+		file.seek(offset)
+		while True:
+			head = file.read(8)
+			if len(head) < 8:
+				break
+			nrows, nbytes = struct.unpack('<II', head)
+			payload = file.read(nbytes)
+			if len(payload) < nbytes:
+				break												# Truncated last chunk
+			if header['compression'] == 'zlib':
+				payload = zlib.decompress(payload)
+			chunks.append(np.frombuffer(payload, dtype = DTYPE).reshape(ncols, nrows))
+
+	data = np.concatenate(chunks, axis = 1) if chunks else np.zeros((ncols, 0))
+	return header, data
+
+
+def is_binary_log(path):
+	with open(path, 'rb') as file:
+		return file.read(len(MAGIC)) == MAGIC
+
+
+def read_log(path):
+	""" Reads a log into a pandas dataframe with one column per logged quantity,
+	and returns it with the header of the log.
+	Old whitespace delimited text logs are read as well, with an empty header.
+	"""
+	if not is_binary_log(path):
+		return pd.read_csv(path, sep = r'\s+', float_precision = 'high'), {}
+
+	header, data = read_columns(path)
+	dataframe = pd.DataFrame(dict(zip(header['columns'], data)))
+	return dataframe, header
+
+
+def log_name(path):
+	""" Name of the run from the path of its log, e.g. './logs/output_RK4_8.clog' -> 'RK4_8',
+	and './logs/RKDP_ERRS_5.clog' -> 'ERRS_5'.
+	"""
+	base = os.path.basename(path)
+	base = re.sub(r'\.(clog|csv)$', '', base)
+	return re.sub(r'^(output_|RKDP_)', '', base)
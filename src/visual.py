@@ -10,8 +10,10 @@ from numpy.linalg import norm
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 
-path = '.' + sep + 'logs' + sep + 'output_RKDP_'+str(w_err_range.result[0])+'.csv'
-df_RK = pd.read_csv(path, delim_whitespace = True, float_precision = 'high')
+from trajlog import read_log, LOG_EXT
+
+path = '.' + sep + 'logs' + sep + 'output_RKDP_'+str(w_err_range.result[0])+LOG_EXT
+df_RK, header = read_log(path)
 
 fig1, ax1 = plt.subplots(1,1)
 ax1.set_xlim((-8,8))
@@ -0,0 +1,43 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INIT_FILE = os.path.join(ROOT, 'addendum', 'start_pos.csv')
+
+# The modules are flat in src/, and are imported by their names (as the notebook does):
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+
+@pytest.fixture
+def cluster():
+	""" Masses [kg] and positions [AU] of 600 random bodies, a few much heavier than the rest.
+	"""
+	rng = np.random.default_rng(7)
+	mass = rng.uniform(1.0E+20, 1.0E+24, 600)
+	mass[:5] = 1.0E+28
+	pos = rng.normal(0.0, 10.0, (600, 3))
+	return mass, pos
+
+
+@pytest.fixture
+def solar_system():
+	""" The Sun, the giant planets and 67P/C-G at the start of the integrations, as a fresh System.
+	"""
+	import functions
+	return functions.SolarSystem_init(INIT_FILE, False, True)
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+	""" A working folder of a sweep, with the initial conditions of the repository.
+	"""
+	import sweep
+	shutil.copytree(os.path.join(ROOT, 'addendum'), tmp_path / 'addendum')
+	os.makedirs(tmp_path / 'logs')
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setattr(sweep, 'BACKGROUND_LOGS', False)
+	return tmp_path / 'logs'
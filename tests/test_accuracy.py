@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from accuracy import EphemerisReference, LogReference, cheapest, pareto, position_errors
+from ephemeris import EphemerisStore, JD_START, kepler_fetcher
+from trajlog import LogWriter
+
+
+def table():
+	""" Error norms and CPU times of made-up runs, of two bodies.
+	"""
+	runs = [('E_10', 0.1, 5.0), ('E_5', 0.2, 2.0), ('V_10', 0.1, 1.0), ('RK4_10', 0.8, 1.0E-3),
+		('RKDP_6', 0.5, 1.0E-4), ('RKDP_8', 2.0, 1.0E-6), ('LF_10', 0.3, 1.0E-2), ('H_10', 1.0, np.nan)]
+	rows = []
+	for name, cpu, error in runs:
+		for body, scale in (('Jupiter', 1.0), ('67P/C-G', 100.0)):
+			rows.append([name, name[:name.rfind('_')], name[name.rfind('_') + 1:], body, scale * error,
+				scale * error, scale * error, cpu])
+	return pd.DataFrame(rows, columns = ['Name', 'Method', 'Step', 'Body', 'max', 'rms', 'final', 'CPU'])
+
+
+def test_pareto_front():
+	front = pareto(table(), 'Jupiter')
+	assert list(front['Name']) == ['V_10', 'LF_10', 'RKDP_6', 'RKDP_8']					# E_5 and RK4_10 are beaten
+	assert np.all(np.diff(front['CPU']) > 0) and np.all(np.diff(front['max']) < 0)
+
+
+def test_pareto_front_ties_keep_the_more_accurate_run():
+	front = pareto(table(), '67P/C-G')
+	assert 'V_10' in set(front['Name']) and 'E_10' not in set(front['Name'])		# Same CPU, less accurate
+
+
+def test_cheapest():
+	assert cheapest(table(), 'Jupiter', 1.0E-3)['Name'] == 'RKDP_6'
+	assert cheapest(table(), 'Jupiter', 1.0E-5)['Name'] == 'RKDP_8'
+	assert cheapest(table(), 'Jupiter', 1.0E-2)['Name'] == 'LF_10'
+	assert cheapest(table(), 'Jupiter', 1.0E-9) is None
+
+
+def write_positions(path, T, pos):
+	""" A log of the 'pos' (len(T), 2, 3) of Jupiter and 67P/C-G at the times 'T'.
+	"""
+	names = ['Jupiter', '67P/C-G']
+	columns = ['Step', 'T', 'Etot'] + [name + axis for name in names for axis in 'XYZ']
+	with LogWriter(path, columns, {'bodies': names}) as log:
+		log.write_rows(np.column_stack((np.arange(len(T)), T, np.zeros(len(T)), pos.reshape(len(T), 6))))
+
+
+def orbit(T):
+	angle = 2.0 * np.pi * np.asarray(T)[:, np.newaxis] / np.array([4333.0, 2353.0])
+	return np.stack((np.cos(angle), np.sin(angle), np.zeros_like(angle)), axis = 2) * np.array([5.2, 3.5])[:, np.newaxis]
+
+
+def test_log_reference_compares_at_shared_epochs(tmp_path):
+	T = np.arange(0.0, 2001.0, 10.0)
+	write_positions(str(tmp_path / 'output_RKDP_12.clog'), T, orbit(T))
+	reference = LogReference(str(tmp_path / 'output_RKDP_12.clog'))
+	
+	T_run = np.arange(0.0, 2001.0, 100.0)
+	offset = np.array([[3.0E-6, 0.0, 0.0], [0.0, 4.0E-5, 0.0]])
+	write_positions(str(tmp_path / 'output_V_10.clog'), T_run, orbit(T_run) + offset)
+	_, names, errors = position_errors(str(tmp_path / 'output_V_10.clog'), reference)
+	assert names == ['Jupiter', '67P/C-G']
+	assert np.allclose(errors, [3.0E-6, 4.0E-5], rtol = 1.0E-6, atol = 0.0)		# Only the errors of the run
+	
+	T_run = np.arange(0.0, 2001.0, 15.0)
+	write_positions(str(tmp_path / 'output_V_15.clog'), T_run, orbit(T_run))
+	with pytest.warns(UserWarning, match = '67 of the 134 epochs'):
+		_, _, errors = position_errors(str(tmp_path / 'output_V_15.clog'), reference)
+	assert np.array_equal(np.isfinite(errors[:, 0]), T_run % 30.0 == 0.0)
+	assert np.all(errors[np.isfinite(errors)] == 0.0)
+
+
+def test_ephemeris_reference_is_offline_by_default(tmp_path):
+	store = EphemerisStore(str(tmp_path) + os.sep, kepler_fetcher({'599': (5.2, 0.048, JD_START, 0.3),
+		'900681': (3.46, 0.64, JD_START, 1.2)}))
+	store.states('599', JD_START + np.array([0.0, 500.0]))
+	calls = store.fetch.calls
+	T = np.arange(0.0, 1001.0, 100.0)
+	pos = EphemerisReference(store).positions(T, ['Jupiter', '67P/C-G'])
+	assert store.fetch.calls == calls
+	assert np.array_equal(np.isfinite(pos[:, 0, 0]), T <= 500.0)				# The stored days only
+	assert np.all(np.isnan(pos[:, 1]))
+	
+	EphemerisReference(store, fetch = True).positions(T, ['Jupiter', '67P/C-G'])
+	assert store.fetch.calls == calls + 2
+
+
+def test_failed_fetch_is_not_retried(tmp_path):
+	def offline(body, start, stop, step):
+		offline.calls += 1
+		raise ConnectionError('offline')
+	offline.calls = 0
+	reference = EphemerisReference(EphemerisStore(str(tmp_path) + os.sep, offline), fetch = True)
+	for _ in range(3):
+		assert np.all(np.isnan(reference.positions(np.arange(0.0, 100.0, 10.0), ['Jupiter', '67P/C-G'])))
+	assert offline.calls == 2
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import analytics
+from trajlog import LogWriter
+
+
+def write_log(path, T, Etot, mode = 'w'):
+	with LogWriter(path, ['Step', 'T', 'Etot'], mode = mode) as log:
+		log.write_rows(np.column_stack((np.arange(len(T)), T, Etot)))
+
+
+def per_row(T, Etot):
+	""" The energy change, change per step and drift, computed row by row as bokehCPU did before.
+	"""
+	percTot = [-((Etot[j] - Etot[0]) / Etot[0]) for j in range(len(Etot))]
+	Ediff = [-1 * ((Etot[j] - Etot[j-1]) / Etot[j-1]) * 100 for j in range(1, len(Etot))] + [np.nan]
+	slope = abs(np.polyfit(T, percTot, 1)[0])							# The slope of scipy.stats.linregress
+	return np.array(percTot), np.array(Ediff), slope
+
+
+@pytest.fixture
+def energy():
+	rng = np.random.default_rng(5)
+	T = np.arange(0.0, 5000.0, 10.0)
+	return T, -2.0E+35 * (1.0 + 3.0E-9 * T / 5000.0 + 1.0E-10 * rng.normal(size = len(T)))
+
+
+def test_matches_the_per_row_computation(tmp_path, energy):
+	T, Etot = energy
+	path = str(tmp_path / 'output_LF_10.clog')
+	write_log(path, T, Etot)
+	results = analytics.energy_analytics(path, str(tmp_path / 'cache') + os.sep)
+	percTot, Ediff, slope = per_row(T, Etot)
+	assert np.array_equal(results['T'], T)
+	assert np.allclose(results['percTot'], percTot, rtol = 1.0E-12, atol = 0.0)
+	assert np.allclose(results['Ediff'], Ediff, rtol = 1.0E-12, atol = 0.0, equal_nan = True)
+	assert results['slope'] == pytest.approx(slope, rel = 1.0E-9)
+
+
+def test_cache_is_keyed_by_path_size_and_mtime(tmp_path, monkeypatch, energy):
+	T, Etot = energy
+	cache = str(tmp_path / 'cache') + os.sep
+	path = str(tmp_path / 'output_LF_10.clog')
+	write_log(path, T[:300], Etot[:300])
+	first = analytics.energy_analytics(path, cache)
+	
+	reads = []
+	read_log = analytics.read_log
+	def counted(path):
+		reads.append(path)
+		return read_log(path)
+	monkeypatch.setattr(analytics, 'read_log', counted)
+	
+	assert np.array_equal(analytics.energy_analytics(path, cache)['percTot'], first['percTot'])
+	assert reads == []															# Unchanged: from the cache
+	
+	copy = str(tmp_path / 'output_LF_20.clog')
+	shutil.copy2(path, copy)
+	analytics.energy_analytics(copy, cache)
+	assert reads == [copy]														# Another path
+	
+	write_log(path, T[300:], Etot[300:], mode = 'a')
+	assert len(analytics.energy_analytics(path, cache)['T']) == len(T)			# Appended to: another size
+	assert reads == [copy, path]
+	
+	status = os.stat(path)
+	write_log(path, T[:300], Etot[::-1][:300])									# Rewritten with the same size
+	write_log(path, T[300:], Etot[::-1][300:], mode = 'a')
+	os.utime(path, ns = (status.st_atime_ns, status.st_mtime_ns + 1000000))
+	assert os.stat(path).st_size == status.st_size
+	rewritten = analytics.energy_analytics(path, cache)
+	assert reads == [copy, path, path]
+	assert np.allclose(rewritten['percTot'], per_row(T, Etot[::-1])[0], rtol = 1.0E-12, atol = 0.0)
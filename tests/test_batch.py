@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+import sweep
+from trajlog import read_log, LOG_EXT
+
+
+@pytest.mark.parametrize('meth', ['Euler', 'Verlet', 'RK4', 'Leapfrog', 'Yoshida4'])
+def test_batch_is_bitwise_the_single_runs(logs, meth):
+	dTs = [5, 10, 20]
+	read = lambda dT: read_log(str(logs / ('output_' + sweep.TAGS[meth] + '_' + str(dT) + LOG_EXT)))[0].to_numpy()
+
+	sweep.run_batch(meth, dTs, 1000, False, True)
+	batched = {dT: read(dT) for dT in dTs}
+	for dT in dTs:
+		sweep.RUNNERS[meth](dT, 1000, False, True)
+		assert np.array_equal(read(dT), batched[dT], equal_nan = True)
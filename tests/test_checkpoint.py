@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pytest
+
+import checkpoint
+import sweep
+from trajlog import read_log, LOG_EXT
+
+
+def test_round_trip(tmp_path):
+	path = str(tmp_path / 'checkpoint.npz')
+	state = np.random.default_rng(1).normal(size = (12, 3))
+	ckpt = checkpoint.Checkpointer(path, None, settings = 'abc', key = 'def')
+	ckpt.save(state, 120.0, 12, 0.5, [], h = 3.25)
+	saved = ckpt.load(120.0)
+	assert np.array_equal(saved['state'], state)
+	assert saved['T'].item() == 120.0 and saved['step'].item() == 12 and saved['h'].item() == 3.25
+	assert str(saved['key']) == 'def'
+	assert not os.path.exists(path + '.tmp')
+
+
+def test_refuses_other_runs(tmp_path):
+	path = str(tmp_path / 'checkpoint.npz')
+	checkpoint.Checkpointer(path, None, settings = 'abc').save(np.zeros((4, 3)), 120.0, 12, 0.5, [])
+	with pytest.warns(UserWarning, match = 'other settings'):
+		assert checkpoint.Checkpointer(path, None, settings = 'xyz').load(200.0) is None
+	with pytest.warns(UserWarning, match = 'past the end'):
+		assert checkpoint.Checkpointer(path, None, settings = 'abc').load(100.0) is None
+
+
+@pytest.mark.parametrize('meth', ['Leapfrog', 'Hermite'])
+def test_extended_run_is_bitwise_the_long_run(logs, meth):
+	name = sweep.TAGS[meth] + '_10'
+	read = lambda: read_log(str(logs / ('output_' + name + LOG_EXT)))[0].to_numpy()
+
+	sweep.RUNNERS[meth](10, 2000, False, True)
+	full = read()
+	sweep.RUNNERS[meth](10, 1000, False, True)
+	sweep.RUNNERS[meth](10, 2000, False, True, True)						# Resumed from the end of the short run
+	assert np.array_equal(read(), full, equal_nan = True)
+	saved = checkpoint.load(str(logs / ('checkpoint_' + name + '.npz')))
+	assert str(saved['key']) == sweep.run_key(meth, 10, 2000, False, True)
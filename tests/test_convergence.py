@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import functions as fu
+
+
+def integrate(planets, state, stepper, dt, T = 2000.0):
+	np.copyto(planets.state, state)
+	fu.Acceleration(len(planets), planets)
+	for _ in range(int(round(T / dt))):
+		stepper(len(planets), planets, dt)
+	return planets.pos.copy()
+
+
+@pytest.mark.parametrize('meth, order, dts', [
+	('Leapfrog', 2, [20.0, 10.0, 5.0]),
+	('Yoshida4', 4, [40.0, 20.0, 10.0]),
+	('Yoshida6', 6, [80.0, 40.0, 20.0])])
+def test_halving_the_timestep(solar_system, meth, order, dts):
+	state = solar_system.state.copy()
+	reference = integrate(solar_system, state, fu.Yoshida6, 0.5)
+	errors = np.array([np.abs(integrate(solar_system, state, fu.SYMPLECTIC[meth], dt) - reference).max() for dt in dts])
+	ratios = errors[:-1] / errors[1:]
+	assert np.all(np.abs(np.log2(ratios) - order) < 0.3)			# 4, 16 and 64 within a factor of 2**0.3
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from decimate import lttb, minmax, pyramid
+
+
+@pytest.fixture
+def orbit():
+	t = np.linspace(0.0, 200.0 * np.pi, 300001)
+	return np.cos(t), np.sin(t) * (1.0 + 0.1 * np.sin(0.01 * t))
+
+
+def test_minmax_keeps_the_spike():
+	y = np.zeros(100001)
+	y[54321] = 1.0
+	rows = minmax(y, 100)
+	assert len(rows) <= 100
+	assert 54321 in rows and rows[0] == 0 and rows[-1] == len(y) - 1
+
+
+@pytest.mark.parametrize('budget', [10**4, 10**5, 10**6])
+def test_pyramid_stays_within_its_budget(orbit, budget):
+	x, y = orbit
+	levels = pyramid(lambda size: lttb(x, y, size), len(x), 1000, budget = budget)
+	sizes = [len(rows) for rows in levels]
+	assert sum(sizes) <= budget
+	assert sizes == sorted(sizes)
+	if budget >= len(x) + sum(sizes[:-1]):
+		assert np.array_equal(levels[-1], np.arange(len(x)))			# Shipped in full
+	else:
+		assert budget - sum(sizes) <= sizes[-1]							# No finer level fits in the rest
+
+
+def test_pyramid_keeps_one_level_below_its_budget(orbit):
+	x, y = orbit
+	levels = pyramid(lambda size: lttb(x, y, size), len(x), 1000, budget = 10)
+	assert len(levels) == 1 and len(levels[0]) <= 1000
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import functions as fu
+from encounters import Hybrid, kepler_drift
+from forces import G
+
+M_SUN, M_JUPITER, M_COMET = 1.989E+30, 1.898E+27, 1.0E+13
+
+
+def three_body(state):
+	""" The Sun, Jupiter and a comet with the (6, 3) 'state' [positions; velocities].
+	"""
+	bodies = [fu.Planet('Sun', M_SUN), fu.Planet('Jupiter', M_JUPITER), fu.Planet('Comet', M_COMET)]
+	for body, pos, vel in zip(bodies, state[:3], state[3:]):
+		body.pos_init, body.vel_init = pos.copy(), vel.copy()
+		body.pos, body.vel = pos, vel
+	return fu.System(bodies)
+
+
+def integrate(stepper, state, dt, T):
+	pl = three_body(state)
+	fu.Acceleration(3, pl)
+	for _ in range(int(round(abs(T / dt)))):
+		stepper(3, pl, dt)
+	return pl.state.copy()
+
+
+@pytest.fixture(scope = 'module')
+def encounter():
+	""" A comet passing 0.05 AU (a seventh of the Hill radius) from Jupiter: its state 200 days before
+	the closest approach, and the reference state 200 days after it (Yoshida6 with a 0.25 day timestep).
+	"""
+	a = 5.2
+	v = np.sqrt(G * (M_SUN + M_JUPITER) / a)
+	closest = np.array([[0.0, 0.0, 0.0], [a, 0.0, 0.0], [a + 0.05, 0.0, 0.0],
+		[0.0, 0.0, 0.0], [0.0, v, 0.0], [0.004, 0.75 * v, 0.002]])
+	closest[3] = -(M_JUPITER * closest[4] + M_COMET * closest[5]) / M_SUN		# At rest in the barycentre
+	start = integrate(fu.Yoshida6, closest, -0.25, 200.0)
+	return start, integrate(fu.Yoshida6, start, 0.25, 400.0)
+
+
+@pytest.mark.parametrize('dt', [5.0, 10.0])
+def test_hybrid_beats_leapfrog_through_an_encounter(encounter, dt):
+	start, reference = encounter
+	error = {}
+	for name, stepper in (('Leapfrog', fu.Leapfrog), ('Hybrid', Hybrid)):
+		error[name] = np.linalg.norm(integrate(stepper, start, dt, 400.0)[2] - reference[2])
+	assert error['Hybrid'] < 1.0E-3 < error['Leapfrog']
+	assert error['Hybrid'] < 0.01 * error['Leapfrog']
+
+
+def test_kepler_drift_returns_after_a_period():
+	mu = G * M_SUN
+	pos = np.array([[1.0, 0.0, 0.0], [0.3, 0.2, -0.1]])
+	vel = np.array([[0.0, 0.012, 0.003], [-0.01, 0.02, 0.004]])
+	a = 1.0 / (2.0 / np.linalg.norm(pos, axis = 1) - np.einsum('ik,ik->i', vel, vel) / mu)
+	for i in range(2):
+		p, v = pos[i:i + 1].copy(), vel[i:i + 1].copy()
+		kepler_drift(p, v, mu, 2.0 * np.pi * np.sqrt(a[i]**3 / mu))
+		assert np.allclose(p, pos[i:i + 1], rtol = 0.0, atol = 1.0E-10)
+		assert np.allclose(v, vel[i:i + 1], rtol = 0.0, atol = 1.0E-12)
+
+
+def test_kepler_drift_hyperbolic_conserves_energy():
+	mu = G * M_SUN
+	pos, vel = np.array([[1.0, 0.5, 0.0]]), np.array([[0.0, 0.05, 0.01]])
+	energy = lambda p, v: 0.5 * np.sum(v**2) - mu / np.linalg.norm(p)
+	e0 = energy(pos, vel)
+	assert e0 > 0.0
+	kepler_drift(pos, vel, mu, 500.0)
+	assert energy(pos, vel) == pytest.approx(e0, rel = 1.0E-10)
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+from ephemeris import EphemerisStore, JD_START, kepler_fetcher
+
+ELEMENTS = {'599': (5.2, 0.048, JD_START + 1000.0, 0.3), '900681': (3.46, 0.64, JD_START + 200.0, 1.2)}		# Jupiter, 67P/C-G
+
+
+@pytest.fixture
+def store(tmp_path):
+	return EphemerisStore(str(tmp_path) + os.sep, kepler_fetcher(ELEMENTS))
+
+
+def test_fetches_once_and_serves_from_the_store(store, tmp_path):
+	epochs = JD_START + np.linspace(0.0, 365.0, 50)
+	first = store.states('599', epochs)
+	assert store.fetch.calls == 1
+	assert np.array_equal(store.states('599', epochs[10:20]), first[10:20])
+	assert store.fetch.calls == 1
+
+	reopened = EphemerisStore(str(tmp_path) + os.sep, kepler_fetcher(ELEMENTS))		# Read from the disk
+	assert np.array_equal(reopened.states('599', epochs), first)
+	assert reopened.fetch.calls == 0
+
+
+def test_extends_the_stored_span(store):
+	store.states('599', JD_START + np.array([100.0, 200.0]))
+	store.states('599', JD_START + np.array([150.0, 400.0]))						# Only later days are missing
+	assert store.fetch.calls == 2
+	jd, _ = store.table('599')
+	assert np.all(np.diff(jd) == store.step)
+	assert jd[0] <= JD_START + 100.0 and jd[-1] >= JD_START + 400.0
+
+
+@pytest.mark.parametrize('body', sorted(ELEMENTS))
+def test_hermite_interpolation_between_the_grid(store, body):
+	epochs = JD_START + 180.5 + np.arange(40.0)											# Midway between the stored days
+	exact = kepler_fetcher(ELEMENTS)(body, epochs[0], epochs[-1], 1.0)
+	states = store.states(body, epochs)
+	assert np.allclose(states[:, :3], exact[['x', 'y', 'z']].values, rtol = 0.0, atol = 1.0E-9)
+	assert np.allclose(states[:, 3:], exact[['vx', 'vy', 'vz']].values, rtol = 0.0, atol = 1.0E-9)
+
+
+def test_dataframe_without_fetching(store):
+	assert len(store.dataframe('599', JD_START + np.arange(10.0), fetch = False)) == 0
+	store.states('599', JD_START + np.array([0.0, 10.0]))
+	frame = store.dataframe('599', JD_START + np.arange(-5.0, 20.0), fetch = False)
+	assert frame['datetime_jd'].min() >= JD_START - 1.0 and frame['datetime_jd'].max() <= JD_START + 11.0
+	assert store.fetch.calls == 1
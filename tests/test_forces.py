@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import forces
+from forces import G, acceleration
+
+
+def pairwise(mass, pos, n_massive = None):
+	""" Acceleration and potential energy of the bodies by a loop over the pairs, as the original Acceleration did:
+	only the first 'n_massive' bodies attract, and count in the potential.
+	"""
+	n = len(pos)
+	nm = n if n_massive is None else n_massive
+	acc = np.zeros((n, 3))
+	U = 0.0
+	for i in range(n):
+		for j in range(nm):
+			if i != j:
+				d = pos[j] - pos[i]
+				acc[i] += G * mass[j] * d / np.linalg.norm(d)**3
+				if i < j < nm:
+					U += G * mass[i] * mass[j] / np.linalg.norm(d)
+	return acc, U
+
+
+@pytest.fixture
+def bodies():
+	rng = np.random.default_rng(3)
+	return rng.uniform(1.0E+22, 1.0E+30, 60), rng.normal(0.0, 5.0, (60, 3))
+
+
+def test_matches_the_pairwise_loop(bodies):
+	mass, pos = bodies
+	acc, U = acceleration(mass, pos, potential = True)
+	ref, U_ref = pairwise(mass, pos)
+	assert np.allclose(acc, ref, rtol = 1.0E-12, atol = 0.0)
+	assert U == pytest.approx(U_ref, rel = 1.0E-12)
+
+
+def test_rows_in_chunks_match_the_pairwise_loop(bodies, monkeypatch):
+	mass, pos = bodies
+	monkeypatch.setattr(forces, 'PAIR_CHUNK', 1000)				# 8 rows of the batch of 2 per chunk, the last one shorter
+	batch = np.stack((pos, pos[::-1]))
+	acc, U = acceleration(mass, batch, potential = True)
+	for b in range(2):
+		ref, U_ref = pairwise(mass, batch[b])
+		assert np.allclose(acc[b], ref, rtol = 1.0E-12, atol = 0.0)
+		assert U[b] == pytest.approx(U_ref, rel = 1.0E-12)
+
+
+def test_test_particles_match_the_pairwise_loop(bodies, monkeypatch):
+	mass, pos = bodies
+	monkeypatch.setattr(forces, 'TEST_CHUNK', 7)
+	acc, U = acceleration(mass, pos, potential = True, n_massive = 15)
+	ref, U_ref = pairwise(mass, pos, 15)
+	assert np.allclose(acc, ref, rtol = 1.0E-12, atol = 0.0)
+	assert U == pytest.approx(U_ref, rel = 1.0E-12)
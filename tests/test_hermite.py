@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pytest
+
+import functions as fu
+import sweep
+from hermite import Hermite
+from trajlog import read_columns
+
+
+@pytest.fixture
+def run(tmp_path, solar_system):
+	""" A 2000 day Hermite run with 10 day block timesteps at most: its initial and final states, its log and its evaluations.
+	"""
+	state = solar_system.state.copy()
+	path = str(tmp_path / 'output_H_10.clog')
+	_, evals = Hermite(2000.0, solar_system, 10.0, path, 100.0)
+	return state, solar_system, read_columns(path)[1], evals
+
+
+def test_accuracy(run):
+	state, planets, _, _ = run
+	end = planets.pos.copy()
+	np.copyto(planets.state, state)
+	fu.Acceleration(len(planets), planets)
+	for _ in range(4000):
+		fu.Yoshida6(len(planets), planets, 0.5)
+	assert np.abs(end - planets.pos).max() < 1.0E-4					# 67P/C-G, the fastest body
+	assert np.abs(end - planets.pos)[:5].max() < 1.0E-6
+
+
+def test_energy_drift(run):
+	_, _, data, _ = run
+	assert np.array_equal(data[1], np.arange(0.0, 2001.0, 100.0))
+	assert np.abs(data[2] / data[2][0] - 1.0).max() < 1.0E-8
+
+
+def test_evaluations_are_recorded(run, logs):
+	_, planets, _, evals = run
+	sweep.run_hermite(10, 2000, False, True)
+	with open(logs / 'H_STATS_10.json') as stats_file:
+		assert json.load(stats_file) == {'evaluations': evals, 'bodies': len(planets)}
+	assert 'H_STATS_10.json' in sweep.run_files('fix H H_10 10 1.0')
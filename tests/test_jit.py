@@ -0,0 +1,44 @@
+""" The compiled kernels agree with the NumPy ones within round-off. Without Numba the same loops run as plain Python.
+"""
+import numpy as np
+import pytest
+
+import forces
+import jit
+from functions import stage_state
+
+
+@pytest.fixture
+def bodies():
+	rng = np.random.default_rng(3)
+	mass = rng.uniform(1.0E+20, 1.0E+28, 24)
+	pos = rng.normal(0.0, 5.0, (24, 3))
+	return mass, pos
+
+
+def test_acceleration(bodies):
+	mass, pos = bodies
+	acc, U = forces.acceleration(mass, pos, potential = True)
+	jit_acc, jit_U = jit.acceleration(mass, pos, potential = True)
+	np.testing.assert_allclose(jit_acc, acc, rtol = 1e-12, atol = 1e-12 * np.abs(acc).max())
+	assert jit_U == pytest.approx(U, rel = 1e-12)
+
+
+def test_test_particles_and_batches(bodies):
+	mass, pos = bodies
+	batch = np.stack((pos, 0.5 * pos))
+	acc = forces.acceleration(mass, batch, n_massive = 16)
+	np.testing.assert_allclose(jit.acceleration(mass, batch, n_massive = 16), acc, rtol = 1e-12, atol = 1e-12 * np.abs(acc).max())
+
+
+def test_potential(bodies):
+	mass, pos = bodies
+	assert jit.potential(mass, pos) == pytest.approx(forces.potential(mass, pos), rel = 1e-12)
+	assert jit.potential(mass, pos, 10) == pytest.approx(forces.potential(mass[:10], pos[:10]), rel = 1e-12)
+
+
+def test_stage_state():
+	rng = np.random.default_rng(4)
+	u, K, coeffs = rng.normal(size = (8, 3)), rng.normal(size = (5, 8, 3)), rng.normal(size = 5)
+	out, jit_out = np.empty((8, 3)), np.empty((8, 3))
+	np.testing.assert_allclose(jit.stage_state(u, 0.3, coeffs, K, jit_out), stage_state(u, 0.3, coeffs, K, out), rtol = 1e-13, atol = 1e-14)
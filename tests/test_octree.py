@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import forces
+import octree
+
+
+def relative_errors(acc, reference):
+	return np.linalg.norm(acc - reference, axis = 1) / np.linalg.norm(reference, axis = 1)
+
+
+def test_theta_zero_is_the_direct_sum(cluster):
+	mass, pos = cluster
+	acc, U = forces.acceleration(mass, pos, potential = True)
+	tree_acc, tree_U = octree.acceleration(mass, pos, potential = True, theta = 0.0)
+	assert relative_errors(tree_acc, acc).max() < 1e-12
+	assert tree_U == pytest.approx(U, rel = 1e-12)
+
+
+def test_error_grows_with_theta(cluster):
+	mass, pos = cluster
+	acc = forces.acceleration(mass, pos)
+	errors = [np.median(relative_errors(octree.acceleration(mass, pos, theta = theta), acc)) for theta in (0.2, 0.5, 1.0)]
+	assert errors[0] < errors[1] < errors[2]
+	assert errors[1] < 1e-2
+
+
+def test_test_particles_walk_the_tree(cluster):
+	mass, pos = cluster
+	acc = forces.acceleration(mass, pos, n_massive = 400)
+	assert relative_errors(octree.acceleration(mass, pos, n_massive = 400, theta = 0.0), acc).max() < 1e-12
+
+
+def test_direct_sum_in_chunks_of_rows(cluster, monkeypatch):
+	mass, pos = cluster
+	acc, U = forces.acceleration(mass, pos, potential = True)
+	batch = np.stack((pos, 1.5 * pos))
+	batch_acc = forces.acceleration(mass, batch)
+	monkeypatch.setattr(forces, 'PAIR_CHUNK', 5000)
+	chunked, chunked_U = forces.acceleration(mass, pos, potential = True)
+	np.testing.assert_array_equal(chunked, acc)
+	assert chunked_U == pytest.approx(U, rel = 1e-13)
+	np.testing.assert_array_equal(forces.acceleration(mass, batch), batch_acc)
@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+
+from functions import StageBuffers, Acceleration, Yoshida6
+from RK_DP import Derivatives, ErrorLog, NRController, PIController, RKDP, RKQS, RungeKutta, TINY, dense_output, \
+	ERROR_MODES, HIST_EDGES
+from trajlog import read_columns
+
+
+class Counted:
+	""" 'Derivatives', counting its calls.
+	"""
+
+	def __init__(self):
+		self.calls = 0
+
+	def __call__(self, *args, **kwargs):
+		self.calls += 1
+		return Derivatives(*args, **kwargs)
+
+
+def scale(u, dudt, h):
+	return np.abs(dudt) * h + np.abs(u) + TINY
+
+
+def test_six_evaluations_per_accepted_step(solar_system):
+	u = solar_system.state
+	work = StageBuffers(len(u), 7)
+	derivs = Counted()
+	dudt = derivs(0.0, u, solar_system, out = work.dudt)
+	err_log = ErrorLog(None, solar_system, 1.0E-8, mode = 'off')
+	control = NRController()
+	T, h = 0.0, 1.0
+	for _ in range(20):
+		calls, rejected = derivs.calls, control.rejected
+		u, T, h, hdid, errmax = RKQS(u, dudt, len(u), T, h, scale(u, dudt, h), derivs, 1.0E-8, solar_system, err_log,
+			work, control)
+		assert derivs.calls - calls == 6 * (1 + control.rejected - rejected)
+		np.copyto(dudt, work.K[6])										# FSAL
+	assert control.accepted == 20 and control.rejected < 20
+	assert derivs.calls == 1 + 6 * (control.accepted + control.rejected) == control.stats()['evaluations']
+
+
+def test_rejected_trial_restarts_from_the_step_derivatives(solar_system):
+	u = solar_system.state
+	start = u.copy()
+	work = StageBuffers(len(u), 7)
+	derivs = Counted()
+	dudt = Derivatives(0.0, u, solar_system, out = work.dudt)
+	err_log = ErrorLog(None, solar_system, 1.0E-8, mode = 'off')
+	u, T, h, hdid, errmax = RKQS(u, dudt, len(u), 0.0, 400.0, scale(u, dudt, 400.0), derivs, 1.0E-8,
+		solar_system, err_log, work)
+	trials = derivs.calls // 6
+	assert trials > 1 and derivs.calls == 6 * trials						# Rejected, retried without extra evaluations
+
+	# The accepted trial is the step from the start with the derivatives there (not with the stale K7 of a rejected one):
+	fresh = StageBuffers(len(u), 7)
+	expected, _ = RKDP(start, Derivatives(0.0, start, solar_system), len(u), 0.0, hdid, Derivatives, solar_system, fresh)
+	assert np.array_equal(u, expected)
+	assert np.array_equal(work.K[6], Derivatives(T, u, solar_system))	# K7 is the derivative at the new state
+
+
+def yoshida6(planets, state, T, steps = 2000):
+	""" Reference state after 'T' days from 'state', with many Yoshida6 steps.
+	"""
+	np.copyto(planets.state, state)
+	Acceleration(len(planets), planets)
+	for _ in range(steps):
+		Yoshida6(len(planets), planets, T / steps)
+	return planets.state.copy()
+
+
+def test_interpolant_order(solar_system):
+	N = len(solar_system)
+	u0 = solar_system.state.copy()
+	errors = []
+	for h in (160.0, 80.0, 40.0):
+		work = StageBuffers(2*N, 7)
+		u = u0.copy()
+		dudt = Derivatives(0, u, solar_system, out = work.dudt)
+		u1, _ = RKDP(u, dudt, 2*N, 0, h, Derivatives, solar_system, work)
+		states = dense_output(u0, u1, work.K, h, [0.0, 0.5, 1.0])
+		assert np.array_equal(states[0], u0) and np.array_equal(states[2], u1)
+		errors.append(np.abs(states[1] - yoshida6(solar_system, u0, 0.5 * h))[:N].max())
+	ratios = np.array(errors[:-1]) / np.array(errors[1:])
+	assert np.all(ratios > 24.0)										# Local error of the fourth order interpolant, O(h^5)
+
+
+def test_output_grid(tmp_path, solar_system):
+	N = len(solar_system)
+	u0 = solar_system.state.copy()
+	t_out = np.arange(50.0, 1001.0, 50.0)
+	RungeKutta(1000.0, solar_system, 1.0, 1.0E-10, str(tmp_path / 'output.clog'), str(tmp_path / 'errors.clog'),
+		t_out = t_out, error_mode = 'off')
+	end = solar_system.pos.copy()
+	data = read_columns(str(tmp_path / 'output.clog'))[1]
+	positions = data[5:].T.reshape(-1, N, 3)
+	assert np.array_equal(data[1], np.concatenate(([0.0], t_out)))
+	assert np.array_equal(positions[0], u0[:N])						# The initial state
+	assert np.array_equal(positions[-1], end)						# The end of the last step
+	
+	reference = np.array([yoshida6(solar_system, u0, t, 400)[:N] for t in t_out[3::4]])
+	assert np.allclose(positions[4::4], reference, rtol = 0.0, atol = 1.0E-8)
+
+
+def test_pi_control_rejects_fewer_trials_through_the_encounter(tmp_path, solar_system):
+	""" 25000 days of 67P/C-G, through its close approach to Jupiter (near day 21500).
+	"""
+	planets = solar_system
+	state = planets.state.copy()
+	comet = {}
+	for control in (NRController(), PIController(), None):
+		np.copyto(planets.state, state)
+		RungeKutta(25000.0, planets, 1.0, 1.0E-8 if control else 1.0E-12, str(tmp_path / 'output.clog'),
+			str(tmp_path / 'errors.clog'), control = control, error_mode = 'off')
+		comet[control.name if control else 'reference'] = planets.pos[-1].copy()
+		if control:
+			comet[control.name + ' stats'] = control.stats()
+	error = {name: np.linalg.norm(comet[name] - comet['reference']) for name in ('NR', 'PI')}
+	assert comet['PI stats']['rejected'] < 0.5 * comet['NR stats']['rejected']
+	assert error['PI'] < 2.0 * error['NR'] < 1.0E-3
+
+
+def test_error_modes(tmp_path, solar_system):
+	planets = solar_system
+	state = planets.state.copy()
+	errors, stats = {}, {}
+	for mode in ERROR_MODES:
+		np.copyto(planets.state, state)
+		control = NRController()
+		errfile = str(tmp_path / ('errors_' + mode + '.clog'))
+		RungeKutta(5000.0, planets, 1.0, 1.0E-8, str(tmp_path / 'output.clog'), errfile, control = control,
+			error_mode = mode, error_every = 10)
+		stats[mode] = control.stats()
+		errors[mode] = read_columns(errfile) if os.path.exists(errfile) else None
+	assert all(stats[mode] == stats['all'] for mode in ERROR_MODES)
+	trials = stats['all']['accepted'] + stats['all']['rejected']
+	assert stats['all']['rejected'] > 0
+	
+	header, every = errors['all']
+	assert header['mode'] == 'all' and header['columns'][0] == 'T'
+	assert every.shape == (1 + 2*len(planets), trials)						# Every trial, the rejected ones too
+	accepted = every[:, np.append(every[0, 1:] != every[0, :-1], True)]		# A rejected trial is retried from the same T
+	assert accepted.shape[1] == stats['all']['accepted']
+	
+	header, sample = errors['sample']
+	assert header['mode'] == 'sample' and header['every'] == 10
+	assert np.array_equal(sample, accepted[:, 9::10])						# Every 10th accepted step
+	
+	header, summary = errors['summary']
+	assert header['columns'][0] == 'Stat' and header['edges'] == HIST_EDGES.tolist()
+	assert np.array_equal(summary[0], np.arange(3 + len(HIST_EDGES)))
+	assert np.array_equal(summary[1:, 0], every[1:].max(axis = 1))			# Maxima over every trial
+	assert np.allclose(summary[1:, 1], every[1:].mean(axis = 1), rtol = 1.0E-12, atol = 0.0)
+	assert np.all(summary[1:, 2:].sum(axis = 1) == trials)					# Histograms of every trial
+	
+	assert errors['off'] is None												# No file
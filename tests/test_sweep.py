@@ -0,0 +1,65 @@
+import pytest
+
+import functions
+import RK_DP
+import sweep
+
+
+def test_empty_sweep():
+	assert sweep.run_sweep([], parallel = True) == []
+	assert sweep.run_sweep([]) == []
+
+
+@pytest.mark.parametrize('runner, args, initial', [
+	('Euler', (10, 1000, False, True), 1),
+	('RK4', (10, 1000, False, True), 1),
+	('RKDP', (8, 1000, False, True, 1), 1),
+	('batch', ('Euler', [5, 10], 1000, False, True), 2),
+	('batch', ('RK4', [5, 10], 1000, False, True), 2)])
+def test_logged_energy_comes_from_the_steps(logs, monkeypatch, runner, args, initial):
+	passes = []
+	potential = functions.kernel_potential
+	def counted(kernel, mass, pos, n_massive = None):
+		passes.append(pos.shape)
+		return potential(kernel, mass, pos, n_massive)
+	monkeypatch.setattr(functions, 'kernel_potential', counted)
+	monkeypatch.setattr(RK_DP, 'kernel_potential', counted)
+	sweep.RUNNERS[runner](*args)
+	assert len(passes) == initial										# Separate passes for the initial rows only
+
+
+def sweep_plan(batched = False):
+	return sweep.plan(['Leapfrog', 'RKDP'], 500, False, True, (10, 11), (6, 6), batched)
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_second_sweep_is_served_from_the_store(logs, monkeypatch, batched):
+	rows = sweep.run_sweep(sweep_plan(batched))
+	assert len(rows) == 3
+	outputs = {path.name: path.read_bytes() for path in logs.glob('output_*')}
+	for path in logs.glob('output_*'):
+		path.unlink()
+	
+	def integrate(*args):
+		raise AssertionError('A stored run was integrated again.')
+	monkeypatch.setattr(sweep, 'init_system', integrate)
+	tasks = sweep_plan(batched)
+	assert [args[0] for _, _, args in tasks] == ['cached'] * 3
+	assert sweep.run_sweep(tasks) == rows
+	assert {path.name: path.read_bytes() for path in logs.glob('output_*')} == outputs
+
+
+@pytest.mark.parametrize('change', ['settings', 'initial', 'code'])
+def test_changes_are_run_again(logs, monkeypatch, change):
+	sweep.run_sweep(sweep_plan())
+	if change == 'settings':
+		monkeypatch.setattr(sweep, 'M', 5)
+	elif change == 'initial':
+		with open(sweep.INIT_FILE, 'a') as file:
+			file.write('\n')
+	else:
+		monkeypatch.setattr(sweep, 'code_version', lambda: 'another version')
+	tasks = sweep_plan()
+	assert [args[0] for _, _, args in tasks] == ['stored'] * 3
+	sweep.run_sweep(tasks)
+	assert [args[0] for _, _, args in sweep_plan()] == ['cached'] * 3
@@ -0,0 +1,120 @@
+import time
+
+import numpy as np
+import pytest
+
+import functions as fu
+from trajlog import LogWriter, AsyncLogSink, read_columns, read_log, log_name
+
+COLUMNS = ['Step', 'T', 'Etot', 'SunX', 'SunY', 'SunZ']
+
+
+def rows(n, seed = 0):
+	return np.random.default_rng(seed).normal(size = (n, len(COLUMNS)))
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmp_path, compress):
+	path = str(tmp_path / 'output_RK4_8.clog')
+	data = rows(25)
+	with LogWriter(path, COLUMNS, {'method': 'RK4', 'step': 8}, compress = compress, chunk = 10) as log:
+		for row in data[:12]:
+			log.append(row[0], row[1], row[2], row[3:])
+		log.write_rows(data[12:])
+	header, columns = read_columns(path)
+	assert header['columns'] == COLUMNS and header['method'] == 'RK4' and header['step'] == 8
+	assert np.array_equal(columns, data.T)
+	dataframe, _ = read_log(path)
+	assert list(dataframe.columns) == COLUMNS and np.array_equal(dataframe.to_numpy(), data)
+	assert log_name(path) == 'RK4_8'
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_append_after_reopening(tmp_path, compress):
+	path = str(tmp_path / 'log.clog')
+	data = rows(9)
+	with LogWriter(path, COLUMNS, compress = compress) as log:
+		log.write_rows(data[:4])
+	with LogWriter(path, ['ignored'], mode = 'a') as log:		# The header of the log is kept
+		assert log.columns == COLUMNS and log.compress == compress
+		for row in data[4:]:
+			log.append(row)
+	header, columns = read_columns(path)
+	assert header['columns'] == COLUMNS
+	assert np.array_equal(columns, data.T)
+
+
+def test_truncated_last_chunk_is_dropped(tmp_path):
+	path = str(tmp_path / 'log.clog')
+	data = rows(8)
+	with LogWriter(path, COLUMNS) as log:
+		log.write_rows(data[:5])
+		end = log.tell()
+		log.write_rows(data[5:])
+	with open(path, 'r+b') as file:
+		file.truncate(end + 8 + 20)							# Row count, length, and part of the payload
+	assert np.array_equal(read_columns(path)[1], data[:5].T)
+	with open(path, 'r+b') as file:
+		file.truncate(end + 3)								# Part of the chunk head
+	assert np.array_equal(read_columns(path)[1], data[:5].T)
+
+
+def test_reads_old_text_logs(tmp_path):
+	path = str(tmp_path / 'output_E_10.csv')
+	data = rows(3)
+	with open(path, 'w') as file:							# As the text logs of the earlier versions were written
+		file.write(' '.join(COLUMNS) + ' ')
+		for row in data:
+			file.write('\n' + ' '.join(repr(float(x)) for x in row) + ' ')
+	dataframe, header = read_log(path)
+	assert header == {}
+	assert list(dataframe.columns) == COLUMNS
+	assert np.allclose(dataframe.to_numpy(), data, rtol = 1.0E-15, atol = 0.0)
+	assert log_name(path) == 'E_10'
+
+
+def test_background_log_matches_the_synchronous_one(tmp_path, solar_system):
+	N = len(solar_system)
+	paths = [str(tmp_path / 'sync.clog'), str(tmp_path / 'async.clog')]
+	logs = [fu.open_log(path, solar_system, 'LF', 10, background = background)
+		for path, background in zip(paths, (False, True))]
+	fu.Acceleration(N, solar_system)
+	for step in range(1, 3001):
+		epot = step % 3 == 0										# The potential energy is passed on every third row only
+		fu.Leapfrog(N, solar_system, 10.0, potential = epot)
+		for log in logs:
+			fu.log_data(log, step, 10.0 * step, N, solar_system, solar_system.epot if epot else None)
+	for log in logs:
+		log.close()
+	sync, background = (read_columns(path)[1] for path in paths)
+	assert sync.shape == (len(COLUMNS) - 3 + 3*N, 3000)
+	assert np.array_equal(np.delete(background, 2, axis = 0), np.delete(sync, 2, axis = 0))
+	assert np.allclose(background[2], sync[2], rtol = 1.0E-14, atol = 0.0)	# Etot, derived in the background
+
+
+def test_ring_wraps_in_order_under_back_pressure(tmp_path):
+	def slow(raw):
+		time.sleep(0.002)
+		return raw.copy()
+	path = str(tmp_path / 'log.clog')
+	sink = AsyncLogSink(LogWriter(path, ['i', 'x']), 2, slow, slots = 5, batch = 3)
+	for i in range(200):
+		sink.append(i, np.float64(i) / 7.0)
+		assert sink.head - sink.tail <= 5
+	assert sink.tell() > 0 and sink.tail == 200
+	sink.close()
+	data = read_columns(path)[1]
+	assert np.array_equal(data[0], np.arange(200.0))
+	assert np.array_equal(data[1], np.arange(200.0) / 7.0)
+
+
+def test_close_joins_and_raises_the_writer_error(tmp_path):
+	def failing(raw):
+		raise ValueError('derive failed')
+	sink = AsyncLogSink(LogWriter(str(tmp_path / 'log.clog'), ['x']), 1, failing, slots = 4, batch = 2)
+	for i in range(10):												# Does not block once the writer has failed
+		sink.append(float(i))
+	with pytest.raises(ValueError, match = 'derive failed'):
+		sink.close()
+	assert not sink.thread.is_alive()
+	assert sink.writer.file.closed